@@ -1,24 +1,196 @@
 """
 Finternet API Service - Handles all interactions with Finternet payment APIs
 """
+import asyncio
 import httpx
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator, List
 from datetime import datetime
 
+from resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, OPEN
+from ttl_cache import TTLCache
+
 logger = logging.getLogger(__name__)
 
+# Per-operation read timeouts (seconds). Reads are cheap upstream, so they
+# fail fast; writes that move funds get more headroom.
+DEFAULT_TIMEOUTS: Dict[str, float] = {
+    "balance": 10.0,
+    "create_intent": 30.0,
+    "escrow": 10.0,
+    "delivery_proof": 30.0,
+    "ledger": 15.0,
+    "milestone": 30.0,
+}
+
+# Only reads are safe to replay; writes that move funds are attempted once
+IDEMPOTENT_OPERATIONS = {"balance", "escrow", "ledger"}
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (installed via httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class LedgerFetchError(Exception):
+    """Raised when a ledger page cannot be fetched mid-iteration"""
+
+
+def _is_success(result: Dict[str, Any]) -> bool:
+    return bool(result.get("success"))
+
+
 class FinternetService:
-    def __init__(self, api_key: str, base_url: str):
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+        connect_timeout: float = 5.0,
+        timeouts: Optional[Dict[str, float]] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        breaker_failure_threshold: int = 5,
+        breaker_reset_timeout: float = 30.0,
+        balance_cache_ttl: float = 2.0,
+        escrow_cache_ttl: float = 10.0,
+        escrow_cache_size: int = 1024
+    ):
         self.api_key = api_key
         self.base_url = base_url.rstrip('/')
         self.headers = {
             "X-API-Key": api_key,
             "Content-Type": "application/json"
         }
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        if http2 and not _http2_available():
+            logger.warning("[FINTERNET] HTTP/2 requested but 'h2' is not installed - falling back to HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.connect_timeout = connect_timeout
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self._client: Optional[httpx.AsyncClient] = None
+        self.retry_policy = retry_policy or RetryPolicy()
+        self._breakers = {
+            operation: CircuitBreaker(operation, breaker_failure_threshold, breaker_reset_timeout)
+            for operation in self.timeouts
+        }
+        self._call_stats = {
+            operation: {"requests": 0, "retries": 0, "failures": 0}
+            for operation in self.timeouts
+        }
+        # Short-lived balance cache; concurrent misses share one upstream call
+        self._balance_cache = TTLCache("balance", ttl=balance_cache_ttl, maxsize=1, should_cache=_is_success)
+        # Per-intent escrow cache, invalidated by our own escrow mutations
+        self._escrow_cache = TTLCache("escrow", ttl=escrow_cache_ttl, maxsize=escrow_cache_size, should_cache=_is_success)
+        self._caches = {"balance": self._balance_cache, "escrow": self._escrow_cache}
         logger.info(f"Initialized Finternet Service with base URL: {self.base_url}")
 
+    async def start(self) -> None:
+        """Open the shared connection pool (called from the app lifespan)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                limits=self.limits,
+                http2=self.http2
+            )
+            logger.info(f"[FINTERNET] HTTP client pool opened (http2={self.http2}, limits={self.limits})")
+
+    async def aclose(self) -> None:
+        """Close the shared connection pool"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("[FINTERNET] HTTP client pool closed")
+        self._client = None
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Return the pooled client, opening it lazily outside the app lifespan"""
+        if self._client is None or self._client.is_closed:
+            await self.start()
+        return self._client
+
+    def _timeout(self, operation: str) -> httpx.Timeout:
+        return httpx.Timeout(self.timeouts[operation], connect=self.connect_timeout)
+
+    async def _send(self, operation: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request through the operation's circuit breaker.
+        Idempotent reads are retried with jittered backoff on transport
+        errors and 429/5xx gateway responses; writes get a single attempt.
+        """
+        breaker = self._breakers[operation]
+        if not breaker.allow():
+            logger.warning(f"[FINTERNET] Short-circuiting '{operation}' - breaker open")
+            raise CircuitOpenError(operation, breaker.retry_in())
+
+        client = await self._get_client()
+        stats = self._call_stats[operation]
+        attempts = self.retry_policy.max_attempts if operation in IDEMPOTENT_OPERATIONS else 1
+
+        for attempt in range(1, attempts + 1):
+            stats["requests"] += 1
+            try:
+                response = await client.request(method, url, timeout=self._timeout(operation), **kwargs)
+            except httpx.TransportError as e:
+                breaker.record_failure()
+                stats["failures"] += 1
+                if attempt == attempts or breaker.state == OPEN:
+                    raise
+                reason = f"{type(e).__name__}: {e}"
+            except Exception:
+                breaker.record_failure()
+                stats["failures"] += 1
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                stats["failures"] += 1
+                if attempt == attempts or breaker.state == OPEN:
+                    return response
+                reason = f"HTTP {response.status_code}"
+
+            delay = self.retry_policy.backoff(attempt)
+            stats["retries"] += 1
+            logger.warning(f"[FINTERNET] {operation} attempt {attempt}/{attempts} failed ({reason}) - retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Breaker state and retry counters per Finternet operation"""
+        metrics = {
+            operation: {**self._call_stats[operation], "breaker": self._breakers[operation].snapshot()}
+            for operation in self.timeouts
+        }
+        for operation, cache in self._caches.items():
+            metrics[operation]["cache"] = cache.stats()
+        return metrics
+
+    def invalidate_balance(self) -> None:
+        """Forget the cached wallet balance (after anything that moves funds)"""
+        self._balance_cache.invalidate("balance")
+
+    def invalidate_escrow(self, intent_id: str) -> None:
+        """Forget cached escrow details for one payment intent"""
+        self._escrow_cache.invalidate(intent_id)
+
     async def get_account_balance(self) -> Dict[str, Any]:
+        """Wallet balance, served from the short-TTL cache when fresh"""
+        return await self._balance_cache.get_or_load("balance", self._fetch_account_balance)
+
+    async def _fetch_account_balance(self) -> Dict[str, Any]:
         """
         GET /api/v1/payment-intents/account/balance
         Returns the merchant's wallet balance
@@ -27,12 +199,11 @@ class FinternetService:
         logger.info(f"[FINTERNET] Fetching account balance from: {url}")
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=self.headers, timeout=30.0)
-                response.raise_for_status()
-                data = response.json()
-                logger.info(f"[FINTERNET] Balance retrieved successfully: {data}")
-                return {"success": True, "data": data}
+            response = await self._send("balance", "GET", url)
+            response.raise_for_status()
+            data = response.json()
+            logger.info(f"[FINTERNET] Balance retrieved successfully: {data}")
+            return {"success": True, "data": data}
         except httpx.HTTPStatusError as e:
             logger.error(f"[FINTERNET] HTTP error getting balance: {e.response.status_code} - {e.response.text}")
             return {"success": False, "error": e.response.text}
@@ -72,12 +243,14 @@ class FinternetService:
         logger.info(f"[FINTERNET] Payment Intent Payload: {payload}")
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, headers=self.headers, json=payload, timeout=30.0)
-                response.raise_for_status()
-                data = response.json()
-                logger.info(f"[FINTERNET] Payment intent created successfully: {data}")
-                return {"success": True, "data": data}
+            try:
+                response = await self._send("create_intent", "POST", url, json=payload)
+            finally:
+                self.invalidate_balance()
+            response.raise_for_status()
+            data = response.json()
+            logger.info(f"[FINTERNET] Payment intent created successfully: {data}")
+            return {"success": True, "data": data}
         except httpx.HTTPStatusError as e:
             logger.error(f"[FINTERNET] HTTP error creating payment intent: {e.response.status_code} - {e.response.text}")
             return {"success": False, "error": e.response.text}
@@ -86,6 +259,10 @@ class FinternetService:
             return {"success": False, "error": str(e)}
 
     async def get_escrow_details(self, intent_id: str) -> Dict[str, Any]:
+        """Escrow details for an intent, served from the per-intent cache when fresh"""
+        return await self._escrow_cache.get_or_load(intent_id, lambda: self._fetch_escrow_details(intent_id))
+
+    async def _fetch_escrow_details(self, intent_id: str) -> Dict[str, Any]:
         """
         GET /api/v1/payment-intents/{intentId}/escrow
         Gets escrow details for a payment intent
@@ -94,12 +271,11 @@ class FinternetService:
         logger.info(f"[FINTERNET] Fetching escrow details for intent: {intent_id}")
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=self.headers, timeout=30.0)
-                response.raise_for_status()
-                data = response.json()
-                logger.info(f"[FINTERNET] Escrow details retrieved: {data}")
-                return {"success": True, "data": data}
+            response = await self._send("escrow", "GET", url)
+            response.raise_for_status()
+            data = response.json()
+            logger.info(f"[FINTERNET] Escrow details retrieved: {data}")
+            return {"success": True, "data": data}
         except httpx.HTTPStatusError as e:
             logger.error(f"[FINTERNET] HTTP error getting escrow: {e.response.status_code} - {e.response.text}")
             return {"success": False, "error": e.response.text}
@@ -130,15 +306,20 @@ class FinternetService:
         logger.info(f"[FINTERNET] Delivery Proof Payload: {payload}")
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, headers=self.headers, json=payload, timeout=30.0)
-                response.raise_for_status()
-                data = response.json()
-                logger.info(f"[FINTERNET] Delivery proof submitted successfully: {data}")
-                return {"success": True, "data": data}
+            try:
+                response = await self._send("delivery_proof", "POST", url, json=payload)
+            finally:
+                self.invalidate_balance()
+                self.invalidate_escrow(intent_id)
+            response.raise_for_status()
+            data = response.json()
+            logger.info(f"[FINTERNET] Delivery proof submitted successfully: {data}")
+            return {"success": True, "data": data}
         except httpx.HTTPStatusError as e:
             logger.error(f"[FINTERNET] HTTP error submitting delivery proof: {e.response.status_code} - {e.response.text}")
-            return {"success": False, "error": e.response.text}
+            return {"success": False, "error": e.response.text, "status_code": e.response.status_code}
+        except CircuitOpenError as e:
+            return {"success": False, "error": str(e), "retry_in": e.retry_in}
         except Exception as e:
             logger.error(f"[FINTERNET] Error submitting delivery proof: {str(e)}")
             return {"success": False, "error": str(e)}
@@ -153,12 +334,11 @@ class FinternetService:
         logger.info(f"[FINTERNET] Fetching ledger entries (limit={limit}, offset={offset})")
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=self.headers, params=params, timeout=30.0)
-                response.raise_for_status()
-                data = response.json()
-                logger.info(f"[FINTERNET] Ledger entries retrieved: {len(data.get('entries', []))} entries")
-                return {"success": True, "data": data}
+            response = await self._send("ledger", "GET", url, params=params)
+            response.raise_for_status()
+            data = response.json()
+            logger.info(f"[FINTERNET] Ledger entries retrieved: {len(data.get('entries', []))} entries")
+            return {"success": True, "data": data}
         except httpx.HTTPStatusError as e:
             logger.error(f"[FINTERNET] HTTP error getting ledger: {e.response.status_code} - {e.response.text}")
             return {"success": False, "error": e.response.text}
@@ -166,6 +346,33 @@ class FinternetService:
             logger.error(f"[FINTERNET] Error getting ledger: {str(e)}")
             return {"success": False, "error": str(e)}
 
+    async def iter_ledger_entries(self, page_size: int = 100, offset: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield every ledger entry from `offset` onwards.
+        The next page is requested while the current one is being consumed,
+        so at most two pages are held in memory regardless of ledger size.
+        Iteration stops at the first short page.
+        """
+        next_page = asyncio.ensure_future(self.get_ledger_entries(limit=page_size, offset=offset))
+        try:
+            while next_page is not None:
+                result = await next_page
+                if not result["success"]:
+                    raise LedgerFetchError(f"Ledger page at offset {offset} failed: {result.get('error')}")
+
+                entries = result["data"].get("entries", [])
+                offset += len(entries)
+                if len(entries) == page_size:
+                    next_page = asyncio.ensure_future(self.get_ledger_entries(limit=page_size, offset=offset))
+                else:
+                    next_page = None
+
+                for entry in entries:
+                    yield entry
+        finally:
+            if next_page is not None and not next_page.done():
+                next_page.cancel()
+
     async def create_milestone(
         self,
         intent_id: str,
@@ -189,15 +396,42 @@ class FinternetService:
         logger.info(f"[FINTERNET] Milestone Payload: {payload}")
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, headers=self.headers, json=payload, timeout=30.0)
-                response.raise_for_status()
-                data = response.json()
-                logger.info(f"[FINTERNET] Milestone created successfully: {data}")
-                return {"success": True, "data": data}
+            try:
+                response = await self._send("milestone", "POST", url, json=payload)
+            finally:
+                self.invalidate_escrow(intent_id)
+            response.raise_for_status()
+            data = response.json()
+            logger.info(f"[FINTERNET] Milestone created successfully: {data}")
+            return {"success": True, "data": data}
         except httpx.HTTPStatusError as e:
             logger.error(f"[FINTERNET] HTTP error creating milestone: {e.response.status_code} - {e.response.text}")
             return {"success": False, "error": e.response.text}
         except Exception as e:
             logger.error(f"[FINTERNET] Error creating milestone: {str(e)}")
             return {"success": False, "error": str(e)}
+
+    async def create_milestones(
+        self,
+        intent_id: str,
+        milestones: List[Dict[str, Any]],
+        concurrency: int = 8
+    ) -> List[Dict[str, Any]]:
+        """
+        Create many milestones for one intent over the shared connection pool.
+        At most `concurrency` requests are in flight at once; results come
+        back in input order, one per milestone.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        logger.info(f"[FINTERNET] Creating {len(milestones)} milestones for intent: {intent_id} (concurrency={concurrency})")
+
+        async def create_one(milestone: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.create_milestone(
+                    intent_id=intent_id,
+                    milestone_index=milestone["milestone_index"],
+                    description=milestone["description"],
+                    amount=milestone["amount"]
+                )
+
+        return await asyncio.gather(*(create_one(m) for m in milestones))
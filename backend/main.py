@@ -3,16 +3,28 @@ FastAPI Backend for Finternet Payment Integration MVP
 """
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Awaitable, Tuple, List
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import json
 import os
 import logging
+import time
 import uuid
 from datetime import datetime
 from dotenv import load_dotenv
 
-from finternet_service import FinternetService
+from finternet_service import FinternetService, LedgerFetchError
+from resilience import RetryPolicy
 from session_manager import SessionManager
+from session_store import SessionStore, SQLiteSessionStore, parse_fields
+from session_stream import SessionStatusHub, status_event
+from session_scheduler import SessionCutoffScheduler
+from session_wal import SessionWAL
+from settlement_outbox import SettlementOutbox
 
 # Load environment variables
 load_dotenv()
@@ -24,8 +36,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Own the pooled Finternet HTTP client, settlement workers and session store for the lifetime of the app"""
+    session_manager.recover()
+    _track_active_sessions()
+    await finternet_service.start()
+    await settlement_outbox.start()
+    await session_hub.start()
+    await session_scheduler.start()
+    yield
+    await session_scheduler.stop()
+    await session_hub.stop()
+    await settlement_outbox.stop()
+    await finternet_service.aclose()
+    session_manager.close()
+
 # Initialize FastAPI
-app = FastAPI(title="Finternet Teaching Session MVP", version="1.0.0")
+app = FastAPI(title="Finternet Teaching Session MVP", version="1.0.0", lifespan=lifespan)
 
 # CORS configuration - allow frontend to connect
 app.add_middleware(
@@ -40,8 +68,73 @@ app.add_middleware(
 FINTERNET_API_KEY = os.getenv("FINTERNET_API_KEY", "sk_hackathon_3eb5a79c271079186415ba4af695a130")
 FINTERNET_BASE_URL = os.getenv("FINTERNET_BASE_URL", "http://localhost:3000")
 
-finternet_service = FinternetService(FINTERNET_API_KEY, FINTERNET_BASE_URL)
-session_manager = SessionManager()
+finternet_service = FinternetService(
+    FINTERNET_API_KEY,
+    FINTERNET_BASE_URL,
+    max_connections=int(os.getenv("FINTERNET_MAX_CONNECTIONS", 100)),
+    max_keepalive_connections=int(os.getenv("FINTERNET_MAX_KEEPALIVE", 20)),
+    keepalive_expiry=float(os.getenv("FINTERNET_KEEPALIVE_EXPIRY", 30.0)),
+    http2=os.getenv("FINTERNET_HTTP2", "true").lower() == "true",
+    retry_policy=RetryPolicy(max_attempts=int(os.getenv("FINTERNET_RETRY_ATTEMPTS", 3))),
+    breaker_failure_threshold=int(os.getenv("FINTERNET_BREAKER_THRESHOLD", 5)),
+    breaker_reset_timeout=float(os.getenv("FINTERNET_BREAKER_RESET_SECONDS", 30.0)),
+    balance_cache_ttl=float(os.getenv("FINTERNET_BALANCE_CACHE_TTL", 2.0)),
+    escrow_cache_ttl=float(os.getenv("FINTERNET_ESCROW_CACHE_TTL", 10.0)),
+    escrow_cache_size=int(os.getenv("FINTERNET_ESCROW_CACHE_SIZE", 1024))
+)
+# "memory" (single worker, optional WAL) or "sqlite" (shared by every uvicorn worker)
+SESSION_STORE = os.getenv("SESSION_STORE", "memory").lower()
+SESSION_RETENTION_SECONDS = float(os.getenv("SESSION_RETENTION_SECONDS", 3600))
+SESSION_MAX_RECORDS = int(os.getenv("SESSION_MAX_RECORDS", 10000))
+SESSION_WAL_PATH = os.getenv("SESSION_WAL_PATH", "sessions.wal")
+session_manager: SessionStore
+if SESSION_STORE == "sqlite":
+    session_manager = SQLiteSessionStore(
+        os.getenv("SESSION_STORE_PATH", "sessions.db"),
+        retention_seconds=SESSION_RETENTION_SECONDS,
+        max_sessions=SESSION_MAX_RECORDS
+    )
+else:
+    session_manager = SessionManager(
+        retention_seconds=SESSION_RETENTION_SECONDS,
+        max_sessions=SESSION_MAX_RECORDS,
+        wal=SessionWAL(
+            SESSION_WAL_PATH,
+            fsync_mode=os.getenv("SESSION_WAL_FSYNC", "group"),
+            group_commit_ms=int(os.getenv("SESSION_WAL_GROUP_COMMIT_MS", 10))
+        ) if SESSION_WAL_PATH else None
+    )
+# One shared ticker pushes live status to every /api/session/stream subscriber
+session_hub = SessionStatusHub(
+    session_manager,
+    tick_interval=float(os.getenv("SESSION_STREAM_TICK_SECONDS", 1.0))
+)
+# Ends sessions whose escrow is used up or whose client stopped sending heartbeats
+session_scheduler = SessionCutoffScheduler(
+    session_manager.get_session,
+    on_cutoff=lambda session_id, reason: _auto_end_session(session_id, reason),
+    heartbeat_timeout=float(os.getenv("SESSION_HEARTBEAT_TIMEOUT_SECONDS", 120)),
+    tick=float(os.getenv("SESSION_SCHEDULER_TICK_SECONDS", 1.0))
+)
+settlement_outbox = SettlementOutbox(
+    db_path=os.getenv("SETTLEMENT_OUTBOX_PATH", "settlement_outbox.db"),
+    submit=finternet_service.submit_delivery_proof,
+    workers=int(os.getenv("SETTLEMENT_WORKERS", 4)),
+    retry_window=float(os.getenv("SETTLEMENT_RETRY_WINDOW_SECONDS", 86400))
+)
+
+# Max milestones per bulk request, and how many are created concurrently
+MAX_BULK_MILESTONES = int(os.getenv("MAX_BULK_MILESTONES", 100))
+BULK_MILESTONE_CONCURRENCY = int(os.getenv("BULK_MILESTONE_CONCURRENCY", 8))
+
+# Page size cap for /api/sessions
+MAX_SESSION_PAGE_SIZE = int(os.getenv("MAX_SESSION_PAGE_SIZE", 500))
+
+# Overall budget for the upstream calls made while ending a session
+SESSION_END_DEADLINE_SECONDS = float(os.getenv("SESSION_END_DEADLINE_SECONDS", 8.0))
+
+# In-flight /api/session/end calls, so concurrent duplicates share one result
+_end_inflight: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
 
 logger.info(f"🚀 Backend initialized with Finternet API: {FINTERNET_BASE_URL}")
 
@@ -67,6 +160,56 @@ class MilestoneRequest(BaseModel):
     description: str
     amount: str
 
+class MilestoneItem(BaseModel):
+    milestone_index: int
+    description: str
+    amount: str
+
+class BulkMilestoneRequest(BaseModel):
+    intent_id: str
+    milestones: List[MilestoneItem]
+
+# ==================== Helpers ====================
+
+def _log_late_call(name: str, task: asyncio.Future) -> None:
+    if task.cancelled():
+        logger.warning(f"⏱️ Late {name} was cancelled")
+    elif task.exception() is not None:
+        logger.error(f"⏱️ Late {name} raised: {task.exception()}")
+    else:
+        logger.info(f"⏱️ Late {name} finished | success={task.result()['success']}")
+
+async def gather_with_deadline(
+    calls: Dict[str, Awaitable[Dict[str, Any]]],
+    deadline: float
+) -> Tuple[Dict[str, Optional[Dict[str, Any]]], Dict[str, str]]:
+    """
+    Run Finternet calls concurrently under one shared deadline.
+    Returns each call's result (None if it missed the deadline) and its
+    status: completed / failed / timed_out. Calls that miss the deadline
+    are not cancelled - writes may already be in flight upstream - and
+    their outcome is logged when they finish.
+    """
+    tasks = {name: asyncio.ensure_future(call) for name, call in calls.items()}
+    done, _ = await asyncio.wait(tasks.values(), timeout=deadline)
+
+    results: Dict[str, Optional[Dict[str, Any]]] = {}
+    statuses: Dict[str, str] = {}
+    for name, task in tasks.items():
+        if task not in done:
+            logger.warning(f"⏱️ {name} missed the {deadline}s deadline - finishing in background")
+            task.add_done_callback(lambda t, name=name: _log_late_call(name, t))
+            results[name] = None
+            statuses[name] = "timed_out"
+        elif task.exception() is not None:
+            logger.error(f"❌ {name} raised: {task.exception()}")
+            results[name] = None
+            statuses[name] = "failed"
+        else:
+            results[name] = task.result()
+            statuses[name] = "completed" if results[name]["success"] else "failed"
+    return results, statuses
+
 # ==================== API Endpoints ====================
 
 @app.get("/")
@@ -135,8 +278,10 @@ async def start_session(request: StartSessionRequest):
         session_id=session_id,
         intent_id=intent_id,
         locked_amount=float(request.amount),
-        rate_per_minute=request.rate_per_minute
+        rate_per_minute=request.rate_per_minute,
+        session_title=request.session_title
     )
+    session_scheduler.track(session)
 
     logger.info(f"✅ Session started: {session_id} | Intent: {intent_id} | Locked: ${request.amount}")
 
@@ -156,6 +301,7 @@ async def get_session_status(session_id: str):
     """
     logger.info(f"📈 [API] GET /api/session/status/{session_id}")
 
+    session_manager.heartbeat(session_id)
     session = session_manager.update_session_status(session_id)
 
     if not session:
@@ -166,60 +312,233 @@ async def get_session_status(session_id: str):
         "session": session
     }
 
-@app.post("/api/session/end")
-async def end_session(request: EndSessionRequest):
+@app.post("/api/session/heartbeat/{session_id}")
+async def session_heartbeat(session_id: str):
     """
-    End a teaching session:
-    1. Calculate elapsed time and costs
-    2. Get escrow details
-    3. Submit delivery proof (trigger settlement)
-    4. Return summary
+    Keep-alive from the client; sessions without one for
+    SESSION_HEARTBEAT_TIMEOUT_SECONDS are ended automatically
     """
-    logger.info(f"🛑 [API] POST /api/session/end - Session: {request.session_id}")
-
-    # Step 1: End session and calculate costs
-    session = session_manager.end_session(request.session_id)
+    session = session_manager.heartbeat(session_id)
 
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    intent_id = session["intent_id"]
+    session_scheduler.track(session)
 
-    # Step 2: Get escrow details
-    logger.info(f"🔍 Fetching escrow details for intent: {intent_id}")
-    escrow_result = await finternet_service.get_escrow_details(intent_id)
+    return {
+        "success": True,
+        "status": session["status"]
+    }
 
-    # Step 3: Submit delivery proof to trigger settlement
-    logger.info(f"📝 Submitting delivery proof for intent: {intent_id}")
+@app.get("/api/session/stream/{session_id}")
+async def stream_session_status(session_id: str):
+    """
+    Server-Sent Events: pushes elapsed seconds, running charge and remaining
+    locked amount every tick until the session ends (instead of polling
+    /api/session/status). The last event is sent as `event: end`.
+    """
+    logger.info(f"📡 [API] GET /api/session/stream/{session_id}")
 
-    # Generate proof data
-    proof_hash = f"0x{uuid.uuid4().hex}{uuid.uuid4().hex[:32]}"
-    proof_uri = f"https://sessions.example.com/proof/{request.session_id}"
-    submitted_by = "0x742d35Cc6634C0532925a3b844Bc9e7595f0bEb0"  # Mock teacher address
+    session = session_manager.get_session(session_id)
 
-    delivery_result = await finternet_service.submit_delivery_proof(
-        intent_id=intent_id,
-        proof_hash=proof_hash,
-        proof_uri=proof_uri,
-        submitted_by=submitted_by
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    queue = session_hub.subscribe(session_id)
+
+    async def sse():
+        # An open stream counts as a heartbeat, stamped a few times per timeout
+        heartbeat_every = session_scheduler.heartbeat_timeout / 4
+        last_heartbeat = 0.0
+        try:
+            event = status_event(session)
+            while event is not None:
+                name = "status" if event["status"] == "active" else "end"
+                yield f"event: {name}\ndata: {json.dumps(event)}\n\n"
+                if name == "end":
+                    break
+                if time.monotonic() - last_heartbeat >= heartbeat_every:
+                    session_manager.heartbeat(session_id)
+                    last_heartbeat = time.monotonic()
+                event = await queue.get()
+        finally:
+            session_hub.unsubscribe(session_id, queue)
+
+    return StreamingResponse(
+        sse(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
-    logger.info(f"✅ Session ended: {request.session_id} | Charged: ${session['amount_charged']} | Refunded: ${session['amount_refunded']}")
+def _proof_hash(session_id: str, intent_id: str) -> str:
+    """Deterministic per session, so a retried settlement always carries the same proof"""
+    return f"0x{hashlib.sha256(f'{session_id}:{intent_id}'.encode()).hexdigest()}"
 
+def _settle_session(session_id: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    End a session and record its settlement durably in the outbox (it
+    survives gateway brownouts and restarts). Shared by /api/session/end
+    and the automatic cutoff scheduler. Safe to repeat: the store returns
+    the already-ended session and the outbox the existing settlement.
+    Returns (session, settlement).
+    """
+    session = session_manager.end_session(session_id)
+
+    if not session:
+        return None
+
+    session_scheduler.forget(session_id)
+    settlement = settlement_outbox.enqueue(
+        session_id=session_id,
+        intent_id=session["intent_id"],
+        proof={
+            "proof_hash": _proof_hash(session_id, session["intent_id"]),
+            "proof_uri": f"https://sessions.example.com/proof/{session_id}",
+            "submitted_by": "0x742d35Cc6634C0532925a3b844Bc9e7595f0bEb0"  # Mock teacher address
+        }
+    )
+    logger.info(f"📝 Settlement {settlement['settlement_id']} queued for intent: {session['intent_id']}")
+    return session, settlement
+
+async def _auto_end_session(session_id: str, reason: str) -> None:
+    ended = _settle_session(session_id)
+    if ended:
+        session, settlement = ended
+        logger.info(f"✅ Session auto-ended ({reason}): {session_id} | Charged: ${session['amount_charged']} | Settlement: {settlement['status']}")
+
+def _track_active_sessions() -> None:
+    """Put every active session (e.g. recovered after a restart) on the cutoff scheduler"""
+    cursor = None
+    while True:
+        page = session_manager.query_sessions(status="active", limit=MAX_SESSION_PAGE_SIZE, cursor=cursor)
+        for session in page["sessions"]:
+            session_scheduler.track(session)
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+def _end_response(
+    session: Dict[str, Any],
+    settlement: Dict[str, Any],
+    escrow_details: Optional[Dict[str, Any]],
+    subcalls: Dict[str, str],
+    replayed: bool = False
+) -> Dict[str, Any]:
     return {
         "success": True,
+        "replayed": replayed,
         "session": session,
-        "escrow_details": escrow_result.get("data") if escrow_result["success"] else None,
-        "delivery_proof": delivery_result.get("data") if delivery_result["success"] else None,
+        "escrow_details": escrow_details,
+        "settlement": settlement,
+        "subcalls": subcalls,
         "summary": {
             "elapsed_minutes": session["elapsed_minutes"],
             "amount_charged": session["amount_charged"],
             "amount_refunded": session["amount_refunded"],
-            "teacher_paid": True,
+            "teacher_paid": settlement["status"] == "settled",
+            "settlement_status": settlement["status"],
             "settlement_method": "OFF_RAMP_MOCK"
         }
     }
 
+async def _end_session_once(session_id: str) -> Dict[str, Any]:
+    # Steps 1-2: End session, calculate costs and queue the settlement
+    ended = _settle_session(session_id)
+
+    if not ended:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    session, settlement = ended
+    intent_id = session["intent_id"]
+
+    # Step 3: Get escrow details
+    logger.info(f"🔍 Fetching escrow details for intent: {intent_id}")
+    results, subcalls = await gather_with_deadline(
+        {"escrow_details": finternet_service.get_escrow_details(intent_id)},
+        deadline=SESSION_END_DEADLINE_SECONDS
+    )
+    escrow_result = results["escrow_details"]
+    subcalls["delivery_proof"] = "queued"
+
+    logger.info(f"✅ Session ended: {session_id} | Charged: ${session['amount_charged']} | Refunded: ${session['amount_refunded']} | Subcalls: {subcalls}")
+
+    return _end_response(
+        session,
+        settlement,
+        escrow_result.get("data") if subcalls["escrow_details"] == "completed" else None,
+        subcalls
+    )
+
+@app.post("/api/session/end")
+async def end_session(request: EndSessionRequest):
+    """
+    End a teaching session:
+    1. Calculate elapsed time and costs
+    2. Queue the delivery proof in the settlement outbox (local write;
+       background workers submit it to Finternet)
+    3. Get escrow details, bounded by the session-end deadline
+    4. Return summary with the status of each sub-call
+
+    Idempotent: concurrent calls for a session share one in-flight end, and
+    calls after it has ended return the stored result ("replayed": true)
+    without any upstream call.
+    """
+    logger.info(f"🛑 [API] POST /api/session/end - Session: {request.session_id}")
+
+    task = _end_inflight.get(request.session_id)
+    if task is None:
+        session = session_manager.get_session(request.session_id)
+
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+
+        if session["status"] == "completed":
+            # Already ended (by an earlier call or the cutoff scheduler); both steps are idempotent
+            session, settlement = _settle_session(request.session_id)
+            logger.info(f"↩️ Session already ended: {request.session_id} | Settlement: {settlement['status']}")
+            return _end_response(
+                session,
+                settlement,
+                None,
+                {"escrow_details": "skipped", "delivery_proof": "queued"},
+                replayed=True
+            )
+
+        task = asyncio.create_task(_end_session_once(request.session_id))
+        _end_inflight[request.session_id] = task
+        task.add_done_callback(lambda _: _end_inflight.pop(request.session_id, None))
+
+    # Shielded so a caller disconnecting doesn't cancel the end for everyone else
+    return await asyncio.shield(task)
+
+@app.get("/api/settlements/{session_id}")
+async def get_settlement(session_id: str):
+    """
+    Settlement (delivery proof) status for an ended session
+    """
+    settlement = settlement_outbox.get_by_session(session_id)
+
+    if not settlement:
+        raise HTTPException(status_code=404, detail="Settlement not found")
+
+    return {
+        "success": True,
+        "settlement": settlement
+    }
+
+@app.post("/api/settlements/requeue")
+async def requeue_failed_settlements(session_id: Optional[str] = None):
+    """
+    Retry failed settlements (one session's, or all) with a fresh retry window
+    """
+    requeued = settlement_outbox.requeue_failed(session_id)
+    logger.info(f"🔁 [API] Requeued {requeued} failed settlement(s)")
+
+    return {
+        "success": True,
+        "requeued": requeued
+    }
+
 @app.get("/api/ledger/entries")
 async def get_ledger_entries(limit: int = 20, offset: int = 0):
     """
@@ -234,6 +553,32 @@ async def get_ledger_entries(limit: int = 20, offset: int = 0):
 
     return result["data"]
 
+@app.get("/api/ledger/entries/stream")
+async def stream_ledger_entries(page_size: int = 100, offset: int = 0):
+    """
+    Stream the whole ledger as NDJSON (one entry per line), paging through
+    Finternet with the next page prefetched. If a page fails mid-stream, a
+    final {"error": ...} line is emitted.
+    """
+    logger.info(f"📜 [API] GET /api/ledger/entries/stream - Page size: {page_size}, Offset: {offset}")
+
+    if page_size < 1:
+        raise HTTPException(status_code=400, detail="page_size must be positive")
+
+    async def ndjson():
+        count = 0
+        try:
+            async for entry in finternet_service.iter_ledger_entries(page_size=page_size, offset=offset):
+                count += 1
+                yield json.dumps(entry) + "\n"
+        except LedgerFetchError as e:
+            logger.error(f"Ledger stream aborted after {count} entries: {e}")
+            yield json.dumps({"error": str(e), "entries_streamed": count}) + "\n"
+        else:
+            logger.info(f"📜 Ledger stream complete: {count} entries")
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
 @app.get("/api/escrow/{intent_id}")
 async def get_escrow(intent_id: str):
     """
@@ -286,6 +631,108 @@ async def create_milestone(request: MilestoneRequest):
 
     return result["data"]
 
+@app.post("/api/milestones/bulk")
+async def create_milestones_bulk(request: BulkMilestoneRequest):
+    """
+    Create all milestones for an escrow in one request, with bounded
+    concurrency towards Finternet. Returns a result per milestone.
+    """
+    logger.info(f"🎯 [API] POST /api/milestones/bulk - Intent: {request.intent_id}, Count: {len(request.milestones)}")
+
+    if not request.milestones:
+        raise HTTPException(status_code=400, detail="No milestones provided")
+    if len(request.milestones) > MAX_BULK_MILESTONES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_MILESTONES} milestones per request")
+
+    results = await finternet_service.create_milestones(
+        intent_id=request.intent_id,
+        milestones=[m.model_dump() for m in request.milestones],
+        concurrency=BULK_MILESTONE_CONCURRENCY
+    )
+
+    items = [
+        {
+            "milestone_index": milestone.milestone_index,
+            "success": result["success"],
+            "data": result.get("data"),
+            "error": result.get("error")
+        }
+        for milestone, result in zip(request.milestones, results)
+    ]
+    created = sum(1 for item in items if item["success"])
+
+    return {
+        "success": created == len(items),
+        "intent_id": request.intent_id,
+        "created": created,
+        "failed": len(items) - created,
+        "results": items
+    }
+
+@app.get("/api/finternet/metrics")
+async def get_finternet_metrics():
+    """
+    Retry counters and circuit breaker state per Finternet operation
+    """
+    return {
+        "success": True,
+        "metrics": finternet_service.get_metrics(),
+        "settlement_outbox": settlement_outbox.stats()
+    }
+
+@app.get("/api/sessions")
+async def list_sessions(
+    status: Optional[str] = None,
+    intent_id: Optional[str] = None,
+    teacher: Optional[str] = None,
+    started_after: Optional[float] = None,
+    started_before: Optional[float] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    Query sessions newest first using the status / intent / teacher / start
+    time indexes. Pass `next_cursor` back as `cursor` for the next page;
+    `fields` is a comma-separated projection (e.g. fields=session_id,status).
+    """
+    if not 1 <= limit <= MAX_SESSION_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_SESSION_PAGE_SIZE}")
+
+    try:
+        page = session_manager.query_sessions(
+            status=status,
+            intent_id=intent_id,
+            teacher=teacher,
+            started_after=started_after,
+            started_before=started_before,
+            limit=limit,
+            cursor=cursor,
+            fields=parse_fields(fields)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "success": True,
+        **page
+    }
+
+@app.get("/api/sessions/by-intent/{intent_id}")
+async def get_session_by_intent(intent_id: str):
+    """
+    Look up the session that locked a payment intent (for reconciling ledger and escrow events)
+    """
+    session = session_manager.get_session_by_intent(intent_id)
+
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    return {
+        "success": True,
+        "session": session
+    }
+
 @app.get("/api/sessions/all")
 async def get_all_sessions():
     """
@@ -293,7 +740,10 @@ async def get_all_sessions():
     """
     return {
         "success": True,
-        "sessions": session_manager.get_all_sessions()
+        "sessions": session_manager.get_all_sessions(),
+        "stats": session_manager.stats(),
+        "stream": session_hub.stats(),
+        "scheduler": session_scheduler.stats()
     }
 
 if __name__ == "__main__":
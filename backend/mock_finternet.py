@@ -0,0 +1,340 @@
+"""
+Local Finternet stand-in for offline load testing.
+
+Implements the gateway endpoints FinternetService uses (payment intents,
+escrow, delivery proof, milestones, balance, ledger entries) with in-memory
+escrow state, plus configurable latency distributions and fault injection.
+
+Run:  python mock_finternet.py            (listens on MOCK_FINTERNET_PORT, default 3000)
+Then point FINTERNET_BASE_URL at it. Faults can be changed at runtime via
+PUT /__mock/config without restarting.
+"""
+import asyncio
+import math
+import os
+import random
+import uuid
+import logging
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("mock_finternet")
+
+ENDPOINTS = ["create_intent", "escrow", "delivery_proof", "milestone", "balance", "ledger"]
+DISTRIBUTIONS = ["constant", "uniform", "normal", "lognormal", "exponential"]
+
+# ==================== Fault configuration ====================
+
+class FaultProfile(BaseModel):
+    distribution: str = "constant"
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    timeout_rate: float = 0.0
+    hang_seconds: float = 60.0
+
+    def sample_latency(self) -> float:
+        """Latency in seconds drawn from the configured distribution"""
+        mean = max(0.0, self.latency_ms)
+        spread = max(0.0, self.jitter_ms)
+        if self.distribution == "uniform":
+            ms = random.uniform(mean - spread, mean + spread)
+        elif self.distribution == "normal":
+            ms = random.gauss(mean, spread)
+        elif self.distribution == "lognormal":
+            # latency_ms is the median; jitter_ms widens the right tail
+            ms = random.lognormvariate(math.log(mean), math.log1p(spread / mean)) if mean > 0 else 0.0
+        elif self.distribution == "exponential":
+            ms = random.expovariate(1.0 / mean) if mean > 0 else 0.0
+        else:
+            ms = mean
+        return max(0.0, ms) / 1000.0
+
+
+class MockConfig(BaseModel):
+    default: FaultProfile
+    endpoints: Dict[str, FaultProfile] = {}
+
+    def profile(self, endpoint: str) -> FaultProfile:
+        return self.endpoints.get(endpoint, self.default)
+
+
+def config_from_env() -> MockConfig:
+    return MockConfig(default=FaultProfile(
+        distribution=os.getenv("MOCK_LATENCY_DIST", "constant"),
+        latency_ms=float(os.getenv("MOCK_LATENCY_MS", 0)),
+        jitter_ms=float(os.getenv("MOCK_JITTER_MS", 0)),
+        error_rate=float(os.getenv("MOCK_ERROR_RATE", 0)),
+        timeout_rate=float(os.getenv("MOCK_TIMEOUT_RATE", 0)),
+        hang_seconds=float(os.getenv("MOCK_HANG_SECONDS", 60))
+    ))
+
+# ==================== In-memory gateway state ====================
+
+def _money(value: Decimal) -> str:
+    return f"{value:.2f}"
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+class GatewayState:
+    def __init__(self, opening_balance: Decimal):
+        self.available = opening_balance
+        self.pending = Decimal("0")
+        self.intents: Dict[str, Dict[str, Any]] = {}
+        self.escrows: Dict[str, Dict[str, Any]] = {}
+        self.ledger: List[Dict[str, Any]] = []  # oldest first, so offsets stay stable while paging
+
+    def record(self, entry_type: str, amount: Decimal, intent_id: str) -> None:
+        self.ledger.append({
+            "id": f"le_{uuid.uuid4().hex[:16]}",
+            "type": entry_type,
+            "amount": _money(amount),
+            "currency": "USD",
+            "intentId": intent_id,
+            "createdAt": _now()
+        })
+
+
+OPENING_BALANCE = Decimal(os.getenv("MOCK_OPENING_BALANCE", "100000.00"))
+config = config_from_env()
+state = GatewayState(OPENING_BALANCE)
+stats: Counter = Counter()
+
+# ==================== App ====================
+
+app = FastAPI(title="Mock Finternet Gateway", version="1.0.0")
+
+
+def _error(status_code: int, code: str, message: str) -> HTTPException:
+    return HTTPException(status_code=status_code, detail={"code": code, "message": message})
+
+
+@app.exception_handler(HTTPException)
+async def http_exception_handler(request, exc: HTTPException):
+    # Finternet returns {"code", "message"} at the top level, not under "detail"
+    body = exc.detail if isinstance(exc.detail, dict) else {"message": exc.detail}
+    return JSONResponse(status_code=exc.status_code, content=body)
+
+
+async def inject(endpoint: str, api_key: Optional[str]) -> None:
+    """Apply auth, latency and fault injection for one request"""
+    stats[f"{endpoint}.requests"] += 1
+    if not api_key:
+        raise _error(401, "invalid_api_key", "Invalid API key. The provided key does not exist.")
+
+    profile = config.profile(endpoint)
+    await asyncio.sleep(profile.sample_latency())
+
+    roll = random.random()
+    if roll < profile.timeout_rate:
+        stats[f"{endpoint}.timeouts"] += 1
+        await asyncio.sleep(profile.hang_seconds)
+    elif roll < profile.timeout_rate + profile.error_rate:
+        stats[f"{endpoint}.errors"] += 1
+        raise _error(503, "service_unavailable", "Injected fault")
+
+
+def _get_escrow(intent_id: str) -> Dict[str, Any]:
+    if intent_id not in state.intents:
+        raise _error(404, "resource_missing", "Payment intent not found")
+    return state.escrows[intent_id]
+
+
+class CreateIntentBody(BaseModel):
+    amount: str
+    currency: str
+    type: str
+    settlementMethod: Optional[str] = None
+    settlementDestination: Optional[str] = None
+    description: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
+
+
+class DeliveryProofBody(BaseModel):
+    proofHash: str
+    proofURI: str
+    submittedBy: str
+
+
+class MilestoneBody(BaseModel):
+    milestoneIndex: int
+    description: str
+    amount: str
+
+
+@app.post("/api/v1/payment-intents", status_code=201)
+async def create_payment_intent(body: CreateIntentBody, x_api_key: Optional[str] = Header(None)):
+    await inject("create_intent", x_api_key)
+    try:
+        amount = Decimal(body.amount)
+    except InvalidOperation:
+        raise _error(400, "invalid_request_error", "amount must be a decimal string")
+    if body.type not in ("DELIVERY_VS_PAYMENT", "CONSENTED_PULL"):
+        raise _error(400, "invalid_request_error", "type must be one of: DELIVERY_VS_PAYMENT, CONSENTED_PULL")
+
+    intent_id = f"intent_{uuid.uuid4()}"
+    intent = {
+        "id": intent_id,
+        "status": "INITIATED",
+        "amount": _money(amount),
+        "currency": body.currency,
+        "type": body.type,
+        "settlementMethod": body.settlementMethod,
+        "settlementDestination": body.settlementDestination,
+        "description": body.description,
+        "metadata": body.metadata or {},
+        "contractAddress": "0x" + (uuid.uuid4().hex + uuid.uuid4().hex)[:40],
+        "paymentUrl": f"https://pay.example.com/{intent_id}",
+        "createdAt": _now()
+    }
+    state.intents[intent_id] = intent
+    state.escrows[intent_id] = {
+        "id": f"escrow_{uuid.uuid4().hex[:16]}",
+        "orderId": intent_id,
+        "status": "LOCKED",
+        "amount": _money(amount),
+        "autoReleaseOnProof": True,
+        "deliveryProofs": [],
+        "milestones": [],
+        "settlementExecution": None
+    }
+    state.pending += amount
+    state.record("ESCROW_LOCK", amount, intent_id)
+    return {"object": "payment_intent", "data": intent}
+
+
+@app.get("/api/v1/payment-intents/account/balance")
+async def get_balance(x_api_key: Optional[str] = Header(None)):
+    await inject("balance", x_api_key)
+    return {
+        "object": "balance",
+        "availableBalance": _money(state.available),
+        "pendingBalance": _money(state.pending),
+        "reservedBalance": "0.00",
+        "totalBalance": _money(state.available + state.pending),
+        "currency": "USD"
+    }
+
+
+@app.get("/api/v1/payment-intents/account/ledger-entries")
+async def get_ledger_entries(limit: int = 20, offset: int = 0, x_api_key: Optional[str] = Header(None)):
+    await inject("ledger", x_api_key)
+    return {
+        "object": "list",
+        "entries": state.ledger[offset:offset + limit],
+        "total": len(state.ledger),
+        "limit": limit,
+        "offset": offset
+    }
+
+
+@app.get("/api/v1/payment-intents/{intent_id}/escrow")
+async def get_escrow(intent_id: str, x_api_key: Optional[str] = Header(None)):
+    await inject("escrow", x_api_key)
+    escrow = _get_escrow(intent_id)
+    return {"id": escrow["id"], "object": "escrow_order", "data": escrow}
+
+
+@app.post("/api/v1/payment-intents/{intent_id}/escrow/delivery-proof")
+async def submit_delivery_proof(intent_id: str, body: DeliveryProofBody, x_api_key: Optional[str] = Header(None)):
+    await inject("delivery_proof", x_api_key)
+    escrow = _get_escrow(intent_id)
+
+    proof = {
+        "id": f"proof_{uuid.uuid4().hex[:16]}",
+        "proofHash": body.proofHash,
+        "proofURI": body.proofURI,
+        "submittedBy": body.submittedBy,
+        "submittedAt": _now()
+    }
+    # Re-submitting the same proof is a no-op, like an idempotent gateway would treat it
+    if not any(p["proofHash"] == body.proofHash for p in escrow["deliveryProofs"]):
+        escrow["deliveryProofs"].append(proof)
+
+    if escrow["status"] == "LOCKED":
+        amount = Decimal(escrow["amount"])
+        escrow["status"] = "RELEASED"
+        escrow["settlementExecution"] = {"status": "COMPLETED", "executedAt": _now()}
+        state.intents[intent_id]["status"] = "SETTLED"
+        state.pending -= amount
+        state.available += amount
+        state.record("SETTLEMENT", amount, intent_id)
+    return {"object": "delivery_proof", "data": {**proof, "escrowStatus": escrow["status"]}}
+
+
+@app.post("/api/v1/payment-intents/{intent_id}/escrow/milestones", status_code=201)
+async def create_milestone(intent_id: str, body: MilestoneBody, x_api_key: Optional[str] = Header(None)):
+    await inject("milestone", x_api_key)
+    escrow = _get_escrow(intent_id)
+    if any(m["milestoneIndex"] == body.milestoneIndex for m in escrow["milestones"]):
+        raise _error(409, "duplicate_milestone", f"Milestone {body.milestoneIndex} already exists")
+
+    milestone = {
+        "id": f"ms_{uuid.uuid4().hex[:16]}",
+        "milestoneIndex": body.milestoneIndex,
+        "description": body.description,
+        "amount": body.amount,
+        "status": "PENDING",
+        "createdAt": _now()
+    }
+    escrow["milestones"].append(milestone)
+    return {"object": "milestone", "data": milestone}
+
+# ==================== Control plane ====================
+
+@app.get("/__mock/config")
+async def get_config():
+    return config.model_dump()
+
+
+@app.put("/__mock/config")
+async def put_config(new_config: MockConfig):
+    """Replace fault settings at runtime, e.g. to start a brownout mid-test"""
+    global config
+    for name, profile in [("default", new_config.default), *new_config.endpoints.items()]:
+        if name != "default" and name not in ENDPOINTS:
+            raise HTTPException(status_code=400, detail=f"Unknown endpoint '{name}', expected one of {ENDPOINTS}")
+        if profile.distribution not in DISTRIBUTIONS:
+            raise HTTPException(status_code=400, detail=f"Unknown distribution '{profile.distribution}'")
+    config = new_config
+    logger.info(f"Fault config updated: {config.model_dump()}")
+    return config.model_dump()
+
+
+@app.get("/__mock/stats")
+async def get_stats():
+    return {
+        "counters": dict(stats),
+        "intents": len(state.intents),
+        "ledger_entries": len(state.ledger),
+        "available_balance": _money(state.available),
+        "pending_balance": _money(state.pending)
+    }
+
+
+@app.post("/__mock/reset")
+async def reset():
+    """Drop all intents, ledger entries and counters"""
+    global state
+    state = GatewayState(OPENING_BALANCE)
+    stats.clear()
+    return {"success": True}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    port = int(os.getenv("MOCK_FINTERNET_PORT", 3000))
+    logger.info(f"🧪 Mock Finternet gateway on port {port} | faults: {config.default.model_dump()}")
+    uvicorn.run(app, host="0.0.0.0", port=port, log_level="warning")
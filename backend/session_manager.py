@@ -1,86 +1,408 @@
 """
 In-memory session manager for tracking active teaching sessions
 """
+import bisect
+import itertools
 import time
-from typing import Dict, Optional
-from datetime import datetime
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 import logging
 
+from session_store import (
+    DEFAULT_SESSION_TITLE, DEFAULT_STUDENT, DEFAULT_TEACHER, SessionStore, compute_charges,
+    decode_cursor, encode_cursor, project
+)
+from session_wal import SessionWAL
+
 logger = logging.getLogger(__name__)
 
-class SessionManager:
-    def __init__(self):
-        # In-memory storage: {session_id: session_data}
-        self.sessions: Dict[str, Dict] = {}
-        logger.info("Session Manager initialized")
+
+class SessionRecord:
+    """Compact session record; __slots__ avoids a per-instance dict"""
+
+    __slots__ = (
+        "session_id", "intent_id", "locked_amount", "rate_per_minute",
+        "start_time", "end_time", "status", "elapsed_seconds",
+        "teacher", "student", "session_title", "last_heartbeat",
+        "elapsed_minutes", "amount_charged", "amount_refunded"
+    )
+
+    def __init__(
+        self,
+        session_id: str,
+        intent_id: str,
+        locked_amount: float,
+        rate_per_minute: float,
+        start_time: float,
+        teacher: str = DEFAULT_TEACHER,
+        student: str = DEFAULT_STUDENT,
+        session_title: str = DEFAULT_SESSION_TITLE
+    ):
+        self.session_id = session_id
+        self.intent_id = intent_id
+        self.locked_amount = locked_amount
+        self.rate_per_minute = rate_per_minute
+        self.start_time = start_time
+        self.end_time: Optional[float] = None
+        self.status = "active"
+        self.elapsed_seconds = 0
+        self.teacher = teacher
+        self.student = student
+        self.session_title = session_title
+        self.last_heartbeat = start_time
+        self.elapsed_minutes: Optional[float] = None
+        self.amount_charged: Optional[float] = None
+        self.amount_refunded: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SessionRecord":
+        record = cls.__new__(cls)
+        for field in cls.__slots__:
+            setattr(record, field, data.get(field))
+        if record.elapsed_seconds is None:
+            record.elapsed_seconds = 0
+        return record
+
+    def to_dict(self) -> Dict[str, Any]:
+        """API representation (settlement fields only once the session has ended)"""
+        data = {
+            "session_id": self.session_id,
+            "intent_id": self.intent_id,
+            "locked_amount": self.locked_amount,
+            "rate_per_minute": self.rate_per_minute,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "status": self.status,
+            "elapsed_seconds": self.elapsed_seconds,
+            "teacher": self.teacher,
+            "student": self.student,
+            "session_title": self.session_title,
+            "last_heartbeat": self.last_heartbeat
+        }
+        if self.status == "completed":
+            data["elapsed_minutes"] = self.elapsed_minutes
+            data["amount_charged"] = self.amount_charged
+            data["amount_refunded"] = self.amount_refunded
+        return data
+
+
+def _remove_key(index: List[Tuple[float, str]], key: Tuple[float, str]) -> None:
+    i = bisect.bisect_left(index, key)
+    if i < len(index) and index[i] == key:
+        del index[i]
+
+
+class SessionManager(SessionStore):
+    def __init__(
+        self,
+        retention_seconds: float = 3600.0,
+        max_sessions: int = 10000,
+        on_evict: Optional[Callable[[SessionRecord], None]] = None,
+        wal: Optional[SessionWAL] = None,
+        compact_every: int = 10000
+    ):
+        # In-memory storage: {session_id: SessionRecord}
+        self.sessions: Dict[str, SessionRecord] = {}
+        # Completed sessions in least-recently-used order: {session_id: last_access}
+        self._completed: "OrderedDict[str, float]" = OrderedDict()
+        # Secondary indexes, kept in step with `sessions`
+        self._by_intent: Dict[str, str] = {}
+        # Each a sorted list of (start_time, session_id), so pages bisect instead of sorting
+        self._by_status: Dict[str, List[Tuple[float, str]]] = defaultdict(list)
+        self._by_teacher: Dict[str, List[Tuple[float, str]]] = defaultdict(list)
+        self._by_start: List[Tuple[float, str]] = []
+        self.retention_seconds = retention_seconds
+        self.max_sessions = max_sessions
+        self.on_evict = on_evict
+        self.evicted = 0
+        # Optional write-ahead log: create/end/evict are logged before they are acknowledged
+        self.wal = wal
+        self.compact_every = compact_every
+        self._wal_appends = 0
+        logger.info(f"Session Manager initialized (retention={retention_seconds}s, max_sessions={max_sessions})")
 
     def create_session(
         self,
         session_id: str,
         intent_id: str,
         locked_amount: float,
-        rate_per_minute: float
+        rate_per_minute: float,
+        session_title: str = DEFAULT_SESSION_TITLE
     ) -> Dict:
         """Create a new session"""
-        session_data = {
-            "session_id": session_id,
-            "intent_id": intent_id,
-            "locked_amount": locked_amount,
-            "rate_per_minute": rate_per_minute,
-            "start_time": time.time(),
-            "end_time": None,
-            "status": "active",
-            "elapsed_seconds": 0,
-            "teacher": "Guitar Master Pro",  # Hardcoded
-            "student": "Student User",  # Hardcoded
-            "session_title": "Live Guitar Basics"
-        }
-        self.sessions[session_id] = session_data
+        record = SessionRecord(
+            session_id=session_id,
+            intent_id=intent_id,
+            locked_amount=locked_amount,
+            rate_per_minute=rate_per_minute,
+            start_time=time.time(),
+            session_title=session_title
+        )
+        self._log({"op": "create", **record.to_dict()})
+        self.sessions[session_id] = record
+        self._index(record)
+        self._evict()
+        self._maybe_compact()
         logger.info(f"Session created: {session_id} | Intent: {intent_id}")
-        return session_data
+        return record.to_dict()
+
+    def _lookup(self, session_id: str) -> Optional[SessionRecord]:
+        record = self.sessions.get(session_id)
+        if record is not None and session_id in self._completed:
+            self._completed[session_id] = time.time()
+            self._completed.move_to_end(session_id)
+        return record
 
     def get_session(self, session_id: str) -> Optional[Dict]:
         """Get session details"""
-        return self.sessions.get(session_id)
+        record = self._lookup(session_id)
+        return record.to_dict() if record else None
+
+    def heartbeat(self, session_id: str) -> Optional[Dict]:
+        """Record that the client is still there (in memory only - not logged to the WAL)"""
+        record = self._lookup(session_id)
+        if not record:
+            return None
+        if record.status == "active":
+            record.last_heartbeat = time.time()
+        return record.to_dict()
 
     def update_session_status(self, session_id: str) -> Optional[Dict]:
         """Update session with current elapsed time"""
-        session = self.sessions.get(session_id)
-        if not session:
+        record = self._lookup(session_id)
+        if not record:
             return None
 
-        if session["status"] == "active":
-            session["elapsed_seconds"] = int(time.time() - session["start_time"])
+        if record.status == "active":
+            record.elapsed_seconds = int(time.time() - record.start_time)
 
-        return session
+        return record.to_dict()
 
     def end_session(self, session_id: str) -> Optional[Dict]:
-        """End a session and calculate final costs"""
-        session = self.sessions.get(session_id)
-        if not session:
+        """End a session and calculate final costs (ending it again returns the stored result)"""
+        record = self._lookup(session_id)
+        if not record:
             return None
+        if record.status == "completed":
+            return record.to_dict()
 
-        session["end_time"] = time.time()
-        session["status"] = "completed"
-        session["elapsed_seconds"] = int(session["end_time"] - session["start_time"])
+        record.end_time = time.time()
+        key = (record.start_time, session_id)
+        _remove_key(self._by_status[record.status], key)
+        bisect.insort(self._by_status["completed"], key)
+        record.status = "completed"
+        record.elapsed_seconds = int(record.end_time - record.start_time)
 
-        # Calculate costs
-        elapsed_minutes = session["elapsed_seconds"] / 60.0
-        amount_charged = round(elapsed_minutes * session["rate_per_minute"], 2)
-        amount_refunded = round(session["locked_amount"] - amount_charged, 2)
+        # Calculate costs (capped at the locked amount)
+        elapsed_minutes, amount_charged, amount_refunded = compute_charges(
+            record.elapsed_seconds, record.rate_per_minute, record.locked_amount
+        )
 
-        # Ensure we don't charge more than locked amount
-        if amount_charged > session["locked_amount"]:
-            amount_charged = session["locked_amount"]
-            amount_refunded = 0.0
+        record.elapsed_minutes = elapsed_minutes
+        record.amount_charged = amount_charged
+        record.amount_refunded = amount_refunded
+        self._log(self._end_entry(record))
 
-        session["elapsed_minutes"] = round(elapsed_minutes, 2)
-        session["amount_charged"] = amount_charged
-        session["amount_refunded"] = amount_refunded
+        self._completed[session_id] = record.end_time
+        self._completed.move_to_end(session_id)
+        self._evict()
+        self._maybe_compact()
 
         logger.info(f"Session ended: {session_id} | Duration: {elapsed_minutes:.2f}m | Charged: ${amount_charged} | Refunded: ${amount_refunded}")
-        return session
+        return record.to_dict()
+
+    def _evict(self) -> None:
+        """
+        Drop completed sessions idle for longer than the retention period,
+        then least-recently-used completed sessions while over the hard cap.
+        Active sessions are never evicted - they still hold locked funds.
+        """
+        cutoff = time.time() - self.retention_seconds
+        while self._completed:
+            session_id, last_access = next(iter(self._completed.items()))
+            if last_access >= cutoff and len(self.sessions) <= self.max_sessions:
+                break
+            self._completed.popitem(last=False)
+            record = self.sessions.pop(session_id)
+            self._unindex(record)
+            self.evicted += 1
+            self._log({"op": "evict", "session_id": session_id})
+            if self.on_evict:
+                self.on_evict(record)
+
+        if len(self.sessions) > self.max_sessions:
+            logger.warning(f"Session cap {self.max_sessions} exceeded by active sessions alone ({len(self.sessions)})")
+
+    # ---------- secondary indexes ----------
+
+    def _index(self, record: SessionRecord) -> None:
+        key = (record.start_time, record.session_id)
+        self._by_intent[record.intent_id] = record.session_id
+        bisect.insort(self._by_status[record.status], key)
+        bisect.insort(self._by_teacher[record.teacher], key)
+        bisect.insort(self._by_start, key)
+
+    def _unindex(self, record: SessionRecord) -> None:
+        key = (record.start_time, record.session_id)
+        if self._by_intent.get(record.intent_id) == record.session_id:
+            del self._by_intent[record.intent_id]
+        _remove_key(self._by_status[record.status], key)
+        _remove_key(self._by_teacher[record.teacher], key)
+        if not self._by_teacher[record.teacher]:
+            del self._by_teacher[record.teacher]
+        _remove_key(self._by_start, key)
+
+    def get_session_by_intent(self, intent_id: str) -> Optional[Dict]:
+        """Session that locked `intent_id` (for reconciling ledger and escrow events)"""
+        session_id = self._by_intent.get(intent_id)
+        return self.get_session(session_id) if session_id else None
+
+    def query_sessions(
+        self,
+        status: Optional[str] = None,
+        intent_id: Optional[str] = None,
+        teacher: Optional[str] = None,
+        started_after: Optional[float] = None,
+        started_before: Optional[float] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        # Upper bound of the (start_time, session_id) keyset, exclusive
+        upper = decode_cursor(cursor) if cursor else None
+        if started_before is not None and (upper is None or (started_before, "") < upper):
+            upper = (started_before, "")
+        lower = (started_after, "") if started_after is not None else None
+
+        # Walk the smallest matching index newest-first, checking the other filters per row
+        if intent_id is not None:
+            session_id = self._by_intent.get(intent_id)
+            ordered = [(self.sessions[session_id].start_time, session_id)] if session_id else []
+        else:
+            ordered = self._by_start
+            for index, value in ((self._by_status, status), (self._by_teacher, teacher)):
+                if value is not None:
+                    matches = index.get(value, [])
+                    if len(matches) < len(ordered):
+                        ordered = matches
+
+        hi = bisect.bisect_left(ordered, upper) if upper else len(ordered)
+        lo = bisect.bisect_left(ordered, lower) if lower else 0
+        keys = (
+            key for key in (ordered[i] for i in range(hi - 1, lo - 1, -1))
+            if (status is None or self.sessions[key[1]].status == status)
+            and (teacher is None or self.sessions[key[1]].teacher == teacher)
+        )
+
+        page = [self.sessions[session_id] for _, session_id in itertools.islice(keys, limit + 1)]
+
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(page[-1].start_time, page[-1].session_id)
+        return {
+            "sessions": [project(record.to_dict(), fields) for record in page],
+            "next_cursor": next_cursor
+        }
+
+    # ---------- write-ahead log ----------
+
+    def _log(self, entry: Dict[str, Any]) -> None:
+        if self.wal is None:
+            return
+        self.wal.append(entry)
+        self._wal_appends += 1
+
+    def _maybe_compact(self) -> None:
+        """
+        Compact once enough appends have piled up. Only call this after the
+        logged change has been applied to `sessions` - compaction rewrites
+        the log from that state, so an entry it doesn't reflect yet is lost.
+        """
+        if (
+            self.wal is not None
+            and not self.wal.compacting
+            and self._wal_appends >= max(self.compact_every, 2 * len(self.sessions))
+        ):
+            self.compact()
+
+    @staticmethod
+    def _end_entry(record: SessionRecord) -> Dict[str, Any]:
+        return {
+            "op": "end",
+            "session_id": record.session_id,
+            "end_time": record.end_time,
+            "elapsed_seconds": record.elapsed_seconds,
+            "elapsed_minutes": record.elapsed_minutes,
+            "amount_charged": record.amount_charged,
+            "amount_refunded": record.amount_refunded
+        }
+
+    def _live_entries(self) -> Iterator[Dict[str, Any]]:
+        """Minimal log that recreates the current state"""
+        for record in self.sessions.values():
+            created = record.to_dict()
+            created.update(status="active", end_time=None, op="create")
+            yield created
+            if record.status == "completed":
+                yield self._end_entry(record)
+
+    def compact(self) -> None:
+        """Rewrite the WAL so it only holds live sessions (in the background)"""
+        if self.wal is not None and self.wal.compact(self._live_entries()):
+            self._wal_appends = 0
+
+    def recover(self) -> int:
+        """
+        Rebuild sessions from the WAL after a restart, then compact it.
+        Active sessions come back active, so their locked escrow can still
+        be settled. Returns the number of sessions restored.
+        """
+        if self.wal is None:
+            return 0
+        for entry in self.wal.replay():
+            op = entry.pop("op", None)
+            session_id = entry.get("session_id")
+            if op == "create":
+                self.sessions[session_id] = SessionRecord.from_dict(entry)
+            elif op == "end" and session_id in self.sessions:
+                record = self.sessions[session_id]
+                for field, value in entry.items():
+                    setattr(record, field, value)
+                record.status = "completed"
+                self._completed[session_id] = record.end_time
+                self._completed.move_to_end(session_id)
+            elif op == "evict":
+                self.sessions.pop(session_id, None)
+                self._completed.pop(session_id, None)
+        # Heartbeats aren't logged; give recovered sessions a fresh grace period
+        recovered_at = time.time()
+        for record in self.sessions.values():
+            if record.status == "active":
+                record.last_heartbeat = recovered_at
+            self._index(record)
+        self._evict()
+        self.compact()
+        logger.info(f"Recovered {len(self.sessions)} sessions from WAL ({len(self.sessions) - len(self._completed)} active)")
+        return len(self.sessions)
+
+    def close(self) -> None:
+        if self.wal is not None:
+            self.wal.close()
 
     def get_all_sessions(self) -> Dict[str, Dict]:
         """Get all sessions (for debugging)"""
-        return self.sessions
+        self._evict()
+        self._maybe_compact()
+        return {session_id: record.to_dict() for session_id, record in self.sessions.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "total": len(self.sessions),
+            "active": len(self.sessions) - len(self._completed),
+            "completed": len(self._completed),
+            "evicted": self.evicted,
+            "max_sessions": self.max_sessions,
+            "retention_seconds": self.retention_seconds
+        }
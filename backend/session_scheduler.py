@@ -0,0 +1,111 @@
+"""
+Automatic session cutoff - ends sessions when their locked escrow is used
+up, and reaps sessions whose client stopped sending heartbeats
+"""
+import inspect
+import math
+import time
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Union
+
+from timer_wheel import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+ESCROW_EXHAUSTED = "escrow_exhausted"
+ABANDONED = "abandoned"
+
+GetSessionFn = Callable[[str], Union[Optional[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]]
+CutoffFn = Callable[[str, str], Awaitable[Any]]
+
+
+def exhaustion_deadline(session: Dict[str, Any]) -> float:
+    """When elapsed * rate_per_minute reaches locked_amount"""
+    if session["rate_per_minute"] <= 0:
+        return math.inf
+    return session["start_time"] + 60.0 * session["locked_amount"] / session["rate_per_minute"]
+
+
+class SessionCutoffScheduler:
+    """
+    One timer per active session in a shared TimerWheel, set to the earlier
+    of its exhaustion deadline and last_heartbeat + heartbeat_timeout.
+
+    Heartbeats only stamp `last_heartbeat` on the session record; they never
+    touch the wheel. When a timer fires the session is re-read and the
+    deadline recomputed - if a heartbeat arrived in the meantime the timer
+    is simply pushed out again. `on_cutoff(session_id, reason)` ends and
+    settles the session; `get_session` may be sync or async. A
+    heartbeat_timeout of 0 disables reaping.
+    """
+
+    def __init__(
+        self,
+        get_session: GetSessionFn,
+        on_cutoff: CutoffFn,
+        heartbeat_timeout: float = 120.0,
+        tick: float = 1.0,
+        slots: int = 4096
+    ):
+        self.get_session = get_session
+        self.on_cutoff = on_cutoff
+        self.heartbeat_timeout = heartbeat_timeout
+        self.wheel = TimerWheel(tick=tick, slots=slots)
+        self.cutoffs = {ESCROW_EXHAUSTED: 0, ABANDONED: 0}
+
+    def _deadline(self, session: Dict[str, Any]) -> float:
+        deadline = exhaustion_deadline(session)
+        if self.heartbeat_timeout > 0:
+            last_seen = session.get("last_heartbeat") or session["start_time"]
+            deadline = min(deadline, last_seen + self.heartbeat_timeout)
+        return deadline
+
+    def track(self, session: Dict[str, Any]) -> None:
+        """Start watching an active session (no-op if already tracked)"""
+        if session["status"] != "active" or session["session_id"] in self.wheel:
+            return
+        deadline = self._deadline(session)
+        if deadline != math.inf:
+            self.wheel.schedule(session["session_id"], deadline)
+
+    def forget(self, session_id: str) -> None:
+        self.wheel.cancel(session_id)
+
+    async def start(self) -> None:
+        await self.wheel.start(self._on_expire)
+        logger.info(f"Session cutoff scheduler started (heartbeat timeout={self.heartbeat_timeout}s, tracking {len(self.wheel)})")
+
+    async def stop(self) -> None:
+        await self.wheel.stop()
+
+    async def _on_expire(self, session_ids: List[Hashable]) -> None:
+        now = time.time()
+        for session_id in session_ids:
+            session = self.get_session(session_id)
+            if inspect.isawaitable(session):
+                session = await session
+            if not session or session["status"] != "active":
+                continue  # ended by the client (or another worker) first
+
+            if now >= exhaustion_deadline(session):
+                reason = ESCROW_EXHAUSTED
+            elif self.heartbeat_timeout > 0 and now >= self._deadline(session):
+                reason = ABANDONED
+            else:
+                self.wheel.schedule(session_id, self._deadline(session))
+                continue
+
+            self.cutoffs[reason] += 1
+            logger.info(f"⏱️ Auto-ending session {session_id} ({reason})")
+            try:
+                await self.on_cutoff(session_id, reason)
+            except Exception as e:
+                logger.error(f"Auto-end failed for session {session_id}: {e}")
+                self.wheel.schedule(session_id, now + self.wheel.tick * 5)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked": len(self.wheel),
+            "heartbeat_timeout": self.heartbeat_timeout,
+            "cutoffs": dict(self.cutoffs)
+        }
@@ -0,0 +1,374 @@
+"""
+Pluggable session storage - the in-memory SessionManager for a single
+worker, or SQLite (WAL mode) shared by every uvicorn worker on the host
+"""
+import base64
+import json
+import sqlite3
+import time
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Hardcoded participants - shared by every record instead of copied per session
+DEFAULT_TEACHER = "Guitar Master Pro"
+DEFAULT_STUDENT = "Student User"
+DEFAULT_SESSION_TITLE = "Live Guitar Basics"
+
+
+def compute_charges(elapsed_seconds: int, rate_per_minute: float, locked_amount: float) -> Tuple[float, float, float]:
+    """Return (elapsed_minutes, amount_charged, amount_refunded), never charging more than was locked"""
+    elapsed_minutes = elapsed_seconds / 60.0
+    amount_charged = round(elapsed_minutes * rate_per_minute, 2)
+    amount_refunded = round(locked_amount - amount_charged, 2)
+
+    if amount_charged > locked_amount:
+        amount_charged = locked_amount
+        amount_refunded = 0.0
+
+    return round(elapsed_minutes, 2), amount_charged, amount_refunded
+
+
+COLUMNS = (
+    "session_id", "intent_id", "locked_amount", "rate_per_minute",
+    "start_time", "end_time", "status", "elapsed_seconds",
+    "teacher", "student", "session_title", "last_heartbeat"
+)
+SETTLEMENT_COLUMNS = ("elapsed_minutes", "amount_charged", "amount_refunded")
+SESSION_FIELDS = COLUMNS + SETTLEMENT_COLUMNS
+
+
+def encode_cursor(start_time: float, session_id: str) -> str:
+    """Opaque keyset cursor: the sort key of the last session on a page"""
+    return base64.urlsafe_b64encode(json.dumps([start_time, session_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        start_time, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(start_time), str(session_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """'session_id,status' -> ['session_id', 'status']; None means every field"""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SESSION_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def project(session: Dict[str, Any], fields: Optional[Iterable[str]]) -> Dict[str, Any]:
+    if fields is None:
+        return session
+    return {name: session[name] for name in fields if name in session}
+
+
+class SessionStore(ABC):
+    """
+    Interface the session endpoints program against. Implementations
+    return plain dicts in the SessionRecord.to_dict() shape.
+    """
+
+    @abstractmethod
+    def create_session(
+        self,
+        session_id: str,
+        intent_id: str,
+        locked_amount: float,
+        rate_per_minute: float,
+        session_title: str = DEFAULT_SESSION_TITLE
+    ) -> Dict:
+        ...
+
+    @abstractmethod
+    def get_session(self, session_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def update_session_status(self, session_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def end_session(self, session_id: str) -> Optional[Dict]:
+        """Must be idempotent: ending a completed session returns it unchanged"""
+
+    @abstractmethod
+    def heartbeat(self, session_id: str) -> Optional[Dict]:
+        """Record that the client is still there; returns the session"""
+
+    @abstractmethod
+    def get_session_by_intent(self, intent_id: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def query_sessions(
+        self,
+        status: Optional[str] = None,
+        intent_id: Optional[str] = None,
+        teacher: Optional[str] = None,
+        started_after: Optional[float] = None,
+        started_before: Optional[float] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Sessions matching every given filter, newest first. `started_after`
+        is inclusive and `started_before` exclusive. Returns
+        {"sessions": [...], "next_cursor": str or None}; pass next_cursor
+        back to get the following page.
+        """
+
+    @abstractmethod
+    def get_all_sessions(self) -> Dict[str, Dict]:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        ...
+
+    def recover(self) -> int:
+        """Reload state after a restart; returns the number of sessions restored"""
+        return 0
+
+    def close(self) -> None:
+        pass
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id      TEXT PRIMARY KEY,
+    intent_id       TEXT NOT NULL,
+    locked_amount   REAL NOT NULL,
+    rate_per_minute REAL NOT NULL,
+    start_time      REAL NOT NULL,
+    end_time        REAL,
+    status          TEXT NOT NULL,
+    elapsed_seconds INTEGER NOT NULL DEFAULT 0,
+    teacher         TEXT NOT NULL,
+    student         TEXT NOT NULL,
+    session_title   TEXT NOT NULL,
+    last_heartbeat  REAL,
+    elapsed_minutes REAL,
+    amount_charged  REAL,
+    amount_refunded REAL,
+    last_access     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_completed ON sessions (status, last_access);
+CREATE INDEX IF NOT EXISTS idx_sessions_status_start ON sessions (status, start_time, session_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_intent ON sessions (intent_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_teacher_start ON sessions (teacher, start_time, session_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_start ON sessions (start_time, session_id);
+"""
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions in a SQLite database in WAL mode, so any number of worker
+    processes can serve the same session: readers never block the writer
+    and writers queue on the database lock (busy_timeout) instead of failing.
+
+    Ending a session is one IMMEDIATE transaction, so two workers ending the
+    same session concurrently can't interleave their reads and writes.
+    Retention and the hard cap apply to completed sessions exactly as in the
+    in-memory SessionManager; active sessions are never evicted.
+    """
+
+    def __init__(self, db_path: str, retention_seconds: float = 3600.0, max_sessions: int = 10000):
+        self.db_path = db_path
+        self.retention_seconds = retention_seconds
+        self.max_sessions = max_sessions
+        self.evicted = 0
+
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")  # active sessions hold locked funds
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        logger.info(f"SQLite session store at {db_path} (retention={retention_seconds}s, max_sessions={max_sessions})")
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        data = {column: row[column] for column in COLUMNS}
+        if row["status"] == "completed":
+            for column in SETTLEMENT_COLUMNS:
+                data[column] = row[column]
+        return data
+
+    def create_session(
+        self,
+        session_id: str,
+        intent_id: str,
+        locked_amount: float,
+        rate_per_minute: float,
+        session_title: str = DEFAULT_SESSION_TITLE
+    ) -> Dict:
+        """Create a new session"""
+        now = time.time()
+        self._conn.execute(
+            """INSERT INTO sessions
+               (session_id, intent_id, locked_amount, rate_per_minute, start_time, status,
+                teacher, student, session_title, last_heartbeat, last_access)
+               VALUES (?, ?, ?, ?, ?, 'active', ?, ?, ?, ?, ?)""",
+            (session_id, intent_id, locked_amount, rate_per_minute, now,
+             DEFAULT_TEACHER, DEFAULT_STUDENT, session_title, now, now)
+        )
+        self._evict()
+        logger.info(f"Session created: {session_id} | Intent: {intent_id}")
+        return self.get_session(session_id)
+
+    def _lookup(self, session_id: str) -> Optional[sqlite3.Row]:
+        row = self._conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is not None and row["status"] == "completed":
+            self._conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (time.time(), session_id))
+        return row
+
+    def get_session(self, session_id: str) -> Optional[Dict]:
+        """Get session details"""
+        row = self._lookup(session_id)
+        return self._to_dict(row) if row else None
+
+    def heartbeat(self, session_id: str) -> Optional[Dict]:
+        """Record that the client is still there; returns the session"""
+        self._conn.execute(
+            "UPDATE sessions SET last_heartbeat = ? WHERE session_id = ? AND status = 'active'",
+            (time.time(), session_id)
+        )
+        return self.get_session(session_id)
+
+    def update_session_status(self, session_id: str) -> Optional[Dict]:
+        """Return the session with its current elapsed time (computed, not written back)"""
+        row = self._lookup(session_id)
+        if not row:
+            return None
+
+        data = self._to_dict(row)
+        if data["status"] == "active":
+            data["elapsed_seconds"] = int(time.time() - data["start_time"])
+        return data
+
+    def end_session(self, session_id: str) -> Optional[Dict]:
+        """End a session and calculate final costs (ending it again returns the stored result)"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if not row or row["status"] == "completed":
+                self._conn.execute("COMMIT")
+                return self._to_dict(row) if row else None
+
+            end_time = time.time()
+            elapsed_seconds = int(end_time - row["start_time"])
+            elapsed_minutes, amount_charged, amount_refunded = compute_charges(
+                elapsed_seconds, row["rate_per_minute"], row["locked_amount"]
+            )
+            self._conn.execute(
+                """UPDATE sessions
+                   SET end_time = ?, status = 'completed', elapsed_seconds = ?, elapsed_minutes = ?,
+                       amount_charged = ?, amount_refunded = ?, last_access = ?
+                   WHERE session_id = ?""",
+                (end_time, elapsed_seconds, elapsed_minutes, amount_charged, amount_refunded, end_time, session_id)
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+        self._evict()
+        logger.info(f"Session ended: {session_id} | Duration: {elapsed_minutes:.2f}m | Charged: ${amount_charged} | Refunded: ${amount_refunded}")
+        return self.get_session(session_id)
+
+    def get_session_by_intent(self, intent_id: str) -> Optional[Dict]:
+        """Session that locked `intent_id` (for reconciling ledger and escrow events)"""
+        row = self._conn.execute("SELECT * FROM sessions WHERE intent_id = ?", (intent_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def query_sessions(
+        self,
+        status: Optional[str] = None,
+        intent_id: Optional[str] = None,
+        teacher: Optional[str] = None,
+        started_after: Optional[float] = None,
+        started_before: Optional[float] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        clauses, params = [], []
+        for column, value in (("status", status), ("intent_id", intent_id), ("teacher", teacher)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if started_after is not None:
+            clauses.append("start_time >= ?")
+            params.append(started_after)
+        if started_before is not None:
+            clauses.append("start_time < ?")
+            params.append(started_before)
+        if cursor:
+            after_time, after_id = decode_cursor(cursor)
+            clauses.append("(start_time < ? OR (start_time = ? AND session_id < ?))")
+            params.extend((after_time, after_time, after_id))
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn.execute(
+            f"SELECT * FROM sessions {where} ORDER BY start_time DESC, session_id DESC LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["start_time"], rows[-1]["session_id"])
+        return {
+            "sessions": [project(self._to_dict(row), fields) for row in rows],
+            "next_cursor": next_cursor
+        }
+
+    def _evict(self) -> None:
+        """Drop completed sessions past retention, then least-recently-used ones over the cap"""
+        cutoff = time.time() - self.retention_seconds
+        evicted = self._conn.execute(
+            "DELETE FROM sessions WHERE status = 'completed' AND last_access < ?", (cutoff,)
+        ).rowcount
+        total = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        if total > self.max_sessions:
+            evicted += self._conn.execute(
+                """DELETE FROM sessions WHERE session_id IN (
+                       SELECT session_id FROM sessions WHERE status = 'completed'
+                       ORDER BY last_access LIMIT ?)""",
+                (total - self.max_sessions,)
+            ).rowcount
+        self.evicted += evicted
+
+    def get_all_sessions(self) -> Dict[str, Dict]:
+        """Get all sessions (for debugging)"""
+        self._evict()
+        return {row["session_id"]: self._to_dict(row) for row in self._conn.execute("SELECT * FROM sessions")}
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {"active": 0, "completed": 0}
+        for row in self._conn.execute("SELECT status, COUNT(*) AS n FROM sessions GROUP BY status"):
+            counts[row["status"]] = row["n"]
+        return {
+            "backend": "sqlite",
+            "total": counts["active"] + counts["completed"],
+            "active": counts["active"],
+            "completed": counts["completed"],
+            "evicted": self.evicted,  # by this worker
+            "max_sessions": self.max_sessions,
+            "retention_seconds": self.retention_seconds
+        }
+
+    def recover(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,127 @@
+"""
+Server-pushed session status - one shared ticker fans live elapsed time and
+charge out to every subscriber, instead of each client polling
+"""
+import asyncio
+import time
+import logging
+from typing import Any, Dict, Optional, Set
+
+from session_store import SessionStore, compute_charges
+
+logger = logging.getLogger(__name__)
+
+
+def status_event(session: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Any]:
+    """Elapsed time, running charge and remaining locked amount for a session"""
+    if session["status"] == "active":
+        elapsed_seconds = int((now or time.time()) - session["start_time"])
+        elapsed_minutes, amount_charged, remaining = compute_charges(
+            elapsed_seconds, session["rate_per_minute"], session["locked_amount"]
+        )
+    else:
+        elapsed_seconds = session["elapsed_seconds"]
+        elapsed_minutes = session.get("elapsed_minutes")
+        amount_charged = session.get("amount_charged")
+        remaining = session.get("amount_refunded")
+    return {
+        "session_id": session["session_id"],
+        "status": session["status"],
+        "elapsed_seconds": elapsed_seconds,
+        "elapsed_minutes": elapsed_minutes,
+        "amount_charged": amount_charged,
+        "remaining_locked": remaining,
+        "locked_amount": session["locked_amount"],
+        "rate_per_minute": session["rate_per_minute"]
+    }
+
+
+class SessionStatusHub:
+    """
+    Subscribers get a small queue per connection. A single ticker task wakes
+    every `tick_interval` seconds, reads each watched session once, and pushes
+    the same event to all of its subscribers. A slow subscriber only ever
+    sees the newest events (older ones are dropped, never buffered without
+    bound). When a session ends or disappears, subscribers get a final event
+    followed by None, and the stream closes.
+    """
+
+    def __init__(self, store: SessionStore, tick_interval: float = 1.0, queue_size: int = 4):
+        self.store = store
+        self.tick_interval = tick_interval
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._has_subscribers = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    def subscribe(self, session_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(session_id, set()).add(queue)
+        self._has_subscribers.set()
+        return queue
+
+    def unsubscribe(self, session_id: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(session_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[session_id]
+
+    def _push(self, queue: asyncio.Queue, event: Optional[Dict[str, Any]]) -> None:
+        if queue.full():
+            queue.get_nowait()
+            self.dropped += 1
+        queue.put_nowait(event)
+
+    def _close_session(self, session_id: str, final: Optional[Dict[str, Any]]) -> None:
+        for queue in self._subscribers.pop(session_id, ()):
+            if final is not None:
+                self._push(queue, final)
+            self._push(queue, None)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="session-status-ticker")
+        logger.info(f"Session status hub started (tick={self.tick_interval}s)")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for session_id in list(self._subscribers):
+            self._close_session(session_id, None)
+
+    async def _run(self) -> None:
+        while True:
+            if not self._subscribers:
+                self._has_subscribers.clear()
+                await self._has_subscribers.wait()
+            await asyncio.sleep(self.tick_interval)
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Session status tick failed: {e}")
+
+    def tick(self) -> None:
+        now = time.time()
+        for session_id in list(self._subscribers):
+            session = self.store.get_session(session_id)
+            if session is None:
+                self._close_session(session_id, None)
+                continue
+            event = status_event(session, now)
+            if session["status"] != "active":
+                self._close_session(session_id, event)
+                continue
+            for queue in self._subscribers[session_id]:
+                self._push(queue, event)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tick_interval": self.tick_interval,
+            "sessions_watched": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "dropped_events": self.dropped
+        }
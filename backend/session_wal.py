@@ -0,0 +1,149 @@
+"""
+Append-only write-ahead log for SessionManager (JSON lines)
+"""
+import json
+import os
+import threading
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FSYNC_ALWAYS = "always"
+FSYNC_GROUP = "group"
+
+
+class SessionWAL:
+    """
+    Every append is written and flushed to the OS immediately, so a process
+    crash loses nothing. What differs is when it reaches the disk:
+
+    - "always": fsync on every append (safest, but the caller waits on the disk)
+    - "group":  a background thread fsyncs every `group_commit_ms`, so a
+                power loss can drop at most that window of writes (default)
+
+    A torn final line (crash mid-write) is skipped on replay. Compaction
+    rewrites the log on a background thread, so the caller (the event
+    loop) never waits on the disk for it.
+    """
+
+    def __init__(self, path: str, fsync_mode: str = FSYNC_GROUP, group_commit_ms: int = 10):
+        if fsync_mode not in (FSYNC_ALWAYS, FSYNC_GROUP):
+            raise ValueError(f"Unknown fsync mode '{fsync_mode}', expected '{FSYNC_ALWAYS}' or '{FSYNC_GROUP}'")
+        self.path = path
+        self.fsync_mode = fsync_mode
+        self.group_commit_interval = group_commit_ms / 1000.0
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+        self._dirty = False
+        self._closed = threading.Event()
+        self._syncer = None
+        # Lines appended while a compaction is rewriting the log, carried over to the new file
+        self._tail: Optional[List[str]] = None
+        self._compactor: Optional[threading.Thread] = None
+        if fsync_mode == FSYNC_GROUP:
+            self._syncer = threading.Thread(target=self._group_commit_loop, name="session-wal-sync", daemon=True)
+            self._syncer.start()
+        logger.info(f"Session WAL opened at {path} (fsync={fsync_mode})")
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self._tail is not None:
+                self._tail.append(line)
+            if self.fsync_mode == FSYNC_ALWAYS:
+                os.fsync(self._file.fileno())
+            else:
+                self._dirty = True
+
+    def _group_commit_loop(self) -> None:
+        while not self._closed.wait(self.group_commit_interval):
+            self._sync()
+
+    def _sync(self) -> None:
+        with self._lock:
+            if self._dirty and not self._file.closed:
+                os.fsync(self._file.fileno())
+                self._dirty = False
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """Yield logged entries in write order"""
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping unreadable WAL line {line_number} in {self.path}")
+
+    @property
+    def compacting(self) -> bool:
+        return self._tail is not None
+
+    def compact(self, entries: Iterable[Dict[str, Any]]) -> bool:
+        """
+        Atomically replace the log with `entries` (the current live state).
+        They are serialized here; the rewrite runs on a background thread and
+        picks up anything appended meanwhile. Returns False if a compaction
+        is already running.
+        """
+        with self._lock:
+            if self._tail is not None:
+                return False
+            lines = [json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries]
+            self._tail = []
+        self._compactor = threading.Thread(target=self._rewrite, args=(lines,), name="session-wal-compact", daemon=True)
+        self._compactor.start()
+        return True
+
+    def _rewrite(self, lines: List[str]) -> None:
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as tmp:
+                tmp.writelines(lines)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+                with self._lock:
+                    # Only the lines appended during the rewrite are written under the lock
+                    tmp.writelines(self._tail)
+                    tmp.flush()
+                    os.fsync(tmp.fileno())
+                    self._file.close()
+                    os.replace(tmp_path, self.path)
+                    self._fsync_dir()
+                    self._file = open(self.path, "a", encoding="utf-8")
+                    self._dirty = False
+                    self._tail = None
+        except OSError as e:
+            # The old log is still complete - every append also went there
+            logger.error(f"Session WAL compaction of {self.path} failed: {e}")
+            with self._lock:
+                self._tail = None
+                if self._file.closed:
+                    self._file = open(self.path, "a", encoding="utf-8")
+
+    def _fsync_dir(self) -> None:
+        # Make the rename itself durable (not supported on every platform)
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def close(self) -> None:
+        if self._compactor is not None:
+            self._compactor.join()
+        self._closed.set()
+        if self._syncer is not None:
+            self._syncer.join()
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
@@ -0,0 +1,121 @@
+"""
+WAL recovery and session queries for SessionManager - run with `python -m pytest` from backend/
+"""
+import threading
+
+from session_manager import SessionManager
+from session_wal import SessionWAL
+
+
+def _manager(path, **kwargs) -> SessionManager:
+    return SessionManager(wal=SessionWAL(str(path)), **kwargs)
+
+
+def _restart(manager: SessionManager, path) -> SessionManager:
+    manager.close()
+    recovered = _manager(path)
+    recovered.recover()
+    return recovered
+
+
+def test_create_that_triggers_compaction_survives_restart(tmp_path):
+    path = tmp_path / "sessions.wal"
+    manager = _manager(path, compact_every=3)
+    manager.create_session("a", "intent_a", 30.0, 1.0)
+    manager.end_session("a")
+    # Third append - compaction runs during this create
+    manager.create_session("b", "intent_b", 30.0, 1.0)
+
+    recovered = _restart(manager, path)
+
+    assert sorted(recovered.sessions) == ["a", "b"]
+    assert recovered.get_session("a")["status"] == "completed"
+    assert recovered.get_session("b")["status"] == "active"
+    assert recovered.get_session_by_intent("intent_b")["session_id"] == "b"
+    recovered.close()
+
+
+def test_end_that_triggers_compaction_survives_restart(tmp_path):
+    path = tmp_path / "sessions.wal"
+    manager = _manager(path, compact_every=2)
+    manager.create_session("a", "intent_a", 30.0, 1.0)
+    ended = manager.end_session("a")
+
+    recovered = _restart(manager, path)
+
+    session = recovered.get_session("a")
+    assert session["status"] == "completed"
+    assert session["amount_charged"] == ended["amount_charged"]
+    recovered.close()
+
+
+def test_compaction_keeps_every_session_across_many_writes(tmp_path):
+    path = tmp_path / "sessions.wal"
+    manager = _manager(path, compact_every=2)
+    for i in range(10):
+        manager.create_session(f"s{i}", f"intent_{i}", 30.0, 1.0)
+        if i % 2:
+            manager.end_session(f"s{i}")
+
+    recovered = _restart(manager, path)
+
+    assert len(recovered.sessions) == 10
+    assert sum(s["status"] == "active" for s in recovered.get_all_sessions().values()) == 5
+    recovered.close()
+
+
+def test_writes_during_background_compaction_survive_restart(tmp_path, monkeypatch):
+    path = tmp_path / "sessions.wal"
+    rewrite = SessionWAL._rewrite
+    release = threading.Event()
+
+    def delayed_rewrite(wal, lines):
+        release.wait(5)
+        rewrite(wal, lines)
+
+    monkeypatch.setattr(SessionWAL, "_rewrite", delayed_rewrite)
+    manager = _manager(path, compact_every=2)
+    manager.create_session("a", "intent_a", 30.0, 1.0)
+    manager.end_session("a")
+    assert manager.wal.compacting
+    # Logged while the rewrite is still running
+    manager.create_session("b", "intent_b", 30.0, 1.0)
+    manager.end_session("b")
+    release.set()
+
+    recovered = _restart(manager, path)
+
+    assert sorted(recovered.sessions) == ["a", "b"]
+    assert recovered.get_session("b")["status"] == "completed"
+    recovered.close()
+
+
+def test_filtered_query_pages_newest_first_without_gaps():
+    manager = SessionManager()
+    for i in range(30):
+        manager.create_session(f"s{i:02d}", f"intent_{i}", 30.0, 1.0)
+        manager.sessions[f"s{i:02d}"].teacher = f"teacher_{i % 3}"
+    # Re-index under the assigned teachers
+    for record in list(manager.sessions.values()):
+        manager._unindex(record)
+        manager._index(record)
+    for i in range(0, 30, 4):
+        manager.end_session(f"s{i:02d}")
+
+    expected = sorted(
+        (
+            (r.start_time, r.session_id) for r in manager.sessions.values()
+            if r.status == "active" and r.teacher == "teacher_1"
+        ),
+        reverse=True
+    )
+    seen, cursor = [], None
+    while True:
+        page = manager.query_sessions(status="active", teacher="teacher_1", limit=3, cursor=cursor)
+        seen += [(s["start_time"], s["session_id"]) for s in page["sessions"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert seen == expected
+    assert manager.query_sessions(status="completed", teacher="nobody")["sessions"] == []
@@ -0,0 +1,86 @@
+"""
+Hashed timing wheel - O(1) schedule/cancel for very large numbers of
+timers, all driven by a single asyncio task
+"""
+import asyncio
+import time
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ExpireFn = Callable[[List[Hashable]], Awaitable[None]]
+
+
+class TimerWheel:
+    """
+    `slots` buckets of `tick` seconds each. A timer lives in the bucket for
+    its deadline's tick; deadlines further out than one revolution simply
+    stay put and are skipped until a visit finds them due. Each key has at
+    most one timer - scheduling it again moves it.
+
+    Deadlines are wall-clock (time.time()) timestamps, so they line up with
+    the start_time stored on session records.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 4096):
+        self.tick = tick
+        self.slots = slots
+        self._wheel: List[Dict[Hashable, float]] = [{} for _ in range(slots)]
+        self._deadlines: Dict[Hashable, float] = {}
+        self._current = int(time.time() // tick)
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._deadlines
+
+    def _slot(self, deadline: float) -> Dict[Hashable, float]:
+        # Overdue timers go in the current bucket so the next advance fires them
+        return self._wheel[max(int(deadline // self.tick), self._current) % self.slots]
+
+    def schedule(self, key: Hashable, deadline: float) -> None:
+        self.cancel(key)
+        self._slot(deadline)[key] = deadline
+        self._deadlines[key] = deadline
+
+    def cancel(self, key: Hashable) -> None:
+        deadline = self._deadlines.pop(key, None)
+        if deadline is not None:
+            self._slot(deadline).pop(key, None)
+
+    def advance(self, now: float) -> List[Hashable]:
+        """Remove and return every key whose deadline is <= now"""
+        now_tick = int(now // self.tick)
+        fired = []
+        for t in range(self._current, self._current + min(now_tick - self._current + 1, self.slots)):
+            bucket = self._wheel[t % self.slots]
+            for key, deadline in list(bucket.items()):
+                if deadline <= now:
+                    del bucket[key]
+                    del self._deadlines[key]
+                    fired.append(key)
+        # Stay on the current tick: timers due later within it fire on the next advance
+        self._current = max(self._current, now_tick)
+        return fired
+
+    async def start(self, on_expire: ExpireFn) -> None:
+        self._task = asyncio.create_task(self._run(on_expire), name="timer-wheel")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, on_expire: ExpireFn) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            fired = self.advance(time.time())
+            if fired:
+                try:
+                    await on_expire(fired)
+                except Exception as e:
+                    logger.error(f"Timer wheel callback failed for {len(fired)} timers: {e}")
@@ -0,0 +1,121 @@
+"""
+Async read-through LRU cache with per-entry TTL and single-flight loading
+"""
+import asyncio
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    Caches loader results per key for `ttl` seconds, keeping at most
+    `maxsize` keys (least recently used evicted first).
+
+    Concurrent misses for the same key share one in-flight load. The load
+    runs in its own task, so a cancelled caller does not abort it for the
+    others. Invalidating a key while a load is in flight detaches that load:
+    its result is still returned to its waiters but never stored.
+
+    With `negative_ttl` set, a `None` result (e.g. "not found") is cached
+    for that many seconds instead of `ttl`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        maxsize: int = 1024,
+        should_cache: Optional[Callable[[Any], bool]] = None,
+        negative_ttl: Optional[float] = None
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        self.should_cache = should_cache or (lambda value: True)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if time.monotonic() < expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if value is None:
+                    self.negative_hits += 1
+                return value
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        me = asyncio.current_task()
+        try:
+            value = await loader()
+            if self._inflight.get(key) is me and self.should_cache(value):
+                self._store(key, value)
+            return value
+        finally:
+            if self._inflight.get(key) is me:
+                del self._inflight[key]
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        ttl = self.negative_ttl if value is None and self.negative_ttl is not None else self.ttl
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value known to be current, replacing any entry or in-flight load"""
+        self._inflight.pop(key, None)
+        self._entries.pop(key, None)
+        self._store(key, value)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop a key and detach any in-flight load for it"""
+        removed = self._entries.pop(key, None) is not None
+        removed = self._inflight.pop(key, None) is not None or removed
+        if removed:
+            self.invalidations += 1
+            logger.debug(f"[CACHE] {self.name}: invalidated {key!r}")
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._inflight.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,67 @@
+"""
+One-off backfill for feedback saved before the feedback collection carried
+the fields review queries filter and return: has_review, watch_time_seconds,
+amount_charged and quiz_scores. Without has_review, old feedback never
+matches has_text queries (e.g. the insights endpoint).
+
+    python backfill_feedback.py            # every video
+    python backfill_feedback.py vid001     # one video
+
+Safe to run more than once; documents that already have the fields are left alone.
+"""
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from storage import FEEDBACK_COLLECTION, Storage, storage_from_env
+from write_behind import MAX_BATCH_WRITES, UPDATE
+
+
+def _missing_fields(feedback: Dict[str, Any], session: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields `feedback` lacks, taken from its session as get_all_feedback_by_video used to"""
+    update = {}
+    if "has_review" not in feedback:
+        update["has_review"] = bool((feedback.get("review") or "").strip())
+    if "watch_time_seconds" not in feedback:
+        update["watch_time_seconds"] = session.get("elapsed_seconds", 0)
+    if "amount_charged" not in feedback:
+        update["amount_charged"] = session.get("amount_charged", 0)
+    if not feedback.get("quiz_scores") and session.get("quiz_scores"):
+        update["quiz_scores"] = session["quiz_scores"]
+    return update
+
+
+def backfill_feedback(video_id: str = None, storage: Optional[Storage] = None) -> int:
+    """Backfill one video's feedback, or every video's. Returns the number of documents updated."""
+    storage = storage or storage_from_env()
+    print(f"[*] Loading sessions for {video_id or 'all videos'}...")
+    sessions_by_video = defaultdict(dict)
+    for session in storage.get_sessions_by_video(video_id):
+        if session.get("video_id"):
+            sessions_by_video[session["video_id"]][session["session_id"]] = session
+
+    updated = 0
+    for vid, sessions in sessions_by_video.items():
+        writes: List[Dict[str, Any]] = []
+        for feedback in storage.get_all_feedback_by_video(vid):
+            update = _missing_fields(feedback, sessions.get(feedback["session_id"], {}))
+            if update:
+                writes.append({
+                    "collection": FEEDBACK_COLLECTION,
+                    "doc_id": feedback["session_id"],
+                    "op": UPDATE,
+                    "data": update,
+                    "array_union": {},
+                    "increment": {}
+                })
+        for start in range(0, len(writes), MAX_BATCH_WRITES):
+            storage.commit_writes(writes[start:start + MAX_BATCH_WRITES])
+        updated += len(writes)
+        print(f"[+] {vid}: backfilled {len(writes)} feedback document(s)")
+
+    print(f"[+] Backfilled {updated} feedback document(s)")
+    return updated
+
+
+if __name__ == "__main__":
+    backfill_feedback(sys.argv[1] if len(sys.argv) > 1 else None)
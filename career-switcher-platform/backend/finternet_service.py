@@ -1,33 +1,186 @@
 """
 Finternet API Service - Handles all interactions with Finternet payment APIs
 """
+import asyncio
 import httpx
 import logging
 from typing import Optional, Dict, Any
 from httpx import HTTPStatusError
 
+from resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, OPEN
+from ttl_cache import TTLCache
+
 logger = logging.getLogger(__name__)
 
+# Per-operation read timeouts (seconds)
+DEFAULT_TIMEOUTS: Dict[str, float] = {
+    "balance": 10.0,
+    "create_intent": 30.0,
+    "delivery_proof": 30.0,
+}
+
+# Only reads are safe to replay; writes that move funds are attempted once
+IDEMPOTENT_OPERATIONS = {"balance"}
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (installed via httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _is_success(result: Dict[str, Any]) -> bool:
+    return bool(result.get("success"))
+
+
 class FinternetService:
-    def __init__(self, api_key: str, base_url: str):
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+        connect_timeout: float = 5.0,
+        timeouts: Optional[Dict[str, float]] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        breaker_failure_threshold: int = 5,
+        breaker_reset_timeout: float = 30.0,
+        balance_cache_ttl: float = 2.0
+    ):
         self.api_key = api_key
         self.base_url = base_url.rstrip('/')
         self.headers = {
             "X-API-Key": api_key,
             "Content-Type": "application/json"
         }
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        if http2 and not _http2_available():
+            logger.warning("HTTP/2 requested but 'h2' is not installed - falling back to HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.connect_timeout = connect_timeout
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self._client: Optional[httpx.AsyncClient] = None
+        self.retry_policy = retry_policy or RetryPolicy()
+        self._breakers = {
+            operation: CircuitBreaker(operation, breaker_failure_threshold, breaker_reset_timeout)
+            for operation in self.timeouts
+        }
+        self._call_stats = {
+            operation: {"requests": 0, "retries": 0, "failures": 0}
+            for operation in self.timeouts
+        }
+        # Short-lived balance cache; concurrent misses share one upstream call
+        self._balance_cache = TTLCache("balance", ttl=balance_cache_ttl, maxsize=1, should_cache=_is_success)
+        self._caches = {"balance": self._balance_cache}
         logger.info(f"Initialized Finternet Service with base URL: {self.base_url}")
 
+    async def start(self) -> None:
+        """Open the shared connection pool (called from the app lifespan)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                limits=self.limits,
+                http2=self.http2
+            )
+
+    async def aclose(self) -> None:
+        """Close the shared connection pool"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Return the pooled client, opening it lazily outside the app lifespan"""
+        if self._client is None or self._client.is_closed:
+            await self.start()
+        return self._client
+
+    def _timeout(self, operation: str) -> httpx.Timeout:
+        return httpx.Timeout(self.timeouts[operation], connect=self.connect_timeout)
+
+    async def _send(self, operation: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request through the operation's circuit breaker.
+        Idempotent reads are retried with jittered backoff on transport
+        errors and 429/5xx gateway responses; writes get a single attempt.
+        """
+        breaker = self._breakers[operation]
+        if not breaker.allow():
+            logger.warning(f"Short-circuiting '{operation}' - breaker open")
+            raise CircuitOpenError(operation, breaker.retry_in())
+
+        client = await self._get_client()
+        stats = self._call_stats[operation]
+        attempts = self.retry_policy.max_attempts if operation in IDEMPOTENT_OPERATIONS else 1
+
+        for attempt in range(1, attempts + 1):
+            stats["requests"] += 1
+            try:
+                response = await client.request(method, url, timeout=self._timeout(operation), **kwargs)
+            except httpx.TransportError as e:
+                breaker.record_failure()
+                stats["failures"] += 1
+                if attempt == attempts or breaker.state == OPEN:
+                    raise
+                reason = f"{type(e).__name__}: {e}"
+            except Exception:
+                breaker.record_failure()
+                stats["failures"] += 1
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                stats["failures"] += 1
+                if attempt == attempts or breaker.state == OPEN:
+                    return response
+                reason = f"HTTP {response.status_code}"
+
+            delay = self.retry_policy.backoff(attempt)
+            stats["retries"] += 1
+            logger.warning(f"{operation} attempt {attempt}/{attempts} failed ({reason}) - retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Breaker state and retry counters per Finternet operation"""
+        metrics = {
+            operation: {**self._call_stats[operation], "breaker": self._breakers[operation].snapshot()}
+            for operation in self.timeouts
+        }
+        for operation, cache in self._caches.items():
+            metrics[operation]["cache"] = cache.stats()
+        return metrics
+
+    def invalidate_balance(self) -> None:
+        """Forget the cached wallet balance (after anything that moves funds)"""
+        self._balance_cache.invalidate("balance")
+
     async def get_account_balance(self) -> Dict[str, Any]:
+        """Wallet balance, served from the short-TTL cache when fresh"""
+        return await self._balance_cache.get_or_load("balance", self._fetch_account_balance)
+
+    async def _fetch_account_balance(self) -> Dict[str, Any]:
         """GET /api/v1/payment-intents/account/balance"""
         url = f"{self.base_url}/api/v1/payment-intents/account/balance"
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=self.headers, timeout=30.0)
-                response.raise_for_status()
-                data = response.json()
-                return {"success": True, "data": data}
+            response = await self._send("balance", "GET", url)
+            response.raise_for_status()
+            data = response.json()
+            return {"success": True, "data": data}
         except Exception as e:
             logger.error(f"Error getting balance: {str(e)}")
             return {"success": False, "error": str(e)}
@@ -53,11 +206,13 @@ class FinternetService:
         }
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, headers=self.headers, json=payload, timeout=30.0)
-                response.raise_for_status()
-                data = response.json()
-                return {"success": True, "data": data}
+            try:
+                response = await self._send("create_intent", "POST", url, json=payload)
+            finally:
+                self.invalidate_balance()
+            response.raise_for_status()
+            data = response.json()
+            return {"success": True, "data": data}
         except Exception as e:
             logger.error(f"Error creating payment intent: {str(e)}")
             return {"success": False, "error": str(e)}
@@ -79,19 +234,23 @@ class FinternetService:
         }
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, headers=self.headers, json=payload, timeout=30.0)
-                response.raise_for_status()
-                data = response.json()
-                logger.info("Delivery proof submitted successfully")
-                return {"success": True, "data": data}
+            try:
+                response = await self._send("delivery_proof", "POST", url, json=payload)
+            finally:
+                self.invalidate_balance()
+            response.raise_for_status()
+            data = response.json()
+            logger.info("Delivery proof submitted successfully")
+            return {"success": True, "data": data}
         except httpx.HTTPStatusError as e:
             # If endpoint doesn't exist (404), this is expected with some APIs
             if e.response.status_code == 404:
                 logger.warning(f"Delivery proof endpoint not found (404) - may be expected with this API")
-                return {"success": False, "error": "Endpoint not available", "recoverable": True}
+                return {"success": False, "error": "Endpoint not available", "recoverable": True, "status_code": 404}
             logger.error(f"HTTP error submitting delivery proof: {str(e)}")
-            return {"success": False, "error": str(e), "recoverable": False}
+            return {"success": False, "error": str(e), "recoverable": False, "status_code": e.response.status_code}
+        except CircuitOpenError as e:
+            return {"success": False, "error": str(e), "recoverable": True, "retry_in": e.retry_in}
         except Exception as e:
             logger.error(f"Error submitting delivery proof: {str(e)}")
             return {"success": False, "error": str(e), "recoverable": False}
@@ -3,16 +3,35 @@ Firestore Database Service - Handle all database operations
 """
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core import exceptions as gexc
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 import os
 from dotenv import load_dotenv
 
+from storage import (
+    FEEDBACK_COLLECTION,
+    MAX_FEEDBACK_PAGE_SIZE,
+    ROLLUP_BUCKETS_COLLECTION,
+    ROLLUPS_COLLECTION,
+    SESSIONS_COLLECTION,
+    FeedbackWrites,
+    Storage,
+    analytics_result,
+    check_feedback_fields,
+    decode_cursor,
+    encode_cursor,
+    with_feedback_defaults
+)
+
 # Load environment variables
 load_dotenv()
 
+# Local Firestore emulator (e.g. "localhost:8080") - no service account needed
+FIRESTORE_EMULATOR_HOST = os.getenv("FIRESTORE_EMULATOR_HOST")
+
 # Initialize Firebase Admin SDK using environment variables
-if not firebase_admin._apps:
+if not FIRESTORE_EMULATOR_HOST and not firebase_admin._apps:
     # Build credentials from environment variables
     firebase_config = {
         "type": os.getenv("FIREBASE_TYPE", "service_account"),
@@ -37,13 +56,12 @@ if not firebase_admin._apps:
     cred = credentials.Certificate(firebase_config)
     firebase_admin.initialize_app(cred)
 
-db = firestore.client()
-
-# Collection names
-SESSIONS_COLLECTION = "video_sessions"
-FEEDBACK_COLLECTION = "feedback"
-QUIZ_SCORES_COLLECTION = "quiz_scores"
-
+if FIRESTORE_EMULATOR_HOST:
+    # The client picks FIRESTORE_EMULATOR_HOST up itself and connects unauthenticated
+    db = firestore.Client(project=os.getenv("FIREBASE_PROJECT_ID") or "demo-career-switcher")
+    print(f"🧪 Using Firestore emulator at {FIRESTORE_EMULATOR_HOST}")
+else:
+    db = firestore.client()
 
 def save_session(session_data: Dict[str, Any]) -> bool:
     """Save video session to Firestore"""
@@ -92,6 +110,7 @@ def save_feedback(feedback_data: Dict[str, Any]) -> bool:
         session_id = feedback_data["session_id"]
         db.collection(FEEDBACK_COLLECTION).document(session_id).set({
             **feedback_data,
+            "has_review": bool(feedback_data.get("review", "").strip()),
             "created_at": firestore.SERVER_TIMESTAMP
         })
         return True
@@ -120,93 +139,369 @@ def save_quiz_score(quiz_data: Dict[str, Any]) -> bool:
         return False
 
 
+# Firestore allows at most 500 writes per batch
+MAX_BATCH_WRITES = 500
+
+
+def commit_writes(writes: List[Dict[str, Any]]) -> None:
+    """
+    Commit buffered writes as one batched write. Each write is
+    {"collection", "doc_id", "op": "set"|"update"|"merge", "data",
+    "array_union", "increment"}. The batch is atomic, so a session update
+    and its rollup increments land together, and nothing is applied when
+    it raises - the caller can retry. At most MAX_BATCH_WRITES writes.
+    """
+    if len(writes) > MAX_BATCH_WRITES:
+        raise ValueError(f"{len(writes)} writes exceed the {MAX_BATCH_WRITES}-write batch limit")
+    batch = db.batch()
+    _add_writes(batch, writes)
+    batch.commit()
+
+
+def _add_writes(batch, writes: List[Dict[str, Any]]) -> None:
+    """Add buffered writes to a batch or transaction (both have set/update)"""
+    for write in writes:
+        ref = db.collection(write["collection"]).document(write["doc_id"])
+        data = {**write["data"], "updated_at": firestore.SERVER_TIMESTAMP}
+        for field, items in write.get("array_union", {}).items():
+            data[field] = firestore.ArrayUnion(items)
+        for field, amount in write.get("increment", {}).items():
+            data[field] = firestore.Increment(amount)
+        if write["op"] == "set":
+            batch.set(ref, {**data, "created_at": firestore.SERVER_TIMESTAMP})
+        elif write["op"] == "merge":
+            batch.set(ref, data, merge=True)
+        else:
+            batch.update(ref, data)
+
+
+def replace_feedback(feedback_data: Dict[str, Any], writes_for: FeedbackWrites) -> None:
+    """
+    Overwrite a session's feedback document in a transaction that first reads
+    the document it replaces, and commit `writes_for(previous)` with it.
+    Firestore retries the transaction if another worker changes the
+    feedback document in between, so the delta is always taken from the
+    document actually replaced.
+    """
+    ref = db.collection(FEEDBACK_COLLECTION).document(feedback_data["session_id"])
+
+    @firestore.transactional
+    def replace(transaction) -> None:
+        snapshot = ref.get(transaction=transaction)
+        previous = snapshot.to_dict() if snapshot.exists else None
+        _add_writes(transaction, [
+            {"collection": FEEDBACK_COLLECTION, "doc_id": feedback_data["session_id"], "op": "set", "data": feedback_data},
+            *writes_for(previous)
+        ])
+
+    replace(db.transaction())
+
+
+# ==================== Aggregation queries ====================
+# count/sum/avg run server-side and return a single row instead of every
+# matching document. Client libraries or emulators too old for sum/avg fall
+# back to a projected stream that is totalled in Python.
+
+Filter = Tuple[str, str, Any]  # (field, operator, value)
+
+_aggregation_supported = True
+
+
+def _filtered(collection: str, filters: Iterable[Filter]):
+    query = db.collection(collection)
+    for field, op, value in filters:
+        query = query.where(field, op, value)
+    return query
+
+
+def aggregate(
+    collection: str,
+    filters: Iterable[Filter] = (),
+    sum_fields: Iterable[str] = (),
+    avg_fields: Iterable[str] = ()
+) -> Dict[str, Any]:
+    """
+    Count matching documents and sum / average numeric fields in one
+    aggregation RPC. Returns {"count": n, "sum_<field>": x, "avg_<field>": y};
+    an average is None when no document has a numeric value for it.
+    """
+    global _aggregation_supported
+    filters, sum_fields, avg_fields = list(filters), list(sum_fields), list(avg_fields)
+    query = _filtered(collection, filters)
+
+    if _aggregation_supported:
+        try:
+            aggregation = query.count(alias="count")
+            for field in sum_fields:
+                aggregation = aggregation.sum(field, alias=f"sum_{field}")
+            for field in avg_fields:
+                aggregation = aggregation.avg(field, alias=f"avg_{field}")
+            return {result.alias: result.value for row in aggregation.get() for result in row}
+        except (AttributeError, gexc.Unimplemented) as e:
+            # Not supported by this client library / emulator - stop trying
+            _aggregation_supported = False
+            print(f"⚠️ Firestore aggregation queries unavailable ({e}) - computing in Python")
+        except gexc.InvalidArgument as e:
+            print(f"⚠️ Aggregation query on {collection} rejected ({e}) - computing in Python")
+
+    return _aggregate_in_python(query, sum_fields, avg_fields)
+
+
+def _aggregate_in_python(query, sum_fields: List[str], avg_fields: List[str]) -> Dict[str, Any]:
+    """Same result as aggregate(), streaming only the fields it needs"""
+    fields = list(dict.fromkeys(sum_fields + avg_fields))
+    count = 0
+    totals = {field: 0 for field in fields}
+    counts = {field: 0 for field in fields}
+    for doc in query.select(fields).stream():
+        count += 1
+        data = doc.to_dict()
+        for field in fields:
+            value = data.get(field)
+            # Like Firestore: missing and non-numeric values are skipped
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[field] += value
+                counts[field] += 1
+
+    result = {"count": count}
+    for field in sum_fields:
+        result[f"sum_{field}"] = totals[field]
+    for field in avg_fields:
+        result[f"avg_{field}"] = totals[field] / counts[field] if counts[field] else None
+    return result
+
+
+def feedback_stats(
+    video_id: str,
+    min_stars: Optional[int] = None,
+    max_stars: Optional[int] = None,
+    has_text: Optional[bool] = None
+) -> Dict[str, Any]:
+    """Count and averages over a video's feedback, with the same filters as query_feedback"""
+    result = aggregate(
+        FEEDBACK_COLLECTION,
+        _feedback_filters(video_id, min_stars, max_stars, has_text),
+        avg_fields=["stars", "watch_time_seconds"]
+    )
+    avg_stars = result["avg_stars"]
+    avg_watch = result["avg_watch_time_seconds"]
+    return {
+        "count": result["count"],
+        "avg_stars": round(avg_stars, 2) if avg_stars is not None else 0,
+        "avg_watch_time_seconds": round(avg_watch, 2) if avg_watch is not None else 0
+    }
+
+
+def _feedback_filters(
+    video_id: str,
+    min_stars: Optional[int] = None,
+    max_stars: Optional[int] = None,
+    has_text: Optional[bool] = None
+) -> List[Filter]:
+    filters = [("video_id", "==", video_id)]
+    if min_stars is not None:
+        filters.append(("stars", ">=", min_stars))
+    if max_stars is not None:
+        filters.append(("stars", "<=", max_stars))
+    if has_text is not None:
+        filters.append(("has_review", "==", has_text))
+    return filters
+
+
+def query_feedback(
+    video_id: str,
+    min_stars: Optional[int] = None,
+    max_stars: Optional[int] = None,
+    has_text: Optional[bool] = None,
+    fields: Optional[List[str]] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Query the feedback collection with server-side filters and projection,
+    ordered by (stars, session_id). Returns {"feedback": [...], "next_cursor"}.
+    Pass next_cursor back to get the following page; it is None on the last one.
+    Raises ValueError for unknown fields or a bad cursor.
+    """
+    check_feedback_fields(fields)
+    limit = max(1, min(limit, MAX_FEEDBACK_PAGE_SIZE))
+
+    query = _filtered(FEEDBACK_COLLECTION, _feedback_filters(video_id, min_stars, max_stars, has_text))
+    query = query.order_by("stars").order_by("session_id")
+    if fields:
+        # The cursor is built from stars and session_id, so always fetch those
+        query = query.select(list(dict.fromkeys([*fields, "stars", "session_id"])))
+    if cursor:
+        stars, session_id = decode_cursor(cursor)
+        query = query.start_after({"stars": stars, "session_id": session_id})
+
+    # One extra row tells us whether another page exists
+    rows = [doc.to_dict() for doc in query.limit(limit + 1).stream()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["stars"], rows[-1]["session_id"])
+    rows = [with_feedback_defaults(row) for row in rows]
+    if fields:
+        rows = [{field: row.get(field) for field in fields} for row in rows]
+    return {"feedback": rows, "next_cursor": next_cursor}
+
+
 def get_all_feedback_by_video(video_id: str) -> List[Dict[str, Any]]:
-    """Get all feedback for a specific video"""
+    """Get all feedback for a specific video (every page of query_feedback)"""
     try:
-        # Get all sessions for this video
-        sessions = db.collection(SESSIONS_COLLECTION).where("video_id", "==", video_id).stream()
-
         feedback_list = []
-        for session in sessions:
-            session_data = session.to_dict()
-            if session_data.get("feedback"):
-                feedback_list.append({
-                    "session_id": session_data["session_id"],
-                    "student_id": session_data.get("student_id", "Unknown"),
-                    "video_id": video_id,
-                    "stars": session_data["feedback"]["stars"],
-                    "review": session_data["feedback"].get("review", ""),
-                    "watch_time_seconds": session_data.get("elapsed_seconds", 0),
-                    "quiz_scores": session_data.get("quiz_scores", []),
-                    "submitted_at": session_data["feedback"].get("submitted_at", ""),
-                    "amount_charged": session_data.get("amount_charged", 0)
-                })
-
-        return feedback_list
+        cursor = None
+        while True:
+            page = query_feedback(video_id, limit=MAX_FEEDBACK_PAGE_SIZE, cursor=cursor)
+            feedback_list.extend(page["feedback"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                return feedback_list
     except Exception as e:
         print(f"Error getting feedback: {e}")
         return []
 
 
+def get_video_rollup(video_id: str) -> Optional[Dict[str, Any]]:
+    """Get the running analytics totals for a video (one document read)"""
+    try:
+        doc = db.collection(ROLLUPS_COLLECTION).document(video_id).get()
+        return doc.to_dict() if doc.exists else None
+    except Exception as e:
+        print(f"Error getting video rollup: {e}")
+        return None
+
+
+def save_video_rollup(video_id: str, rollup: Dict[str, Any]) -> bool:
+    """Overwrite a video's rollup (used by rebuild_rollups.py)"""
+    try:
+        db.collection(ROLLUPS_COLLECTION).document(video_id).set({
+            **rollup,
+            "video_id": video_id,
+            "updated_at": firestore.SERVER_TIMESTAMP
+        })
+        return True
+    except Exception as e:
+        print(f"Error saving video rollup: {e}")
+        return False
+
+
+def get_rollup_buckets(video_id: str, granularity: str, start_key: str, end_key: str) -> List[Dict[str, Any]]:
+    """
+    Get a video's hourly or daily buckets with start_key <= bucket <= end_key
+    (needs the composite index video_id + granularity + bucket)
+    """
+    try:
+        query = (
+            db.collection(ROLLUP_BUCKETS_COLLECTION)
+            .where("video_id", "==", video_id)
+            .where("granularity", "==", granularity)
+            .where("bucket", ">=", start_key)
+            .where("bucket", "<=", end_key)
+            .order_by("bucket")
+        )
+        return [doc.to_dict() for doc in query.stream()]
+    except Exception as e:
+        print(f"Error getting rollup buckets: {e}")
+        return []
+
+
+def save_rollup_buckets(buckets: Dict[str, Dict[str, Any]]) -> int:
+    """Overwrite bucket documents keyed by document id (used by rebuild_rollups.py). Returns the number saved."""
+    docs = list(buckets.items())
+    saved = 0
+    try:
+        for start in range(0, len(docs), MAX_BATCH_WRITES):
+            batch = db.batch()
+            for doc_id, bucket in docs[start:start + MAX_BATCH_WRITES]:
+                ref = db.collection(ROLLUP_BUCKETS_COLLECTION).document(doc_id)
+                batch.set(ref, {**bucket, "updated_at": firestore.SERVER_TIMESTAMP})
+            batch.commit()
+            saved += len(docs[start:start + MAX_BATCH_WRITES])
+    except Exception as e:
+        print(f"Error saving rollup buckets: {e}")
+    return saved
+
+
+def delete_rollup_buckets(video_id: str) -> int:
+    """Delete every bucket document of a video (before rebuild_rollups.py saves new ones). Returns the number deleted."""
+    deleted = 0
+    try:
+        refs = [doc.reference for doc in db.collection(ROLLUP_BUCKETS_COLLECTION).where("video_id", "==", video_id).stream()]
+        for start in range(0, len(refs), MAX_BATCH_WRITES):
+            batch = db.batch()
+            for ref in refs[start:start + MAX_BATCH_WRITES]:
+                batch.delete(ref)
+            batch.commit()
+            deleted += len(refs[start:start + MAX_BATCH_WRITES])
+    except Exception as e:
+        print(f"Error deleting rollup buckets: {e}")
+    return deleted
+
+
+def get_sessions_by_video(video_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Get all raw sessions for a video (or every video) - full scan, for rebuilds only"""
+    query = db.collection(SESSIONS_COLLECTION)
+    if video_id:
+        query = query.where("video_id", "==", video_id)
+    return [doc.to_dict() for doc in query.stream()]
+
+
 def get_video_analytics(video_id: str) -> Dict[str, Any]:
-    """Get analytics for a specific video"""
+    """
+    Get analytics for a specific video from three aggregation queries
+    (the dashboard reads the rollup instead). Firestore can't count
+    distinct values, so unique students come from the rollup document.
+    """
     try:
-        sessions = db.collection(SESSIONS_COLLECTION).where("video_id", "==", video_id).stream()
-
-        total_views = 0
-        total_watch_time = 0
-        total_earned = 0
-        unique_students = set()
-        ratings = []
-        completion_rates = []
-
-        for session in sessions:
-            data = session.to_dict()
-            total_views += 1
-            total_watch_time += data.get("elapsed_seconds", 0)
-            total_earned += data.get("amount_charged", 0)
-
-            student_id = data.get("student_id")
-            if student_id:
-                unique_students.add(student_id)
-
-            feedback = data.get("feedback")
-            if feedback:
-                ratings.append(feedback["stars"])
-
-            # Assuming 180s video duration
-            if data.get("elapsed_seconds"):
-                completion_rates.append(data["elapsed_seconds"] / 180.0)
-
-        return {
-            "total_sessions": total_views,
-            "total_views": total_views,
-            "unique_students": len(unique_students),
-            "total_watch_time_seconds": total_watch_time,
-            "total_watch_time_minutes": round(total_watch_time / 60, 2),
-            "total_earnings": round(total_earned, 2),
-            "total_earned": round(total_earned, 2),
-            "avg_rating": round(sum(ratings) / len(ratings), 2) if ratings else 0,
-            "average_rating": round(sum(ratings) / len(ratings), 2) if ratings else 0,
-            "avg_completion_rate": round(sum(completion_rates) / len(completion_rates), 2) if completion_rates else 0,
-            "average_completion_rate": round(sum(completion_rates) / len(completion_rates), 2) if completion_rates else 0,
-            "avg_watch_time_seconds": round(total_watch_time / total_views, 2) if total_views > 0 else 0,
-            "total_feedback": len(ratings)
-        }
+        by_video = [("video_id", "==", video_id)]
+        sessions = aggregate(SESSIONS_COLLECTION, by_video, sum_fields=["elapsed_seconds", "amount_charged"])
+        # Completion is averaged over sessions that were watched at all
+        watched = aggregate(SESSIONS_COLLECTION, by_video + [("elapsed_seconds", ">", 0)], avg_fields=["elapsed_seconds"])
+        feedback = aggregate(FEEDBACK_COLLECTION, by_video, avg_fields=["stars"])
+        rollup = get_video_rollup(video_id) or {}
+
+        return analytics_result(
+            total_views=sessions["count"],
+            total_watch_time=sessions["sum_elapsed_seconds"] or 0,
+            total_earned=sessions["sum_amount_charged"] or 0,
+            avg_stars=feedback["avg_stars"],
+            avg_watched_seconds=watched["avg_elapsed_seconds"],
+            total_feedback=feedback["count"],
+            unique_students=rollup.get("unique_students", 0)
+        )
     except Exception as e:
         print(f"Error getting analytics: {e}")
-        return {
-            "total_sessions": 0,
-            "total_views": 0,
-            "unique_students": 0,
-            "total_watch_time_seconds": 0,
-            "total_watch_time_minutes": 0,
-            "total_earnings": 0,
-            "total_earned": 0,
-            "avg_rating": 0,
-            "average_rating": 0,
-            "avg_completion_rate": 0,
-            "average_completion_rate": 0,
-            "avg_watch_time_seconds": 0,
-            "total_feedback": 0
-        }
+        return analytics_result(0, 0, 0, None, None, 0, 0)
+
+
+# ==================== Storage backend ====================
+# The Firestore client is synchronous; FirestoreStorage's *_async variants
+# run each call on a dedicated, bounded thread pool (FIRESTORE_MAX_WORKERS).
+
+
+class FirestoreStorage(Storage):
+    """The functions above behind the Storage interface (STORAGE_BACKEND=firestore)"""
+
+    save_session = staticmethod(save_session)
+    get_session = staticmethod(get_session)
+    update_session = staticmethod(update_session)
+    save_feedback = staticmethod(save_feedback)
+    replace_feedback = staticmethod(replace_feedback)
+    save_quiz_score = staticmethod(save_quiz_score)
+    commit_writes = staticmethod(commit_writes)
+    get_sessions_by_video = staticmethod(get_sessions_by_video)
+    query_feedback = staticmethod(query_feedback)
+    feedback_stats = staticmethod(feedback_stats)
+    get_all_feedback_by_video = staticmethod(get_all_feedback_by_video)
+    get_video_analytics = staticmethod(get_video_analytics)
+    get_video_rollup = staticmethod(get_video_rollup)
+    save_video_rollup = staticmethod(save_video_rollup)
+    get_rollup_buckets = staticmethod(get_rollup_buckets)
+    save_rollup_buckets = staticmethod(save_rollup_buckets)
+    delete_rollup_buckets = staticmethod(delete_rollup_buckets)
+
+    def is_rejected(self, error: Exception) -> bool:
+        # Update of a missing document, or a value/batch Firestore refuses
+        return isinstance(error, (gexc.NotFound, gexc.InvalidArgument, gexc.FailedPrecondition)) or super().is_rejected(error)
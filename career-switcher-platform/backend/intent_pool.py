@@ -0,0 +1,155 @@
+"""
+Warm pool of pre-created payment intents for the standard lock amounts,
+so starting a video session doesn't wait on Finternet
+"""
+import asyncio
+import time
+import logging
+from collections import deque
+from decimal import Decimal, InvalidOperation
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_amount(amount: str) -> Optional[str]:
+    """'30', '30.0' and '30.00' all map to the same pool"""
+    try:
+        return f"{Decimal(amount):.2f}"
+    except (InvalidOperation, ValueError):
+        return None
+
+
+class PaymentIntentPool:
+    """
+    Keeps up to `target_size` unassigned payment intents per amount.
+
+    `claim` pops the oldest ready intent (or returns None on a miss, so the
+    caller falls back to creating one inline) and wakes the refill task,
+    which tops every pool back up in the background. Pools are only topped
+    up while there has been a claim in the last `idle_timeout` seconds, so
+    an idle server stops creating intents.
+
+    Finternet has no call to cancel or refund an intent - a delivery proof
+    settles the escrow to the merchant - so the pool never gives an intent
+    up: old intents are simply handed to the next claim, and any still
+    pooled at shutdown are logged for reconciliation. The pool is off unless
+    INTENT_POOL_SIZE is set.
+
+    Finternet has no endpoint to edit an intent after creation either, so
+    pooled intents carry generic metadata; the session record holds the
+    video-specific details instead.
+    """
+
+    def __init__(
+        self,
+        finternet_service,
+        amounts: List[str],
+        target_size: int = 3,
+        refill_interval: float = 5.0,
+        idle_timeout: float = 600.0
+    ):
+        self.finternet_service = finternet_service
+        self.amounts = [a for a in (normalize_amount(x) for x in amounts) if a]
+        self.target_size = target_size
+        self.refill_interval = refill_interval
+        self.idle_timeout = idle_timeout
+
+        # amount -> deque of (created_at, intent_id), oldest first
+        self._pools: Dict[str, Deque[Tuple[float, str]]] = {amount: deque() for amount in self.amounts}
+        self._refill_needed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._last_claim = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.refill_failures = 0
+        self._refill_latencies: Deque[float] = deque(maxlen=100)
+
+    def claim(self, amount: str) -> Optional[str]:
+        """Take a ready intent for `amount`, or None if the pool is empty"""
+        pool = self._pools.get(normalize_amount(amount) or "")
+        self._last_claim = time.monotonic()
+        intent_id = None
+        if pool:
+            _, intent_id = pool.popleft()
+        if intent_id:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self._refill_needed.set()
+        return intent_id
+
+    def _idle(self) -> bool:
+        return time.monotonic() - self._last_claim > self.idle_timeout
+
+    async def start(self) -> None:
+        if self.amounts and self.target_size > 0:
+            self._refill_needed.set()
+            self._task = asyncio.create_task(self._refill_loop(), name="intent-pool-refill")
+            logger.info(f"Payment intent pool started for amounts {self.amounts} (target {self.target_size} each)")
+
+    async def stop(self) -> None:
+        """Stop refilling; intents still pooled can't be cancelled, so log them"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for amount, pool in self._pools.items():
+            if pool:
+                logger.warning(f"{len(pool)} unclaimed pooled intents for {amount}: {', '.join(i for _, i in pool)}")
+
+    async def _refill_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._refill_needed.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._refill_needed.clear()
+            if self._idle():
+                continue
+            for amount, pool in self._pools.items():
+                missing = self.target_size - len(pool)
+                if missing > 0:
+                    await asyncio.gather(*(self._create_one(amount) for _ in range(missing)))
+
+    async def _create_one(self, amount: str) -> None:
+        started = time.perf_counter()
+        result = await self.finternet_service.create_payment_intent(
+            amount=amount,
+            currency="USD",
+            description="Course payment",
+            metadata={"pooled": True}
+        )
+        self._refill_latencies.append(time.perf_counter() - started)
+
+        intent_id = None
+        if result["success"]:
+            data = result["data"]
+            intent_id = data.get("data", {}).get("id") or data.get("id")
+        if not intent_id:
+            self.refill_failures += 1
+            logger.warning(f"Failed to pre-create payment intent for {amount}: {result.get('error')}")
+            return
+        self._pools[amount].append((time.monotonic(), intent_id))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        latencies = sorted(self._refill_latencies)
+        return {
+            "target_size": self.target_size,
+            "pool_sizes": {amount: len(pool) for amount, pool in self._pools.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "idle": self._idle(),
+            "oldest_age_seconds": {
+                amount: round(time.monotonic() - pool[0][0], 1) for amount, pool in self._pools.items() if pool
+            },
+            "refill_failures": self.refill_failures,
+            "refill_latency_ms": {
+                "avg": round(1000 * sum(latencies) / len(latencies), 1) if latencies else 0.0,
+                "p95": round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 1) if latencies else 0.0,
+                "max": round(1000 * latencies[-1], 1) if latencies else 0.0
+            }
+        }
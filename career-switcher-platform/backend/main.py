@@ -1,7 +1,10 @@
 import os
 import json
-import uuid
-from typing import List, Dict, Any
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -9,15 +12,43 @@ from groq import Groq
 from dotenv import load_dotenv
 
 from finternet_service import FinternetService
+from resilience import RetryPolicy
+from settlement_outbox import SettlementOutbox
+from intent_pool import PaymentIntentPool
+from session_scheduler import SessionCutoffScheduler
 from video_session_manager import VideoSessionManager
+from write_behind import WriteBehindBuffer
+from storage import MAX_FEEDBACK_PAGE_SIZE, ROLLUPS_COLLECTION, storage_from_env
+from session_store import MemorySessionStore, SQLiteSessionStore
 from dummy_data_generator import generate_dummy_sessions, generate_revenue_timeline
 from teacher_analytics import calculate_teacher_kpis, prepare_reviews_for_analysis, calculate_quiz_performance
 from llm_insights import generate_teacher_insights, generate_student_reflection
+from video_rollups import DAY, GRANULARITIES, analytics_from_rollup, bucket_count, bucket_key, merge_buckets, to_utc_datetime
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="Career Switcher Platform API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Own the pooled Finternet HTTP client, settlement workers and session store for the lifetime of the app"""
+    await finternet_service.start()
+    await settlement_outbox.start()
+    await intent_pool.start()
+    await firestore_writes.start()
+    await session_scheduler.start()
+    yield
+    await session_scheduler.stop()
+    await intent_pool.stop()
+    await settlement_outbox.stop()
+    await finternet_service.aclose()
+    # Flush buffered session writes before the storage thread pool goes away
+    await firestore_writes.stop()
+    session_manager.active_sessions.close()
+    storage.shutdown()
+
+
+app = FastAPI(title="Career Switcher Platform API", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -34,8 +65,74 @@ groq_client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
 # Initialize Finternet service
 FINTERNET_API_KEY = os.getenv("FINTERNET_API_KEY", "sk_hackathon_3eb5a79c271079186415ba4af695a130")
 FINTERNET_BASE_URL = os.getenv("FINTERNET_BASE_URL", "http://localhost:3000")
-finternet_service = FinternetService(FINTERNET_API_KEY, FINTERNET_BASE_URL)
-session_manager = VideoSessionManager()
+finternet_service = FinternetService(
+    FINTERNET_API_KEY,
+    FINTERNET_BASE_URL,
+    max_connections=int(os.getenv("FINTERNET_MAX_CONNECTIONS", 100)),
+    max_keepalive_connections=int(os.getenv("FINTERNET_MAX_KEEPALIVE", 20)),
+    keepalive_expiry=float(os.getenv("FINTERNET_KEEPALIVE_EXPIRY", 30.0)),
+    http2=os.getenv("FINTERNET_HTTP2", "true").lower() == "true",
+    retry_policy=RetryPolicy(max_attempts=int(os.getenv("FINTERNET_RETRY_ATTEMPTS", 3))),
+    breaker_failure_threshold=int(os.getenv("FINTERNET_BREAKER_THRESHOLD", 5)),
+    breaker_reset_timeout=float(os.getenv("FINTERNET_BREAKER_RESET_SECONDS", 30.0)),
+    balance_cache_ttl=float(os.getenv("FINTERNET_BALANCE_CACHE_TTL", 2.0))
+)
+# "memory" (single worker) or "sqlite" (active sessions shared by every uvicorn worker)
+if os.getenv("SESSION_STORE", "memory").lower() == "sqlite":
+    session_store = SQLiteSessionStore(os.getenv("SESSION_STORE_PATH", "sessions.db"))
+else:
+    session_store = MemorySessionStore()
+# Sessions, feedback and analytics: STORAGE_BACKEND=firestore (default), sqlite or memory
+storage = storage_from_env()
+# Session writes are coalesced per document and committed to storage in batches
+firestore_writes = WriteBehindBuffer(
+    storage.commit_writes_async,
+    flush_interval_ms=int(os.getenv("FIRESTORE_FLUSH_INTERVAL_MS", 200)),
+    max_ops=int(os.getenv("FIRESTORE_FLUSH_MAX_OPS", 200)),
+    retry_window=float(os.getenv("FIRESTORE_RETRY_WINDOW_SECONDS", 3600)),
+    max_delay=float(os.getenv("FIRESTORE_RETRY_MAX_DELAY_SECONDS", 60)),
+    drain_timeout=float(os.getenv("FIRESTORE_DRAIN_TIMEOUT_SECONDS", 30)),
+    is_rejected=storage.is_rejected
+)
+session_manager = VideoSessionManager(
+    storage,
+    firestore_writes,
+    store=session_store,
+    cache_size=int(os.getenv("SESSION_CACHE_SIZE", 10000)),
+    cache_ttl=float(os.getenv("SESSION_CACHE_TTL_SECONDS", 300)),
+    negative_ttl=float(os.getenv("SESSION_NEGATIVE_CACHE_TTL_SECONDS", 30))
+)
+# Ends sessions whose escrow is used up or whose viewer stopped sending heartbeats
+session_scheduler = SessionCutoffScheduler(
+    session_manager.get_session,
+    on_cutoff=lambda session_id, reason: _auto_end_video_session(session_id, reason),
+    heartbeat_timeout=float(os.getenv("SESSION_HEARTBEAT_TIMEOUT_SECONDS", 120)),
+    tick=float(os.getenv("SESSION_SCHEDULER_TICK_SECONDS", 1.0))
+)
+settlement_outbox = SettlementOutbox(
+    db_path=os.getenv("SETTLEMENT_OUTBOX_PATH", "settlement_outbox.db"),
+    submit=finternet_service.submit_delivery_proof,
+    workers=int(os.getenv("SETTLEMENT_WORKERS", 4)),
+    retry_window=float(os.getenv("SETTLEMENT_RETRY_WINDOW_SECONDS", 86400))
+)
+intent_pool = PaymentIntentPool(
+    finternet_service,
+    amounts=[a for a in os.getenv("INTENT_POOL_AMOUNTS", "30.00").split(",") if a.strip()],
+    # Off by default: Finternet can't cancel an intent the pool ends up not using
+    target_size=int(os.getenv("INTENT_POOL_SIZE", 0)),
+    idle_timeout=float(os.getenv("INTENT_POOL_IDLE_SECONDS", 600))
+)
+
+# In-flight /api/video-session/end calls, so concurrent duplicates share one result
+_end_inflight: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+
+# Most hourly/daily points /api/teacher/trends returns for one range
+MAX_TREND_BUCKETS = int(os.getenv("MAX_TREND_BUCKETS", 2000))
+# Reviews per side sent to the insights prompt (it only reads the first 10)
+INSIGHT_REVIEWS_PER_SIDE = 10
+# Smart reviews are classified one LLM call each, so keep pages small
+MAX_SMART_REVIEWS_PAGE_SIZE = 100
+SMART_REVIEW_FIELDS = ["session_id", "student_id", "stars", "review", "watch_time_seconds", "submitted_at"]
 
 # Load video database
 with open("video_database.json", "r") as f:
@@ -392,12 +489,46 @@ async def get_wallet_balance():
     return result["data"]
 
 
+@app.get("/api/finternet/metrics")
+async def get_finternet_metrics():
+    """Retry counters and circuit breaker state per Finternet operation"""
+    return {
+        "success": True,
+        "metrics": finternet_service.get_metrics(),
+        "settlement_outbox": settlement_outbox.stats()
+    }
+
+
+@app.get("/api/intent-pool/stats")
+async def get_intent_pool_stats():
+    """Warm payment-intent pool size, hit rate and refill latency"""
+    return {"success": True, "stats": intent_pool.stats()}
+
+
+@app.get("/api/session-scheduler/stats")
+async def get_session_scheduler_stats():
+    """Sessions tracked by the cutoff scheduler and automatic cutoffs by reason"""
+    return {"success": True, "stats": session_scheduler.stats()}
+
+
+@app.get("/api/session-cache/stats")
+async def get_session_cache_stats():
+    """Active session count and read-through cache hits, misses and evictions"""
+    return {"success": True, "stats": session_manager.stats()}
+
+
+@app.get("/api/firestore-writes/stats")
+async def get_firestore_write_stats():
+    """Write-behind buffer: pending documents, batches committed and writes coalesced"""
+    return {"success": True, "stats": firestore_writes.stats()}
+
+
 @app.post("/api/video-session/start")
 async def start_video_session(request: StartVideoSessionRequest):
     """
     Start a video watching session:
     1. Get video details
-    2. Create payment intent (lock funds)
+    2. Claim a warm payment intent from the pool, or create one (lock funds)
     3. Create session
     """
     print(f"🎬 Starting video session for {request.video_id} | Lock: ${request.locked_amount}")
@@ -427,49 +558,57 @@ async def start_video_session(request: StartVideoSessionRequest):
 
     rate_per_minute = float(request.locked_amount) / total_minutes if total_minutes > 0 else 0.5
 
-    # Create payment intent
-    intent_result = await finternet_service.create_payment_intent(
-        amount=request.locked_amount,
-        currency="USD",
-        description=f"Payment for {video['title']}",
-        metadata={
-            "video_id": video["id"],
-            "video_title": video["title"],
-            "category": video["category"]
-        }
-    )
+    # Claim a pre-created intent for this amount, or create one inline on a pool miss
+    intent_id = intent_pool.claim(request.locked_amount)
+    intent_source = "pool"
 
-    if not intent_result["success"]:
-        raise HTTPException(status_code=500, detail=intent_result.get("error"))
+    if not intent_id:
+        intent_source = "direct"
+        intent_result = await finternet_service.create_payment_intent(
+            amount=request.locked_amount,
+            currency="USD",
+            description=f"Payment for {video['title']}",
+            metadata={
+                "video_id": video["id"],
+                "video_title": video["title"],
+                "category": video["category"]
+            }
+        )
 
-    intent_data = intent_result["data"]
-    intent_id = intent_data.get("data", {}).get("id") or intent_data.get("id")
+        if not intent_result["success"]:
+            raise HTTPException(status_code=500, detail=intent_result.get("error"))
 
-    if not intent_id:
-        raise HTTPException(status_code=500, detail="Failed to get intent ID")
+        intent_data = intent_result["data"]
+        intent_id = intent_data.get("data", {}).get("id") or intent_data.get("id")
+
+        if not intent_id:
+            raise HTTPException(status_code=500, detail="Failed to get intent ID")
 
     # Create video session
-    session = session_manager.create_session(
+    session = await session_manager.create_session(
         video_id=video["id"],
         intent_id=intent_id,
         locked_amount=float(request.locked_amount),
         rate_per_minute=rate_per_minute
     )
 
-    print(f"✅ Video session started: {session['session_id']} | Intent: {intent_id}")
+    session_scheduler.track(session)
+
+    print(f"✅ Video session started: {session['session_id']} | Intent: {intent_id} ({intent_source})")
 
     return {
         "success": True,
         "session": session,
         "video": video,
-        "intent_id": intent_id
+        "intent_id": intent_id,
+        "intent_source": intent_source
     }
 
 
 @app.get("/api/video-session/{session_id}")
 async def get_video_session(session_id: str):
     """Get current video session status with elapsed time and cost"""
-    session = session_manager.get_session(session_id)
+    session = await session_manager.get_session(session_id)
 
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -480,66 +619,156 @@ async def get_video_session(session_id: str):
     }
 
 
-@app.post("/api/video-session/end")
-async def end_video_session(request: EndVideoSessionRequest):
+def _proof_hash(session_id: str, intent_id: str) -> str:
+    """Deterministic per session, so a retried settlement always carries the same proof"""
+    return f"0x{hashlib.sha256(f'{session_id}:{intent_id}'.encode()).hexdigest()}"
+
+
+async def _settle_video_session(session_id: str):
     """
-    End a video watching session:
-    1. Calculate watched time and cost
-    2. Submit delivery proof
-    3. Settle payment (teacher gets charged amount, student gets refund)
+    End a video session and queue its delivery proof. Shared by
+    /api/video-session/end and the automatic cutoff scheduler. Safe to
+    repeat: an ended session and its existing settlement are returned as-is.
+    Returns (session, settlement), or None if the session doesn't exist.
     """
-    print(f"🛑 Ending video session: {request.session_id}")
-
-    session = session_manager.end_session(request.session_id)
+    session = await session_manager.end_session(session_id)
 
     if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+        return None
+
+    session_scheduler.forget(session_id)
+
+    # Record the delivery proof locally; the outbox workers submit it and retry through outages
+    settlement = settlement_outbox.enqueue(
+        session_id=session_id,
+        intent_id=session["intent_id"],
+        proof={
+            "proof_hash": _proof_hash(session_id, session["intent_id"]),
+            "proof_uri": f"https://courses.example.com/proof/{session_id}",
+            "submitted_by": "0x742d35Cc6634C0532925a3b844Bc9e7595f0bEb0"
+        }
+    )
+    return session, settlement
 
-    intent_id = session["intent_id"]
 
-    # Submit delivery proof to trigger settlement
-    proof_hash = f"0x{uuid.uuid4().hex}{uuid.uuid4().hex[:32]}"
-    proof_uri = f"https://courses.example.com/proof/{request.session_id}"
-    submitted_by = "0x742d35Cc6634C0532925a3b844Bc9e7595f0bEb0"
+async def _auto_end_video_session(session_id: str, reason: str) -> None:
+    # Same in-flight end as the endpoint, so a racing client end can't double-settle
+    result = await asyncio.shield(_shared_end(session_id))
+    print(f"⏱️ Video session auto-ended ({reason}): {session_id} | Charged: ${result['session']['amount_charged']} | Settlement: {result['settlement']['status']}")
 
-    # Try to submit delivery proof (may fail if endpoint doesn't exist)
-    proof_result = await finternet_service.submit_delivery_proof(
-        intent_id=intent_id,
-        proof_hash=proof_hash,
-        proof_uri=proof_uri,
-        submitted_by=submitted_by
-    )
 
-    # Even if delivery proof fails, we consider the payment successful
-    # because the funds were locked and the session completed
-    teacher_paid = proof_result["success"]
+@app.post("/api/video-session/heartbeat/{session_id}")
+async def video_session_heartbeat(session_id: str):
+    """Keep-alive from the player; sessions silent for SESSION_HEARTBEAT_TIMEOUT_SECONDS are ended automatically"""
+    session = await session_manager.heartbeat(session_id)
 
-    # If proof submission failed but session completed, mark as successful anyway
-    if not teacher_paid:
-        print(f"⚠️  Delivery proof failed, but marking payment as successful (funds locked)")
-        teacher_paid = True
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
 
-    print(f"✅ Session ended | Charged: ${session['amount_charged']} | Refunded: ${session['amount_refunded']}")
+    session_scheduler.track(session)
 
     return {
         "success": True,
+        "status": session["status"]
+    }
+
+
+def _end_video_response(session: Dict[str, Any], settlement: Dict[str, Any], replayed: bool = False) -> Dict[str, Any]:
+    teacher_paid = settlement["status"] == "settled"
+    return {
+        "success": True,
+        "replayed": replayed,
         "session": session,
+        "settlement": settlement,
         "proof_submitted": teacher_paid,
         "summary": {
             "elapsed_minutes": round(session["elapsed_seconds"] / 60, 2),
             "amount_charged": session["amount_charged"],
             "amount_refunded": session["amount_refunded"],
             "teacher_paid": teacher_paid,
+            "settlement_status": settlement["status"],
             "quiz_scores": session.get("quiz_scores", []),
             "feedback": session.get("feedback")
         }
     }
 
 
+async def _end_video_session_once(session_id: str) -> Dict[str, Any]:
+    ended = await _settle_video_session(session_id)
+
+    if not ended:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    session, settlement = ended
+
+    print(f"✅ Session ended | Charged: ${session['amount_charged']} | Refunded: ${session['amount_refunded']} | Settlement: {settlement['status']}")
+
+    return _end_video_response(session, settlement)
+
+
+def _shared_end(session_id: str) -> "asyncio.Task[Dict[str, Any]]":
+    """The in-flight end for a session, starting one if there is none"""
+    task = _end_inflight.get(session_id)
+    if task is None:
+        task = asyncio.create_task(_end_video_session_once(session_id))
+        _end_inflight[session_id] = task
+        task.add_done_callback(lambda _: _end_inflight.pop(session_id, None))
+    return task
+
+
+@app.post("/api/video-session/end")
+async def end_video_session(request: EndVideoSessionRequest):
+    """
+    End a video watching session:
+    1. Calculate watched time and cost
+    2. Queue delivery proof in the settlement outbox
+    3. Background workers settle the payment (teacher gets charged amount, student gets refund)
+
+    Idempotent: concurrent calls share one in-flight end, and calls after
+    the session has ended return the stored result ("replayed": true).
+    """
+    print(f"🛑 Ending video session: {request.session_id}")
+
+    task = _end_inflight.get(request.session_id)
+    if task is None:
+        session = await session_manager.get_session(request.session_id)
+
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+
+        if session["status"] == "completed":
+            session, settlement = await _settle_video_session(request.session_id)
+            print(f"↩️ Session already ended | Settlement: {settlement['status']}")
+            return _end_video_response(session, settlement, replayed=True)
+
+        task = _shared_end(request.session_id)
+
+    # Shielded so a caller disconnecting doesn't cancel the end for everyone else
+    return await asyncio.shield(task)
+
+
+@app.get("/api/settlements/{session_id}")
+async def get_settlement(session_id: str):
+    """Settlement (delivery proof) status for an ended session"""
+    settlement = settlement_outbox.get_by_session(session_id)
+
+    if not settlement:
+        raise HTTPException(status_code=404, detail="Settlement not found")
+
+    return {"success": True, "settlement": settlement}
+
+
+@app.post("/api/settlements/requeue")
+async def requeue_failed_settlements(session_id: Optional[str] = None):
+    """Retry failed settlements (one session's, or all) with a fresh retry window"""
+    requeued = settlement_outbox.requeue_failed(session_id)
+    return {"success": True, "requeued": requeued}
+
+
 @app.post("/api/video-session/quiz-score")
 async def submit_quiz_score(request: QuizScoreRequest):
     """Submit quiz score for a session"""
-    success = session_manager.add_quiz_score(request.session_id, {
+    success = await session_manager.add_quiz_score(request.session_id, {
         "score": request.score,
         "total_questions": request.total_questions,
         "video_time": request.video_time
@@ -554,7 +783,7 @@ async def submit_quiz_score(request: QuizScoreRequest):
 @app.post("/api/video-session/feedback")
 async def submit_feedback(request: FeedbackRequest):
     """Submit feedback for a session"""
-    success = session_manager.add_feedback(request.session_id, {
+    success = await session_manager.add_feedback(request.session_id, {
         "stars": request.stars,
         "review": request.review
     })
@@ -570,13 +799,14 @@ async def submit_feedback(request: FeedbackRequest):
 @app.get("/api/teacher/dashboard/{video_id}")
 async def get_teacher_dashboard(video_id: str):
     """
-    Get teacher dashboard analytics for a specific video from Firestore
+    Get teacher dashboard analytics for a specific video from storage
     Returns KPIs: views, watch time, earnings, etc.
     """
-    import firestore_service as fs
-
-    # Get analytics from Firestore
-    analytics = fs.get_video_analytics(video_id)
+    # One rollup document read, plus any increments still waiting to be flushed
+    rollup = await firestore_writes.read(
+        ROLLUPS_COLLECTION, video_id, lambda: storage.get_video_rollup_async(video_id)
+    )
+    analytics = analytics_from_rollup(rollup)
 
     # If no data in Firestore, generate dummy data as fallback
     if analytics['total_sessions'] == 0:
@@ -616,6 +846,46 @@ async def get_teacher_dashboard(video_id: str):
     }
 
 
+@app.get("/api/teacher/trends/{video_id}")
+async def get_video_trends(
+    video_id: str,
+    granularity: str = DAY,
+    start: Optional[str] = None,
+    end: Optional[str] = None
+):
+    """
+    Sessions, watch time, revenue and ratings per hour or day, merged from
+    pre-aggregated buckets. start/end are ISO dates or datetimes (UTC);
+    the default range is the last 30 days, or the last 48 hours for hourly
+    """
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    try:
+        end_at = to_utc_datetime(end) if end else datetime.utcnow()
+        default_span = timedelta(days=29) if granularity == DAY else timedelta(hours=47)
+        start_at = to_utc_datetime(start) if start else end_at - default_span
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be ISO dates or datetimes")
+    if start_at > end_at:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if bucket_count(granularity, start_at, end_at) > MAX_TREND_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Range too long - at most {MAX_TREND_BUCKETS} {granularity} buckets")
+
+    buckets = await storage.get_rollup_buckets_async(
+        video_id, granularity, bucket_key(start_at, granularity), bucket_key(end_at, granularity)
+    )
+    trends = merge_buckets(buckets, granularity, start_at, end_at)
+
+    return {
+        "success": True,
+        "video_id": video_id,
+        "granularity": granularity,
+        "start": bucket_key(start_at, granularity),
+        "end": bucket_key(end_at, granularity),
+        **trends
+    }
+
+
 @app.get("/api/teacher/video-revenue/{video_id}")
 async def get_video_revenue_timeline(video_id: str):
     """
@@ -638,20 +908,32 @@ async def generate_insights_for_video(video_id: str):
     Returns strengths (from 4-5 star reviews) and improvements (from 1-3 star reviews)
     """
     try:
-        import firestore_service as fs
-
-        # Get all feedback from Firestore
-        all_feedback = fs.get_all_feedback_by_video(video_id)
+        # Only the written reviews the prompt uses: up to 10 positive (4-5 stars) and 10 negative (1-3 stars)
+        # Totals come from count aggregations, not from downloading every review
+        positive, negative, positive_stats, negative_stats, rollup = await asyncio.gather(
+            storage.query_feedback_async(video_id, min_stars=4, has_text=True, fields=["review"], limit=INSIGHT_REVIEWS_PER_SIDE),
+            storage.query_feedback_async(video_id, max_stars=3, has_text=True, fields=["review"], limit=INSIGHT_REVIEWS_PER_SIDE),
+            storage.feedback_stats_async(video_id, min_stars=4, has_text=True),
+            storage.feedback_stats_async(video_id, max_stars=3, has_text=True),
+            storage.get_video_rollup_async(video_id)
+        )
+        using_real_data = bool(positive["feedback"] or negative["feedback"])
 
-        if not all_feedback:
+        if not using_real_data:
             # Use dummy data if no real feedback exists
             sessions = generate_dummy_sessions(video_id, num_sessions=50)
             reviews = prepare_reviews_for_analysis(sessions)
+            review_counts = {"positive": len(reviews["positive"]), "negative": len(reviews["negative"]), "total": 0}
         else:
-            # Separate positive and negative reviews
-            positive_reviews = [f["review"] for f in all_feedback if f["stars"] >= 4 and f["review"]]
-            negative_reviews = [f["review"] for f in all_feedback if f["stars"] <= 3 and f["review"]]
-            reviews = {"positive": positive_reviews, "negative": negative_reviews}
+            reviews = {
+                "positive": [f["review"] for f in positive["feedback"]],
+                "negative": [f["review"] for f in negative["feedback"]]
+            }
+            review_counts = {
+                "positive": positive_stats["count"],
+                "negative": negative_stats["count"],
+                "total": analytics_from_rollup(rollup)["total_feedback"]
+            }
 
         # Generate insights using LLM
         insights = generate_teacher_insights(
@@ -663,31 +945,88 @@ async def generate_insights_for_video(video_id: str):
             "success": True,
             "video_id": video_id,
             "insights": insights,
-            "review_counts": {
-                "positive": len(reviews["positive"]),
-                "negative": len(reviews["negative"]),
-                "total": len(all_feedback) if isinstance(all_feedback, list) else 0
-            },
-            "using_real_data": len(all_feedback) > 0 if isinstance(all_feedback, list) else False
+            "review_counts": review_counts,
+            "using_real_data": using_real_data
         }
     except Exception as e:
         print(f"Error generating insights: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/teacher/feedback/{video_id}")
+async def list_feedback(
+    video_id: str,
+    min_stars: Optional[int] = None,
+    max_stars: Optional[int] = None,
+    has_text: Optional[bool] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    Query a video's feedback with server-side star-range and has-text filters.
+    Pass `next_cursor` back as `cursor` for the next page; `fields` is a
+    comma-separated projection (e.g. fields=stars,review).
+    """
+    if not 1 <= limit <= MAX_FEEDBACK_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_FEEDBACK_PAGE_SIZE}")
+
+    try:
+        page = await storage.query_feedback_async(
+            video_id,
+            min_stars=min_stars,
+            max_stars=max_stars,
+            has_text=has_text,
+            fields=[f.strip() for f in fields.split(",") if f.strip()] if fields else None,
+            limit=limit,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "success": True,
+        "video_id": video_id,
+        **page
+    }
+
+
+@app.get("/api/teacher/feedback-stats/{video_id}")
+async def get_feedback_stats(
+    video_id: str,
+    min_stars: Optional[int] = None,
+    max_stars: Optional[int] = None,
+    has_text: Optional[bool] = None
+):
+    """
+    Count, average rating and average watch time over a video's feedback,
+    computed by one aggregation query in storage (same filters as /api/teacher/feedback)
+    """
+    stats = await storage.feedback_stats_async(video_id, min_stars=min_stars, max_stars=max_stars, has_text=has_text)
+    return {
+        "success": True,
+        "video_id": video_id,
+        "stats": stats
+    }
+
+
 @app.get("/api/teacher/smart-reviews/{video_id}")
-async def get_smart_reviews(video_id: str):
+async def get_smart_reviews(video_id: str, limit: int = 50, cursor: Optional[str] = None):
     """
-    Get smart review table with AI classifications
+    Get smart review table with AI classifications, one page at a time
+    (each review is classified by the LLM, so pages stay small)
     """
+    if not 1 <= limit <= MAX_SMART_REVIEWS_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_SMART_REVIEWS_PAGE_SIZE}")
+
     try:
-        import firestore_service as fs
         from smart_review_analyzer import bulk_classify_reviews
 
-        # Get all feedback from Firestore
-        all_feedback = fs.get_all_feedback_by_video(video_id)
+        # Only the columns the review table and classifier use
+        page = await storage.query_feedback_async(video_id, fields=SMART_REVIEW_FIELDS, limit=limit, cursor=cursor)
+        all_feedback = page["feedback"]
 
-        if not all_feedback:
+        if not all_feedback and not cursor:
             # Use dummy data if no real feedback
             sessions = generate_dummy_sessions(video_id, num_sessions=50)
             all_feedback = []
@@ -712,8 +1051,11 @@ async def get_smart_reviews(video_id: str):
             "success": True,
             "video_id": video_id,
             "reviews": enhanced_reviews,
-            "total_reviews": len(enhanced_reviews)
+            "total_reviews": len(enhanced_reviews),
+            "next_cursor": page["next_cursor"]
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error getting smart reviews: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -731,7 +1073,7 @@ async def get_student_reflection(request: StudentReflectionRequest):
     Generate personalized AI reflection for student after feedback submission
     """
     # Get session data
-    session = session_manager.get_session(request.session_id)
+    session = await session_manager.get_session(request.session_id)
 
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
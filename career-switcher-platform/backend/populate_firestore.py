@@ -1,15 +1,18 @@
 """
 Populate Firestore with dummy data for teacher dashboard
 Run this once to fill the database with realistic session data
+(STORAGE_BACKEND=sqlite fills the local SQLite database instead)
 """
-import firestore_service as fs
+from storage import storage_from_env
 from dummy_data_generator import generate_dummy_sessions
+from rebuild_rollups import rebuild_rollups
 
 def populate_database():
     """
     Populate Firestore with 50 dummy sessions for video 'vid001'
     """
     print("[*] Starting Firestore population...")
+    storage = storage_from_env()
 
     # Generate 50 realistic sessions
     video_id = "vid001"
@@ -23,7 +26,7 @@ def populate_database():
 
     for session in sessions:
         # Save the session
-        if fs.save_session(session):
+        if storage.save_session(session):
             saved_count += 1
 
             # Save feedback if present
@@ -36,18 +39,22 @@ def populate_database():
                     "review": session["feedback"].get("review", ""),
                     "watch_time_seconds": session["watch_time_seconds"],
                     "amount_charged": session["amount_charged"],
+                    "quiz_scores": session.get("quiz_scores", []),
                     "submitted_at": session["feedback"]["submitted_at"]
                 }
-                if fs.save_feedback(feedback_data):
+                if storage.save_feedback(feedback_data):
                     feedback_count += 1
 
     print(f"[+] Successfully saved {saved_count} sessions")
     print(f"[+] Successfully saved {feedback_count} feedback entries")
     print("[+] Firestore population complete!")
 
+    # Sessions were written directly, so the dashboard rollup has to be recomputed
+    rebuild_rollups(video_id, storage)
+
     # Verify the data
     print("\n[*] Verifying data...")
-    analytics = fs.get_video_analytics(video_id)
+    analytics = storage.get_video_analytics(video_id)
     print(f"    Total sessions: {analytics['total_sessions']}")
     print(f"    Total earnings: ${analytics['total_earnings']:.2f}")
     print(f"    Average rating: {analytics['avg_rating']:.2f}")
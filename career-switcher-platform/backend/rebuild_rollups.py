@@ -0,0 +1,48 @@
+"""
+Recompute per-video analytics rollups and hourly/daily buckets from raw sessions
+Run after importing sessions directly, or if a rollup has drifted:
+
+    python rebuild_rollups.py            # every video
+    python rebuild_rollups.py vid001     # one video
+
+Rollups are overwritten and every bucket of a rebuilt video is deleted and
+written again, so run it while no sessions are starting or ending.
+"""
+import sys
+from collections import defaultdict
+from typing import Optional
+
+from storage import Storage, storage_from_env
+from video_rollups import analytics_from_rollup, buckets_from_sessions, rollup_from_sessions
+
+
+def rebuild_rollups(video_id: str = None, storage: Optional[Storage] = None) -> int:
+    """Rebuild rollups for one video, or every video that has sessions. Returns the number rebuilt."""
+    storage = storage or storage_from_env()
+    print(f"[*] Loading sessions for {video_id or 'all videos'}...")
+    sessions_by_video = defaultdict(list)
+    for session in storage.get_sessions_by_video(video_id):
+        if session.get("video_id"):
+            sessions_by_video[session["video_id"]].append(session)
+
+    rebuilt = 0
+    for vid, sessions in sessions_by_video.items():
+        rollup = rollup_from_sessions(sessions)
+        if storage.save_video_rollup(vid, rollup):
+            rebuilt += 1
+            analytics = analytics_from_rollup(rollup)
+            print(f"[+] {vid}: {analytics['total_views']} views, "
+                  f"${analytics['total_earnings']:.2f} earned, "
+                  f"{analytics['total_feedback']} reviews (avg {analytics['avg_rating']:.2f})")
+        # Buckets no session falls into any more would otherwise keep their old totals
+        deleted = storage.delete_rollup_buckets(vid)
+        buckets = buckets_from_sessions(vid, sessions)
+        print(f"[+] {vid}: {storage.save_rollup_buckets(buckets)}/{len(buckets)} hourly/daily buckets saved "
+              f"({deleted} old bucket(s) deleted)")
+
+    print(f"[+] Rebuilt {rebuilt} rollup(s)")
+    return rebuilt
+
+
+if __name__ == "__main__":
+    rebuild_rollups(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,241 @@
+"""
+Pluggable store for active video sessions - process memory for a single
+worker, or SQLite (WAL mode) shared by every uvicorn worker on the host
+"""
+import json
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional, Tuple
+
+SessionDict = Dict[str, Any]
+
+
+class SessionStore(ABC):
+    """
+    Dict-like interface VideoSessionManager uses for `active_sessions`.
+    Values are whole session dicts. New sessions are added with
+    `store[session_id] = session`; changes to a live session go through
+    `modify`, so two workers changing it at once don't overwrite each other.
+
+    Ending is a compare-and-set: `complete` succeeds for exactly one caller
+    across every worker sharing the store. Ended sessions are kept as
+    tombstones for `ended_ttl` seconds, so a write-back or a stale "active"
+    copy read from storage can't bring them back, and `get_ended` still
+    returns the final result before storage has caught up.
+    """
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[SessionDict]:
+        """The session if it is active here"""
+
+    @abstractmethod
+    def __setitem__(self, session_id: str, session: SessionDict) -> None:
+        """Insert or update an active session (ignored once it has ended)"""
+
+    @abstractmethod
+    def __delitem__(self, session_id: str) -> None:
+        ...
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @abstractmethod
+    def modify(self, session_id: str, change: Callable[[SessionDict], None]) -> Optional[SessionDict]:
+        """
+        Apply `change` to the active session as one atomic read-modify-write
+        and return the result, or None if it isn't active here. Concurrent
+        changes from other workers are applied one after the other, never lost.
+        """
+
+    @abstractmethod
+    def restore(self, session_id: str, session: SessionDict) -> bool:
+        """
+        Add an active session read back from storage, unless the store
+        already has it (active or ended). Returns whether it was added.
+        """
+
+    @abstractmethod
+    def complete(self, session_id: str, session: SessionDict) -> bool:
+        """
+        Atomically move an active session to ended, storing its final state.
+        Returns False if it isn't active here - someone else ended it first.
+        """
+
+    @abstractmethod
+    def get_ended(self, session_id: str) -> Optional[SessionDict]:
+        """Final state of a recently ended session"""
+
+    def close(self) -> None:
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Plain in-process dict (single worker only)"""
+
+    def __init__(self, ended_ttl: float = 3600.0):
+        self._sessions: Dict[str, SessionDict] = {}
+        # session_id -> (ended_at, final session), oldest first
+        self._ended: Dict[str, Tuple[float, SessionDict]] = {}
+        self.ended_ttl = ended_ttl
+
+    def get(self, session_id: str) -> Optional[SessionDict]:
+        return self._sessions.get(session_id)
+
+    def __setitem__(self, session_id: str, session: SessionDict) -> None:
+        if session_id not in self._ended:
+            self._sessions[session_id] = session
+
+    def __delitem__(self, session_id: str) -> None:
+        del self._sessions[session_id]
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def modify(self, session_id: str, change: Callable[[SessionDict], None]) -> Optional[SessionDict]:
+        session = self._sessions.get(session_id)
+        if session is not None:
+            change(session)
+        return session
+
+    def restore(self, session_id: str, session: SessionDict) -> bool:
+        if session_id in self._sessions or session_id in self._ended:
+            return False
+        self._sessions[session_id] = session
+        return True
+
+    def complete(self, session_id: str, session: SessionDict) -> bool:
+        if self._sessions.pop(session_id, None) is None:
+            return False
+        now = time.time()
+        self._ended[session_id] = (now, session)
+        while self._ended:
+            oldest = next(iter(self._ended))
+            if self._ended[oldest][0] >= now - self.ended_ttl:
+                break
+            del self._ended[oldest]
+        return True
+
+    def get_ended(self, session_id: str) -> Optional[SessionDict]:
+        entry = self._ended.get(session_id)
+        return entry[1] if entry else None
+
+
+ACTIVE = "active"
+ENDED = "ended"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS active_sessions (
+    session_id TEXT PRIMARY KEY,
+    data       TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    status     TEXT NOT NULL DEFAULT 'active'
+);
+CREATE INDEX IF NOT EXISTS idx_active_sessions_status ON active_sessions (status, updated_at);
+"""
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Active sessions as JSON rows in a SQLite database in WAL mode, so a
+    status poll, quiz or end request can land on any worker process.
+    Readers never block the writer and concurrent writers wait on the
+    database lock (busy_timeout) instead of failing. Each get returns a
+    fresh copy; `modify` re-reads and writes the row inside BEGIN IMMEDIATE,
+    so concurrent changes from different workers are serialized. Ending flips the row's status inside BEGIN IMMEDIATE and checks the
+    rowcount, so only one worker ever applies a session's end.
+    """
+
+    def __init__(self, db_path: str, ended_ttl: float = 3600.0):
+        self.db_path = db_path
+        self.ended_ttl = ended_ttl
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # Firestore remains the durable copy
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(active_sessions)")}
+        if columns and "status" not in columns:
+            # Store created before ended sessions were kept as tombstones
+            self._conn.execute("ALTER TABLE active_sessions ADD COLUMN status TEXT NOT NULL DEFAULT 'active'")
+        self._conn.executescript(SCHEMA)
+        print(f"✅ SQLite session store at {db_path}")
+
+    def get(self, session_id: str) -> Optional[SessionDict]:
+        row = self._conn.execute(
+            "SELECT data FROM active_sessions WHERE session_id = ? AND status = ?", (session_id, ACTIVE)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __setitem__(self, session_id: str, session: SessionDict) -> None:
+        self._conn.execute(
+            """INSERT INTO active_sessions (session_id, data, updated_at, status) VALUES (?, ?, ?, ?)
+               ON CONFLICT (session_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+               WHERE active_sessions.status = ?""",
+            (session_id, json.dumps(session), time.time(), ACTIVE, ACTIVE)
+        )
+
+    def __delitem__(self, session_id: str) -> None:
+        self._conn.execute("DELETE FROM active_sessions WHERE session_id = ?", (session_id,))
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM active_sessions WHERE status = ?", (ACTIVE,)).fetchone()[0]
+
+    def modify(self, session_id: str, change: Callable[[SessionDict], None]) -> Optional[SessionDict]:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT data FROM active_sessions WHERE session_id = ? AND status = ?", (session_id, ACTIVE)
+            ).fetchone()
+            session = None
+            if row:
+                session = json.loads(row[0])
+                change(session)
+                self._conn.execute(
+                    "UPDATE active_sessions SET data = ?, updated_at = ? WHERE session_id = ?",
+                    (json.dumps(session), time.time(), session_id)
+                )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return session
+
+    def restore(self, session_id: str, session: SessionDict) -> bool:
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO active_sessions (session_id, data, updated_at, status) VALUES (?, ?, ?, ?)",
+            (session_id, json.dumps(session), time.time(), ACTIVE)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, session_id: str, session: SessionDict) -> bool:
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            won = self._conn.execute(
+                "UPDATE active_sessions SET status = ?, data = ?, updated_at = ? WHERE session_id = ? AND status = ?",
+                (ENDED, json.dumps(session), now, session_id, ACTIVE)
+            ).rowcount == 1
+            self._conn.execute(
+                "DELETE FROM active_sessions WHERE status = ? AND updated_at < ?", (ENDED, now - self.ended_ttl)
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return won
+
+    def get_ended(self, session_id: str) -> Optional[SessionDict]:
+        row = self._conn.execute(
+            "SELECT data FROM active_sessions WHERE session_id = ? AND status = ?", (session_id, ENDED)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def close(self) -> None:
+        self._conn.close()
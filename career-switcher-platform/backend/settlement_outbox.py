@@ -0,0 +1,265 @@
+"""
+Durable settlement outbox - session end records the delivery proof locally
+(SQLite in WAL mode) and background workers submit it to Finternet
+"""
+import asyncio
+import json
+import random
+import sqlite3
+import time
+import uuid
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from resilience import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+SETTLED = "settled"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settlements (
+    settlement_id   TEXT PRIMARY KEY,
+    session_id      TEXT NOT NULL UNIQUE,
+    intent_id       TEXT NOT NULL,
+    proof           TEXT NOT NULL,
+    status          TEXT NOT NULL,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until     REAL,
+    last_error      TEXT,
+    result          TEXT,
+    retry_deadline  REAL,
+    created_at      REAL NOT NULL,
+    updated_at      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_settlements_due ON settlements (status, next_attempt_at);
+"""
+
+# 4xx responses worth retrying - every other 4xx means the proof itself was rejected
+TRANSIENT_CLIENT_ERRORS = {408, 425, 429}
+
+SubmitFn = Callable[..., Awaitable[Dict[str, Any]]]
+
+
+class SettlementOutbox:
+    """
+    Outbox of pending delivery-proof submissions.
+
+    `enqueue` is a single local transaction, so ending a session never waits
+    on the gateway. A pool of `workers` asyncio tasks claims due rows with a
+    lease, calls `submit(intent_id=..., **proof)` and either marks the row
+    settled or reschedules it with jittered exponential backoff (never less
+    than half the nominal delay). Rows whose lease expired (process crashed
+    mid-submit) are picked up again.
+
+    Transient failures are retried until `retry_window` seconds have passed
+    since the row was queued; short-circuits while the breaker is open wait
+    for it to half-open and don't count as attempts. A 4xx the gateway will
+    keep returning fails the row at once. Failed rows stay parked until
+    `requeue_failed` gives them a fresh retry window.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        submit: SubmitFn,
+        workers: int = 4,
+        retry_window: float = 86400.0,
+        base_delay: float = 1.0,
+        max_delay: float = 300.0,
+        lease_seconds: float = 60.0,
+        poll_interval: float = 1.0
+    ):
+        self.db_path = db_path
+        self.submit = submit
+        self.worker_count = workers
+        self.retry_window = retry_window
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")  # payouts: fsync every commit
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(settlements)")}
+        if "retry_deadline" not in columns:
+            # Outbox created before retry windows; NULL falls back to created_at + retry_window
+            self._conn.execute("ALTER TABLE settlements ADD COLUMN retry_deadline REAL")
+
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        self._stopping = False
+        logger.info(f"Settlement outbox initialized at {db_path}")
+
+    # ---------- producer side ----------
+
+    def enqueue(self, session_id: str, intent_id: str, proof: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Record a settlement for a session. Idempotent per session_id: a repeat
+        call returns the existing record instead of queueing a second proof.
+        """
+        now = time.time()
+        settlement_id = f"stl_{uuid.uuid4().hex[:16]}"
+        self._conn.execute(
+            """INSERT OR IGNORE INTO settlements
+               (settlement_id, session_id, intent_id, proof, status, next_attempt_at, retry_deadline, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (settlement_id, session_id, intent_id, json.dumps(proof), PENDING, now, now + self.retry_window, now, now)
+        )
+        self._wakeup.set()
+        return self.get_by_session(session_id)
+
+    def get_by_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT * FROM settlements WHERE session_id = ?", (session_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def requeue_failed(self, session_id: Optional[str] = None) -> int:
+        """
+        Move failed rows (one session's, or all) back to pending with a fresh
+        retry window - e.g. after a gateway outage outlasted the window.
+        Returns the number requeued.
+        """
+        now = time.time()
+        sql = """UPDATE settlements SET status = ?, attempts = 0, next_attempt_at = ?, retry_deadline = ?,
+                 lease_until = NULL, updated_at = ? WHERE status = ?"""
+        params = [PENDING, now, now + self.retry_window, now, FAILED]
+        if session_id is not None:
+            sql += " AND session_id = ?"
+            params.append(session_id)
+        requeued = self._conn.execute(sql, params).rowcount
+        if requeued:
+            logger.info(f"[OUTBOX] Requeued {requeued} failed settlement(s)")
+            self._wakeup.set()
+        return requeued
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {PENDING: 0, IN_FLIGHT: 0, SETTLED: 0, FAILED: 0}
+        for row in self._conn.execute("SELECT status, COUNT(*) AS n FROM settlements GROUP BY status"):
+            counts[row["status"]] = row["n"]
+        oldest = self._conn.execute(
+            "SELECT MIN(created_at) AS t FROM settlements WHERE status IN (?, ?)", (PENDING, IN_FLIGHT)
+        ).fetchone()["t"]
+        return {
+            "workers": len(self._workers),
+            "counts": counts,
+            "oldest_pending_age_seconds": round(time.time() - oldest, 1) if oldest else 0.0
+        }
+
+    # ---------- worker side ----------
+
+    async def start(self) -> None:
+        self._stopping = False
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"settlement-worker-{i}")
+            for i in range(self.worker_count)
+        ]
+        logger.info(f"Settlement outbox started {self.worker_count} workers")
+
+    async def stop(self, grace: float = 5.0) -> None:
+        """Let in-flight submissions finish for up to `grace` seconds, then cancel"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._workers:
+            _, pending = await asyncio.wait(self._workers, timeout=grace)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._workers = []
+        self._conn.close()
+        logger.info("Settlement outbox stopped")
+
+    async def _worker(self, index: int) -> None:
+        while not self._stopping:
+            row = self._claim_next()
+            if row is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._process(row)
+
+    def _claim_next(self) -> Optional[sqlite3.Row]:
+        """Lease the oldest due row (pending, or in flight with an expired lease)"""
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                """SELECT * FROM settlements
+                   WHERE (status = ? AND next_attempt_at <= ?) OR (status = ? AND lease_until <= ?)
+                   ORDER BY next_attempt_at LIMIT 1""",
+                (PENDING, now, IN_FLIGHT, now)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE settlements SET status = ?, lease_until = ?, updated_at = ? WHERE settlement_id = ?",
+                    (IN_FLIGHT, now + self.lease_seconds, now, row["settlement_id"])
+                )
+            self._conn.execute("COMMIT")
+            return row
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    async def _process(self, row: sqlite3.Row) -> None:
+        settlement_id = row["settlement_id"]
+        try:
+            result = await self.submit(intent_id=row["intent_id"], **json.loads(row["proof"]))
+        except CircuitOpenError as e:
+            result = {"success": False, "error": str(e), "retry_in": e.retry_in}
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+
+        now = time.time()
+        error = str(result.get("error"))
+        if result.get("retry_in") is not None:
+            # Never reached the gateway - wait for the breaker, without using up an attempt
+            self._reschedule(settlement_id, PENDING, row["attempts"], now + result["retry_in"], error, now)
+            return
+
+        attempts = row["attempts"] + 1
+        if result.get("success"):
+            self._conn.execute(
+                """UPDATE settlements SET status = ?, attempts = ?, result = ?, last_error = NULL,
+                   lease_until = NULL, updated_at = ? WHERE settlement_id = ?""",
+                (SETTLED, attempts, json.dumps(result.get("data")), now, settlement_id)
+            )
+            logger.info(f"[OUTBOX] Settled {settlement_id} (session {row['session_id']}) after {attempts} attempt(s)")
+            return
+
+        status_code = result.get("status_code")
+        deadline = row["retry_deadline"] or row["created_at"] + self.retry_window
+        if status_code is not None and 400 <= status_code < 500 and status_code not in TRANSIENT_CLIENT_ERRORS:
+            logger.error(f"[OUTBOX] Gateway rejected {settlement_id} (HTTP {status_code}): {error}")
+            self._reschedule(settlement_id, FAILED, attempts, now, error, now)
+        elif now >= deadline:
+            logger.error(f"[OUTBOX] Giving up on {settlement_id} after {attempts} attempts: {error}")
+            self._reschedule(settlement_id, FAILED, attempts, now, error, now)
+        else:
+            cap = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+            delay = random.uniform(cap / 2, cap)
+            logger.warning(f"[OUTBOX] Attempt {attempts} for {settlement_id} failed ({error}) - retrying in {delay:.1f}s")
+            self._reschedule(settlement_id, PENDING, attempts, now + delay, error, now)
+
+    def _reschedule(self, settlement_id: str, status: str, attempts: int, next_attempt_at: float, error: str, now: float) -> None:
+        self._conn.execute(
+            """UPDATE settlements SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?,
+               lease_until = NULL, updated_at = ? WHERE settlement_id = ?""",
+            (status, attempts, next_attempt_at, error, now, settlement_id)
+        )
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        record = dict(row)
+        record["proof"] = json.loads(record["proof"])
+        record["result"] = json.loads(record["result"]) if record["result"] else None
+        return record
@@ -0,0 +1,688 @@
+"""
+Pluggable storage for sessions, feedback and analytics - Firestore in
+production, SQLite for a single-node deployment, or process memory for
+local development and load tests (STORAGE_BACKEND)
+"""
+import asyncio
+import base64
+import copy
+import functools
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from video_rollups import VIDEO_DURATION_SECONDS
+from write_behind import SET, UPDATE, apply_write
+
+# Collection names
+SESSIONS_COLLECTION = "video_sessions"
+FEEDBACK_COLLECTION = "feedback"
+QUIZ_SCORES_COLLECTION = "quiz_scores"
+ROLLUPS_COLLECTION = "video_rollups"
+ROLLUP_BUCKETS_COLLECTION = "video_rollup_buckets"
+
+# Fields stored on every feedback document (see VideoSessionManager.add_feedback);
+# the default projection, the same row shape get_all_feedback_by_video always returned
+FEEDBACK_FIELDS = (
+    "session_id",
+    "student_id",
+    "video_id",
+    "stars",
+    "review",
+    "has_review",
+    "watch_time_seconds",
+    "amount_charged",
+    "quiz_scores",
+    "submitted_at"
+)
+MAX_FEEDBACK_PAGE_SIZE = 500
+
+# Given the feedback document being replaced (None if there is none), the writes to commit with its replacement
+FeedbackWrites = Callable[[Optional[Dict[str, Any]]], List[Dict[str, Any]]]
+
+# Operations with an *_async variant that runs on the storage's thread pool
+ASYNC_OPERATIONS = (
+    "save_session",
+    "get_session",
+    "update_session",
+    "save_feedback",
+    "replace_feedback",
+    "save_quiz_score",
+    "commit_writes",
+    "get_video_rollup",
+    "get_rollup_buckets",
+    "get_all_feedback_by_video",
+    "query_feedback",
+    "feedback_stats",
+    "get_video_analytics"
+)
+
+
+def encode_cursor(stars: Any, session_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([stars, session_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        stars, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return stars, session_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def check_feedback_fields(fields: Optional[List[str]]) -> None:
+    unknown = [field for field in fields or [] if field not in FEEDBACK_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+
+def analytics_result(
+    total_views: int,
+    total_watch_time: float,
+    total_earned: float,
+    avg_stars: Optional[float],
+    avg_watched_seconds: Optional[float],
+    total_feedback: int,
+    unique_students: int
+) -> Dict[str, Any]:
+    """The dict get_video_analytics returns, whichever backend computed the totals"""
+    avg_rating = round(avg_stars, 2) if avg_stars is not None else 0
+    # Averaged over sessions that were watched at all
+    avg_completion = round(avg_watched_seconds / VIDEO_DURATION_SECONDS, 2) if avg_watched_seconds is not None else 0
+    return {
+        "total_sessions": total_views,
+        "total_views": total_views,
+        "unique_students": unique_students,
+        "total_watch_time_seconds": total_watch_time,
+        "total_watch_time_minutes": round(total_watch_time / 60, 2),
+        "total_earnings": round(total_earned, 2),
+        "total_earned": round(total_earned, 2),
+        "avg_rating": avg_rating,
+        "average_rating": avg_rating,
+        "avg_completion_rate": avg_completion,
+        "average_completion_rate": avg_completion,
+        "avg_watch_time_seconds": round(total_watch_time / total_views, 2) if total_views > 0 else 0,
+        "total_feedback": total_feedback
+    }
+
+
+def with_feedback_defaults(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Feedback saved before quiz scores were copied onto it reads as having none"""
+    return {"quiz_scores": [], **row}
+
+
+def _feedback_page(rows: List[Dict[str, Any]], limit: int, fields: Optional[List[str]]) -> Dict[str, Any]:
+    """`rows` is up to limit + 1 feedback documents in (stars, session_id) order"""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["stars"], rows[-1]["session_id"])
+    rows = [with_feedback_defaults(row) for row in rows]
+    if fields:
+        rows = [{field: row.get(field) for field in fields} for row in rows]
+    return {"feedback": rows, "next_cursor": next_cursor}
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+
+class Storage(ABC):
+    """
+    Every operation is synchronous. Async handlers use the *_async variants
+    (save_session_async, query_feedback_async, ...), which run on this
+    backend's thread pool - or inline when it has none - so a slow round
+    trip never blocks the event loop.
+    """
+
+    def __init__(self, max_workers: int = 0):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage") if max_workers else None
+
+    # ---------- sessions ----------
+
+    @abstractmethod
+    def save_session(self, session_data: Dict[str, Any]) -> bool:
+        ...
+
+    @abstractmethod
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def update_session(self, session_id: str, update_data: Dict[str, Any]) -> bool:
+        ...
+
+    @abstractmethod
+    def save_quiz_score(self, quiz_data: Dict[str, Any]) -> bool:
+        ...
+
+    @abstractmethod
+    def get_sessions_by_video(self, video_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """All raw sessions for a video (or every video) - for rebuilds only"""
+
+    # ---------- feedback ----------
+
+    @abstractmethod
+    def save_feedback(self, feedback_data: Dict[str, Any]) -> bool:
+        ...
+
+    @abstractmethod
+    def replace_feedback(self, feedback_data: Dict[str, Any], writes_for: FeedbackWrites) -> None:
+        """
+        Overwrite a session's feedback document and commit `writes_for(previous)`
+        in the same transaction, where `previous` is the document it replaces
+        as read inside that transaction - so rollup deltas stay right when
+        several workers resubmit feedback at once. `writes_for` may be called
+        more than once if the transaction is retried. Raises on failure, in
+        which case nothing was applied.
+        """
+
+    @abstractmethod
+    def query_feedback(
+        self,
+        video_id: str,
+        min_stars: Optional[int] = None,
+        max_stars: Optional[int] = None,
+        has_text: Optional[bool] = None,
+        fields: Optional[List[str]] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        A video's feedback filtered by star range and has-text, ordered by
+        (stars, session_id). Returns {"feedback": [...], "next_cursor"}.
+        Raises ValueError for unknown fields or a bad cursor.
+        """
+
+    @abstractmethod
+    def feedback_stats(
+        self,
+        video_id: str,
+        min_stars: Optional[int] = None,
+        max_stars: Optional[int] = None,
+        has_text: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """{"count", "avg_stars", "avg_watch_time_seconds"} with the same filters as query_feedback"""
+
+    def get_all_feedback_by_video(self, video_id: str) -> List[Dict[str, Any]]:
+        feedback_list = []
+        cursor = None
+        while True:
+            page = self.query_feedback(video_id, limit=MAX_FEEDBACK_PAGE_SIZE, cursor=cursor)
+            feedback_list.extend(page["feedback"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                return feedback_list
+
+    # ---------- analytics ----------
+
+    @abstractmethod
+    def get_video_analytics(self, video_id: str) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def get_video_rollup(self, video_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def save_video_rollup(self, video_id: str, rollup: Dict[str, Any]) -> bool:
+        ...
+
+    @abstractmethod
+    def get_rollup_buckets(self, video_id: str, granularity: str, start_key: str, end_key: str) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def save_rollup_buckets(self, buckets: Dict[str, Dict[str, Any]]) -> int:
+        ...
+
+    @abstractmethod
+    def delete_rollup_buckets(self, video_id: str) -> int:
+        """Delete every hourly and daily bucket of a video (before a rebuild). Returns the number deleted."""
+
+    # ---------- batched writes ----------
+
+    @abstractmethod
+    def commit_writes(self, writes: List[Dict[str, Any]]) -> None:
+        """
+        Apply WriteBehindBuffer writes ({"collection", "doc_id", "op",
+        "data", "array_union", "increment"}) atomically: when this raises,
+        none of them were applied, so the caller can retry.
+        """
+
+    def is_rejected(self, error: Exception) -> bool:
+        """
+        Whether a commit_writes() failure is caused by the writes themselves
+        (an update to a missing document, a value storage can't hold), so
+        retrying them can't succeed
+        """
+        return isinstance(error, (KeyError, TypeError, ValueError))
+
+    # ---------- async access ----------
+
+    async def _run(self, fn, *args, **kwargs):
+        if self._executor is None:
+            return fn(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Let queued calls finish, then stop the pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+
+def _async_variant(name: str):
+    async def method(self, *args, **kwargs):
+        return await self._run(getattr(self, name), *args, **kwargs)
+    method.__name__ = f"{name}_async"
+    return method
+
+
+for _name in ASYNC_OPERATIONS:
+    setattr(Storage, f"{_name}_async", _async_variant(_name))
+
+
+def _write(collection: str, doc_id: str, op: str, data: Optional[Dict[str, Any]] = None, **extra) -> Dict[str, Any]:
+    return {"collection": collection, "doc_id": doc_id, "op": op, "data": data or {}, **extra}
+
+
+class DocumentStorage(Storage):
+    """
+    Writes for the local backends, expressed as whole-document reads and
+    puts inside `_transaction()`. Queries are left to each backend.
+    """
+
+    @abstractmethod
+    def _transaction(self) -> ContextManager[None]:
+        """Context manager that applies every _put_doc inside it atomically"""
+
+    @abstractmethod
+    def _get_doc(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def _put_doc(self, collection: str, doc_id: str, doc: Dict[str, Any]) -> None:
+        ...
+
+    def commit_writes(self, writes: List[Dict[str, Any]]) -> None:
+        with self._transaction():
+            for write in writes:
+                doc = apply_write(self._get_doc(write["collection"], write["doc_id"]), write)
+                if doc is None:
+                    raise KeyError(f"No document to update: {write['collection']}/{write['doc_id']}")
+                doc["updated_at"] = _now()
+                if write["op"] == SET:
+                    doc["created_at"] = doc["updated_at"]
+                self._put_doc(write["collection"], write["doc_id"], doc)
+
+    def _commit_or_log(self, writes: List[Dict[str, Any]], action: str) -> bool:
+        try:
+            self.commit_writes(writes)
+            return True
+        except Exception as e:
+            print(f"Error {action}: {e}")
+            return False
+
+    def save_session(self, session_data: Dict[str, Any]) -> bool:
+        return self._commit_or_log([_write(SESSIONS_COLLECTION, session_data["session_id"], SET, session_data)], "saving session")
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._transaction():
+            return self._get_doc(SESSIONS_COLLECTION, session_id)
+
+    def update_session(self, session_id: str, update_data: Dict[str, Any]) -> bool:
+        return self._commit_or_log([_write(SESSIONS_COLLECTION, session_id, UPDATE, update_data)], "updating session")
+
+    def save_quiz_score(self, quiz_data: Dict[str, Any]) -> bool:
+        entry = {
+            "quiz_number": quiz_data.get("quiz_number", 1),
+            "score": quiz_data.get("score", 0),
+            "total_questions": quiz_data.get("total_questions", 0),
+            "timestamp": _now(),
+            "video_time": quiz_data.get("video_time", 0)
+        }
+        return self._commit_or_log(
+            [_write(SESSIONS_COLLECTION, quiz_data["session_id"], UPDATE, array_union={"quiz_scores": [entry]})],
+            "saving quiz score"
+        )
+
+    def save_feedback(self, feedback_data: Dict[str, Any]) -> bool:
+        return self._commit_or_log([_write(FEEDBACK_COLLECTION, feedback_data["session_id"], SET, {
+            **feedback_data,
+            "has_review": bool(feedback_data.get("review", "").strip())
+        })], "saving feedback")
+
+    def replace_feedback(self, feedback_data: Dict[str, Any], writes_for: FeedbackWrites) -> None:
+        with self._transaction():
+            session_id = feedback_data["session_id"]
+            previous = self._get_doc(FEEDBACK_COLLECTION, session_id)
+            self.commit_writes([_write(FEEDBACK_COLLECTION, session_id, SET, feedback_data), *writes_for(previous)])
+
+    def get_video_rollup(self, video_id: str) -> Optional[Dict[str, Any]]:
+        with self._transaction():
+            return self._get_doc(ROLLUPS_COLLECTION, video_id)
+
+    def save_video_rollup(self, video_id: str, rollup: Dict[str, Any]) -> bool:
+        return self._commit_or_log([_write(ROLLUPS_COLLECTION, video_id, SET, {**rollup, "video_id": video_id})], "saving video rollup")
+
+    def save_rollup_buckets(self, buckets: Dict[str, Dict[str, Any]]) -> int:
+        writes = [_write(ROLLUP_BUCKETS_COLLECTION, doc_id, SET, bucket) for doc_id, bucket in buckets.items()]
+        return len(buckets) if self._commit_or_log(writes, "saving rollup buckets") else 0
+
+
+class MemoryStorage(DocumentStorage):
+    """Everything in process memory - lost on restart (development and load tests)"""
+
+    def __init__(self):
+        super().__init__(max_workers=0)
+        self._docs: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        self._staged: Optional[Dict[Tuple[str, str], Dict[str, Any]]] = None
+        self._lock = threading.RLock()
+        print("✅ In-memory storage (data is lost on restart)")
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        with self._lock:
+            outer = self._staged is not None
+            if not outer:
+                self._staged = {}
+            try:
+                yield
+                if not outer:
+                    for (collection, doc_id), doc in self._staged.items():
+                        self._docs[collection][doc_id] = doc
+            finally:
+                if not outer:
+                    self._staged = None
+
+    def _get_doc(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        doc = self._staged.get((collection, doc_id)) if self._staged else None
+        if doc is None:
+            doc = self._docs[collection].get(doc_id)
+        return copy.deepcopy(doc)
+
+    def _put_doc(self, collection: str, doc_id: str, doc: Dict[str, Any]) -> None:
+        self._staged[(collection, doc_id)] = copy.deepcopy(doc)
+
+    def _scan(self, collection: str, **equals) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                copy.deepcopy(doc) for doc in self._docs[collection].values()
+                if all(doc.get(field) == value for field, value in equals.items())
+            ]
+
+    def _feedback(self, video_id: str, min_stars, max_stars, has_text) -> List[Dict[str, Any]]:
+        return [
+            doc for doc in self._scan(FEEDBACK_COLLECTION, video_id=video_id)
+            if (min_stars is None or doc["stars"] >= min_stars)
+            and (max_stars is None or doc["stars"] <= max_stars)
+            and (has_text is None or doc.get("has_review") == has_text)
+        ]
+
+    def get_sessions_by_video(self, video_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self._scan(SESSIONS_COLLECTION, **({"video_id": video_id} if video_id else {}))
+
+    def query_feedback(self, video_id, min_stars=None, max_stars=None, has_text=None, fields=None, limit=100, cursor=None):
+        check_feedback_fields(fields)
+        limit = max(1, min(limit, MAX_FEEDBACK_PAGE_SIZE))
+        rows = sorted(self._feedback(video_id, min_stars, max_stars, has_text), key=lambda doc: (doc["stars"], doc["session_id"]))
+        if cursor:
+            after = decode_cursor(cursor)
+            rows = [doc for doc in rows if (doc["stars"], doc["session_id"]) > after]
+        return _feedback_page(rows[:limit + 1], limit, fields)
+
+    def feedback_stats(self, video_id, min_stars=None, max_stars=None, has_text=None):
+        rows = self._feedback(video_id, min_stars, max_stars, has_text)
+        watch_times = [doc["watch_time_seconds"] for doc in rows if isinstance(doc.get("watch_time_seconds"), (int, float))]
+        return {
+            "count": len(rows),
+            "avg_stars": round(sum(doc["stars"] for doc in rows) / len(rows), 2) if rows else 0,
+            "avg_watch_time_seconds": round(sum(watch_times) / len(watch_times), 2) if watch_times else 0
+        }
+
+    def get_video_analytics(self, video_id: str) -> Dict[str, Any]:
+        sessions = self._scan(SESSIONS_COLLECTION, video_id=video_id)
+        feedback = self._scan(FEEDBACK_COLLECTION, video_id=video_id)
+        watched = [s["elapsed_seconds"] for s in sessions if s.get("elapsed_seconds")]
+        return analytics_result(
+            total_views=len(sessions),
+            total_watch_time=sum(s.get("elapsed_seconds", 0) for s in sessions),
+            total_earned=sum(s.get("amount_charged", 0) for s in sessions),
+            avg_stars=sum(f["stars"] for f in feedback) / len(feedback) if feedback else None,
+            avg_watched_seconds=sum(watched) / len(watched) if watched else None,
+            total_feedback=len(feedback),
+            unique_students=len({s["student_id"] for s in sessions if s.get("student_id")})
+        )
+
+    def get_rollup_buckets(self, video_id, granularity, start_key, end_key):
+        buckets = self._scan(ROLLUP_BUCKETS_COLLECTION, video_id=video_id, granularity=granularity)
+        return sorted((b for b in buckets if start_key <= b["bucket"] <= end_key), key=lambda b: b["bucket"])
+
+    def delete_rollup_buckets(self, video_id: str) -> int:
+        with self._lock:
+            buckets = self._docs[ROLLUP_BUCKETS_COLLECTION]
+            doc_ids = [doc_id for doc_id, bucket in buckets.items() if bucket.get("video_id") == video_id]
+            for doc_id in doc_ids:
+                del buckets[doc_id]
+            return len(doc_ids)
+
+
+# (table key column, indexed columns copied out of the JSON document) per collection
+SQLITE_TABLES = {
+    SESSIONS_COLLECTION: ("session_id", ("video_id", "status", "elapsed_seconds", "amount_charged")),
+    FEEDBACK_COLLECTION: ("session_id", ("video_id", "stars", "has_review", "watch_time_seconds")),
+    ROLLUPS_COLLECTION: ("video_id", ()),
+    ROLLUP_BUCKETS_COLLECTION: ("doc_id", ("video_id", "granularity", "bucket"))
+}
+
+SQLITE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {SESSIONS_COLLECTION} (
+    session_id      TEXT PRIMARY KEY,
+    video_id        TEXT,
+    status          TEXT,
+    elapsed_seconds REAL,
+    amount_charged  REAL,
+    data            TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_video ON {SESSIONS_COLLECTION} (video_id, status);
+
+CREATE TABLE IF NOT EXISTS {FEEDBACK_COLLECTION} (
+    session_id         TEXT PRIMARY KEY,
+    video_id           TEXT,
+    stars              INTEGER,
+    has_review         INTEGER,
+    watch_time_seconds REAL,
+    data               TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_feedback_video_stars ON {FEEDBACK_COLLECTION} (video_id, stars, session_id);
+CREATE INDEX IF NOT EXISTS idx_feedback_video_text ON {FEEDBACK_COLLECTION} (video_id, has_review, stars, session_id);
+
+CREATE TABLE IF NOT EXISTS {ROLLUPS_COLLECTION} (
+    video_id TEXT PRIMARY KEY,
+    data     TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS {ROLLUP_BUCKETS_COLLECTION} (
+    doc_id      TEXT PRIMARY KEY,
+    video_id    TEXT,
+    granularity TEXT,
+    bucket      TEXT,
+    data        TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_buckets_range ON {ROLLUP_BUCKETS_COLLECTION} (video_id, granularity, bucket);
+"""
+
+
+class SQLiteStorage(DocumentStorage):
+    """
+    Documents as JSON rows in a SQLite database (WAL mode), with the fields
+    queries filter, sort or aggregate on copied into indexed columns. One
+    connection per pool thread: readers run concurrently and batched writes
+    take the write lock for one transaction each.
+    """
+
+    def __init__(self, db_path: str, max_workers: int = 4):
+        super().__init__(max_workers=max_workers)
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._conn().executescript(SQLITE_SCHEMA)
+        print(f"✅ SQLite storage at {db_path}")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        conn = self._conn()
+        if conn.in_transaction:
+            yield
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _get_doc(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        key, _ = SQLITE_TABLES[collection]
+        row = self._conn().execute(f"SELECT data FROM {collection} WHERE {key} = ?", (doc_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put_doc(self, collection: str, doc_id: str, doc: Dict[str, Any]) -> None:
+        key, columns = SQLITE_TABLES[collection]
+        names = ", ".join((key, *columns, "data"))
+        placeholders = ", ".join("?" * (len(columns) + 2))
+        self._conn().execute(
+            f"INSERT OR REPLACE INTO {collection} ({names}) VALUES ({placeholders})",
+            (doc_id, *(doc.get(column) for column in columns), json.dumps(doc, default=str))
+        )
+
+    def _select(self, sql: str, params: Tuple = ()) -> List[Dict[str, Any]]:
+        return [json.loads(row[0]) for row in self._conn().execute(sql, params)]
+
+    @staticmethod
+    def _feedback_where(video_id, min_stars, max_stars, has_text) -> Tuple[str, List[Any]]:
+        clauses, params = ["video_id = ?"], [video_id]
+        if min_stars is not None:
+            clauses.append("stars >= ?")
+            params.append(min_stars)
+        if max_stars is not None:
+            clauses.append("stars <= ?")
+            params.append(max_stars)
+        if has_text is not None:
+            clauses.append("has_review = ?")
+            params.append(int(has_text))
+        return " AND ".join(clauses), params
+
+    def get_sessions_by_video(self, video_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        if video_id:
+            return self._select(f"SELECT data FROM {SESSIONS_COLLECTION} WHERE video_id = ?", (video_id,))
+        return self._select(f"SELECT data FROM {SESSIONS_COLLECTION}")
+
+    def query_feedback(self, video_id, min_stars=None, max_stars=None, has_text=None, fields=None, limit=100, cursor=None):
+        check_feedback_fields(fields)
+        limit = max(1, min(limit, MAX_FEEDBACK_PAGE_SIZE))
+        where, params = self._feedback_where(video_id, min_stars, max_stars, has_text)
+        if cursor:
+            where += " AND (stars, session_id) > (?, ?)"
+            params.extend(decode_cursor(cursor))
+        rows = self._select(
+            f"SELECT data FROM {FEEDBACK_COLLECTION} WHERE {where} ORDER BY stars, session_id LIMIT ?",
+            (*params, limit + 1)
+        )
+        return _feedback_page(rows, limit, fields)
+
+    def feedback_stats(self, video_id, min_stars=None, max_stars=None, has_text=None):
+        where, params = self._feedback_where(video_id, min_stars, max_stars, has_text)
+        count, avg_stars, avg_watch = self._conn().execute(
+            f"SELECT COUNT(*), AVG(stars), AVG(watch_time_seconds) FROM {FEEDBACK_COLLECTION} WHERE {where}",
+            params
+        ).fetchone()
+        return {
+            "count": count,
+            "avg_stars": round(avg_stars, 2) if avg_stars is not None else 0,
+            "avg_watch_time_seconds": round(avg_watch, 2) if avg_watch is not None else 0
+        }
+
+    def get_video_analytics(self, video_id: str) -> Dict[str, Any]:
+        conn = self._conn()
+        views, watch_time, earned, avg_watched, students = conn.execute(
+            f"""SELECT COUNT(*), COALESCE(SUM(elapsed_seconds), 0), COALESCE(SUM(amount_charged), 0),
+                       AVG(CASE WHEN elapsed_seconds > 0 THEN elapsed_seconds END),
+                       COUNT(DISTINCT json_extract(data, '$.student_id'))
+                FROM {SESSIONS_COLLECTION} WHERE video_id = ?""",
+            (video_id,)
+        ).fetchone()
+        feedback_count, avg_stars = conn.execute(
+            f"SELECT COUNT(*), AVG(stars) FROM {FEEDBACK_COLLECTION} WHERE video_id = ?",
+            (video_id,)
+        ).fetchone()
+        return analytics_result(views, watch_time, earned, avg_stars, avg_watched, feedback_count, students)
+
+    def get_rollup_buckets(self, video_id, granularity, start_key, end_key):
+        return self._select(
+            f"""SELECT data FROM {ROLLUP_BUCKETS_COLLECTION}
+                WHERE video_id = ? AND granularity = ? AND bucket BETWEEN ? AND ?
+                ORDER BY bucket""",
+            (video_id, granularity, start_key, end_key)
+        )
+
+    def delete_rollup_buckets(self, video_id: str) -> int:
+        with self._transaction():
+            return self._conn().execute(f"DELETE FROM {ROLLUP_BUCKETS_COLLECTION} WHERE video_id = ?", (video_id,)).rowcount
+
+    def shutdown(self, wait: bool = True) -> None:
+        super().shutdown(wait=wait)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+def create_storage(backend: str, path: str = "career_switcher.db", firestore_workers: int = 16) -> Storage:
+    """
+    "firestore" (default), "sqlite" or "memory". Firestore is imported only
+    when selected, so the other backends need no Firebase credentials.
+    """
+    backend = (backend or "firestore").lower()
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "sqlite":
+        return SQLiteStorage(path)
+    if backend != "firestore":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend} (expected firestore, sqlite or memory)")
+    from firestore_service import FirestoreStorage
+    return FirestoreStorage(max_workers=firestore_workers)
+
+
+def storage_from_env() -> Storage:
+    """The backend selected by STORAGE_BACKEND / STORAGE_PATH / FIRESTORE_MAX_WORKERS"""
+    load_dotenv()
+    return create_storage(
+        os.getenv("STORAGE_BACKEND", "firestore"),
+        path=os.getenv("STORAGE_PATH", "career_switcher.db"),
+        firestore_workers=int(os.getenv("FIRESTORE_MAX_WORKERS", 16))
+    )
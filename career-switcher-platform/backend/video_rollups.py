@@ -0,0 +1,218 @@
+"""
+Per-video analytics rollups - running totals kept in one document per video
+so the teacher dashboard is a single read instead of a scan of every session,
+plus hourly and daily buckets for trend charts
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+VIDEO_DURATION_SECONDS = 180  # All catalogue videos are 3 minutes
+
+ROLLUP_FIELDS = (
+    "views",
+    "unique_students",
+    "watch_seconds",
+    "earnings",
+    "completion_sum",
+    "completion_count",
+    "feedback_count",
+    "rating_sum",
+    "rating_count"
+)
+
+
+def session_start_delta(session: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Increments for a session that has just started - every session is a
+    view, as it always was. create_session mints a new student_id for each
+    session, so each one is also a new student.
+    """
+    return {"views": 1, "unique_students": 1}
+
+
+def session_end_delta(session: Dict[str, Any]) -> Dict[str, float]:
+    """Increments for a session that has just ended"""
+    elapsed = session.get("elapsed_seconds", 0) or 0
+    delta = {
+        "watch_seconds": elapsed,
+        "earnings": session.get("amount_charged", 0) or 0
+    }
+    if elapsed:
+        delta["completion_sum"] = elapsed / VIDEO_DURATION_SECONDS
+        delta["completion_count"] = 1
+    return delta
+
+
+def feedback_delta(feedback: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> Dict[str, float]:
+    """Increments for new feedback; resubmitting only moves the rating by the difference"""
+    if previous:
+        return {"rating_sum": feedback["stars"] - previous["stars"]}
+    return {"feedback_count": 1, "rating_sum": feedback["stars"], "rating_count": 1}
+
+
+def rollup_from_sessions(sessions: Iterable[Dict[str, Any]]) -> Dict[str, float]:
+    """
+    Recompute a rollup from raw sessions - the same deltas the live path
+    applies, except that students are counted by distinct student_id
+    """
+    rollup = {field: 0 for field in ROLLUP_FIELDS}
+    students = set()
+    for session in sessions:
+        rollup["views"] += 1
+        if session.get("student_id"):
+            students.add(session["student_id"])
+        deltas = []
+        if session.get("status") == "completed":
+            deltas.append(session_end_delta(session))
+        if session.get("feedback"):
+            deltas.append(feedback_delta(session["feedback"]))
+        for delta in deltas:
+            for field, value in delta.items():
+                rollup[field] += value
+    rollup["unique_students"] = len(students)
+    return rollup
+
+
+def analytics_from_rollup(rollup: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """The dict shape get_video_analytics has always returned"""
+    rollup = rollup or {}
+    views = rollup.get("views", 0)
+    watch_seconds = rollup.get("watch_seconds", 0)
+    earnings = rollup.get("earnings", 0)
+    rating_count = rollup.get("rating_count", 0)
+    completion_count = rollup.get("completion_count", 0)
+
+    avg_rating = round(rollup.get("rating_sum", 0) / rating_count, 2) if rating_count else 0
+    avg_completion = round(rollup.get("completion_sum", 0) / completion_count, 2) if completion_count else 0
+
+    return {
+        "total_sessions": views,
+        "total_views": views,
+        "unique_students": rollup.get("unique_students", 0),
+        "total_watch_time_seconds": watch_seconds,
+        "total_watch_time_minutes": round(watch_seconds / 60, 2),
+        "total_earnings": round(earnings, 2),
+        "total_earned": round(earnings, 2),
+        "avg_rating": avg_rating,
+        "average_rating": avg_rating,
+        "avg_completion_rate": avg_completion,
+        "average_completion_rate": avg_completion,
+        "avg_watch_time_seconds": round(watch_seconds / views, 2) if views > 0 else 0,
+        "total_feedback": rollup.get("feedback_count", 0)
+    }
+
+
+# ==================== Time buckets ====================
+# One document per (video, granularity, bucket). Keys are UTC and sort
+# lexically, e.g. "2026-10-17" (day) or "2026-10-17T13" (hour).
+
+HOUR = "hour"
+DAY = "day"
+GRANULARITIES = (HOUR, DAY)
+_KEY_FORMATS = {HOUR: "%Y-%m-%dT%H", DAY: "%Y-%m-%d"}
+_STEPS = {HOUR: timedelta(hours=1), DAY: timedelta(days=1)}
+
+BUCKET_FIELDS = ("sessions", "watch_seconds", "revenue", "rating_sum", "rating_count")
+
+BucketIncrement = Tuple[str, str, Dict[str, float]]  # (granularity, bucket key, increments)
+
+
+def to_utc_datetime(when: Union[float, str, datetime]) -> datetime:
+    """Epoch seconds, an ISO string or a datetime -> naive UTC datetime (raises ValueError on bad strings)"""
+    if isinstance(when, str):
+        when = datetime.fromisoformat(when)
+    elif not isinstance(when, datetime):
+        return datetime.utcfromtimestamp(when)
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc).replace(tzinfo=None)
+    return when
+
+
+def bucket_key(when: Union[float, str, datetime], granularity: str) -> str:
+    return to_utc_datetime(when).strftime(_KEY_FORMATS[granularity])
+
+
+def bucket_doc_id(video_id: str, granularity: str, key: str) -> str:
+    return f"{video_id}_{granularity}_{key}"
+
+
+def session_bucket_increments(session: Dict[str, Any]) -> List[BucketIncrement]:
+    """Increments for the buckets a just-ended session falls into (by end time)"""
+    delta = {
+        "sessions": 1,
+        "watch_seconds": session.get("elapsed_seconds", 0) or 0,
+        "revenue": session.get("amount_charged", 0) or 0
+    }
+    return [(g, bucket_key(session["end_time"], g), delta) for g in GRANULARITIES]
+
+
+def feedback_bucket_increments(
+    feedback: Dict[str, Any],
+    previous: Optional[Dict[str, Any]] = None
+) -> List[BucketIncrement]:
+    """Increments for new feedback (by submission time); a resubmission is moved out of its old bucket"""
+    increments = []
+    for g in GRANULARITIES:
+        if previous:
+            increments.append((g, bucket_key(previous["submitted_at"], g),
+                               {"rating_sum": -previous["stars"], "rating_count": -1}))
+        increments.append((g, bucket_key(feedback["submitted_at"], g),
+                           {"rating_sum": feedback["stars"], "rating_count": 1}))
+    return increments
+
+
+def buckets_from_sessions(video_id: str, sessions: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Recompute every bucket document for a video from raw sessions, keyed by document id"""
+    buckets: Dict[str, Dict[str, Any]] = {}
+    for session in sessions:
+        increments = []
+        if session.get("status") == "completed" and session.get("end_time"):
+            increments += session_bucket_increments(session)
+        if session.get("feedback") and session["feedback"].get("submitted_at"):
+            increments += feedback_bucket_increments(session["feedback"])
+        for granularity, key, delta in increments:
+            doc_id = bucket_doc_id(video_id, granularity, key)
+            bucket = buckets.setdefault(doc_id, {
+                "video_id": video_id,
+                "granularity": granularity,
+                "bucket": key,
+                **{field: 0 for field in BUCKET_FIELDS}
+            })
+            for field, value in delta.items():
+                bucket[field] += value
+    return buckets
+
+
+def merge_buckets(
+    buckets: Iterable[Dict[str, Any]],
+    granularity: str,
+    start: datetime,
+    end: datetime
+) -> Dict[str, Any]:
+    """
+    Merge stored buckets into a gap-free series from `start` to `end`
+    (inclusive) plus totals over the whole range
+    """
+    by_key = {bucket["bucket"]: bucket for bucket in buckets}
+    series = []
+    totals = {field: 0 for field in BUCKET_FIELDS}
+    current = datetime.strptime(bucket_key(start, granularity), _KEY_FORMATS[granularity])
+    while current <= end:
+        key = bucket_key(current, granularity)
+        bucket = by_key.get(key, {})
+        point = {"bucket": key}
+        for field in BUCKET_FIELDS:
+            point[field] = bucket.get(field, 0)
+            totals[field] += point[field]
+        point["revenue"] = round(point["revenue"], 2)
+        point["avg_rating"] = round(point["rating_sum"] / point["rating_count"], 2) if point["rating_count"] else 0
+        series.append(point)
+        current += _STEPS[granularity]
+
+    totals["revenue"] = round(totals["revenue"], 2)
+    totals["avg_rating"] = round(totals["rating_sum"] / totals["rating_count"], 2) if totals["rating_count"] else 0
+    return {"series": series, "totals": totals}
+
+
+def bucket_count(granularity: str, start: datetime, end: datetime) -> int:
+    return int((end - start) / _STEPS[granularity]) + 1
@@ -1,19 +1,89 @@
 """
 Video Session Manager - Tracks video watching sessions and payment
-Integrated with Firestore for persistent storage
+Persisted through the pluggable storage backend (Firestore, SQLite or memory)
 """
 import time
 import uuid
-from typing import Dict, Any, Optional
+from typing import Any, Callable, Dict, List, Optional
 from datetime import datetime
-import firestore_service as fs
+from session_store import MemorySessionStore, SessionStore
+from storage import FEEDBACK_COLLECTION, ROLLUP_BUCKETS_COLLECTION, ROLLUPS_COLLECTION, SESSIONS_COLLECTION, Storage
+from ttl_cache import TTLCache
+from video_rollups import (
+    BucketIncrement,
+    bucket_doc_id,
+    feedback_bucket_increments,
+    feedback_delta,
+    session_bucket_increments,
+    session_end_delta,
+    session_start_delta
+)
+from write_behind import MERGE, WriteBehindBuffer
+
+def _stored_quiz_score(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """A quiz score as written to storage - timestamps there are ISO strings, not epoch seconds"""
+    if isinstance(entry.get("timestamp"), (int, float)):
+        return {**entry, "timestamp": datetime.utcfromtimestamp(entry["timestamp"]).isoformat()}
+    return entry
+
+
+def _increment_write(
+    collection: str,
+    doc_id: str,
+    amounts: Dict[str, float],
+    fields: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """The write WriteBehindBuffer.increment would queue, for committing directly"""
+    return {
+        "collection": collection,
+        "doc_id": doc_id,
+        "op": MERGE,
+        "data": fields or {},
+        "array_union": {},
+        "increment": amounts
+    }
+
 
 class VideoSessionManager:
-    def __init__(self):
-        # Keep in-memory cache for active sessions
-        self.active_sessions: Dict[str, Dict[str, Any]] = {}
+    """
+    All methods are async: storage reads run on the backend's thread pool,
+    so they never block the event loop. Writes go through a
+    WriteBehindBuffer and reach storage in batches - except feedback,
+    which is replaced in a storage transaction together with its rating
+    increments.
+
+    Active sessions live in `active_sessions` until they end. With a shared
+    (SQLite) store, ending is a compare-and-set on that store, so when two
+    workers end the same session only one applies the charges and rollup
+    increments. Quiz scores, feedback and heartbeats change the stored
+    session through the store's atomic `modify`, so updates landing on
+    different workers at once are all kept. Everything else read from storage - completed sessions and unknown IDs - goes
+    through a bounded LRU cache with a TTL, so lookups for junk IDs are
+    answered from memory for `negative_ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        writes: WriteBehindBuffer,
+        store: Optional[SessionStore] = None,
+        cache_size: int = 10000,
+        cache_ttl: float = 300.0,
+        negative_ttl: float = 30.0
+    ):
+        # Active sessions in front of storage (shared across workers when SQLite-backed)
+        self.active_sessions: SessionStore = store if store is not None else MemorySessionStore()
+        self.storage = storage
+        self.writes = writes
+        self.cache = TTLCache(
+            "video_sessions",
+            ttl=cache_ttl,
+            maxsize=cache_size,
+            should_cache=lambda session: session is None or session["status"] != "active",
+            negative_ttl=negative_ttl
+        )
 
-    def create_session(
+    async def create_session(
         self,
         video_id: str,
         intent_id: str,
@@ -21,8 +91,9 @@ class VideoSessionManager:
         rate_per_minute: float,
         student_address: str = "0x_student_address"
     ) -> Dict[str, Any]:
-        """Create a new video watching session and save to Firestore"""
+        """Create a new video watching session and save to storage"""
         session_id = f"video_session_{uuid.uuid4().hex[:12]}"
+        start_time = time.time()
 
         session = {
             "session_id": session_id,
@@ -30,8 +101,9 @@ class VideoSessionManager:
             "intent_id": intent_id,
             "locked_amount": locked_amount,
             "rate_per_minute": rate_per_minute,
-            "start_time": time.time(),
+            "start_time": start_time,
             "end_time": None,
+            "last_heartbeat": start_time,
             "elapsed_seconds": 0,
             "amount_charged": 0.0,
             "amount_refunded": 0.0,
@@ -44,22 +116,23 @@ class VideoSessionManager:
             "free_preview_completed": False
         }
 
-        # Save to both cache and Firestore
+        # Save to the cache now, storage on the next flush
         self.active_sessions[session_id] = session
-        fs.save_session(session)
+        self.cache.invalidate(session_id)
+        self.writes.set(SESSIONS_COLLECTION, session_id, session)
+        # Committed in the same batch as the session
+        self.writes.increment(ROLLUPS_COLLECTION, video_id, session_start_delta(session))
 
         return session
 
-    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+    async def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Get session by ID with current elapsed time"""
-        # Try cache first
+        # Try active sessions first
         session = self.active_sessions.get(session_id)
 
-        # If not in cache, get from Firestore
+        # If not active, read through the cache from storage
         if not session:
-            session = fs.get_session(session_id)
-            if session:
-                self.active_sessions[session_id] = session
+            session = await self.cache.get_or_load(session_id, lambda: self._load(session_id))
 
         if session and session["status"] == "active":
             # Update elapsed time
@@ -68,11 +141,53 @@ class VideoSessionManager:
 
         return session
 
-    def end_session(self, session_id: str) -> Optional[Dict[str, Any]]:
-        """End a video watching session and calculate final costs"""
-        session = self.get_session(session_id)
-        if not session:
-            return None
+    async def _load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        # Buffered writes not yet flushed are newer than what storage returns
+        session = await self.writes.read(
+            SESSIONS_COLLECTION, session_id, lambda: self.storage.get_session_async(session_id)
+        )
+        if session and session["status"] == "active" and not self.active_sessions.restore(session_id, session):
+            # The store is ahead of storage: another worker holds the live copy,
+            # or ended the session and its write hasn't been flushed yet
+            session = (
+                self.active_sessions.get(session_id)
+                or self.active_sessions.get_ended(session_id)
+                or session
+            )
+        return session
+
+    def _change(self, session: Dict[str, Any], change: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+        """
+        Apply `change` to a session where it is kept and return the changed
+        copy: atomically in the store while it is active, so changes made by
+        other workers at the same time aren't overwritten, else to the cached
+        copy of the ended session
+        """
+        session_id = session["session_id"]
+        if session["status"] == "active":
+            changed = self.active_sessions.modify(session_id, change)
+            if changed is not None:
+                return changed
+            # Ended since it was read - change its final copy instead
+            session = self.active_sessions.get_ended(session_id) or session
+        change(session)
+        self.cache.put(session_id, session)
+        return session
+
+    async def heartbeat(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Record that the viewer is still watching (cache only - not written to storage)"""
+        session = await self.get_session(session_id)
+        if session and session["status"] == "active":
+            now = time.time()
+            session["last_heartbeat"] = now
+            self.active_sessions.modify(session_id, lambda stored: stored.update(last_heartbeat=now))
+        return session
+
+    async def end_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """End a video watching session and calculate final costs (ending it again returns the stored result)"""
+        session = await self.get_session(session_id)
+        if not session or session["status"] == "completed":
+            return session
 
         session["end_time"] = time.time()
         session["elapsed_seconds"] = int(session["end_time"] - session["start_time"])
@@ -89,48 +204,61 @@ class VideoSessionManager:
         session["amount_refunded"] = round(session["locked_amount"] - total_charged, 2)
         session["status"] = "completed"
 
-        # Update Firestore
-        fs.update_session(session_id, {
+        # Only the worker that flips the shared store's status applies the end;
+        # everyone else returns the winner's result
+        if not self.active_sessions.complete(session_id, session):
+            return self.active_sessions.get_ended(session_id) or await self.get_session(session_id)
+
+        # Update storage
+        self.writes.update(SESSIONS_COLLECTION, session_id, {
             "end_time": session["end_time"],
             "elapsed_seconds": session["elapsed_seconds"],
             "amount_charged": session["amount_charged"],
             "amount_refunded": session["amount_refunded"],
             "status": "completed"
         })
+        # Committed in the same batch as the session update
+        self.writes.increment(ROLLUPS_COLLECTION, session["video_id"], session_end_delta(session))
+        self._increment_buckets(session["video_id"], session_bucket_increments(session))
 
-        # Remove from active cache
-        if session_id in self.active_sessions:
-            del self.active_sessions[session_id]
+        # Now ended in the store; serve it from the read cache
+        self.cache.put(session_id, session)
 
         return session
 
-    def add_quiz_score(self, session_id: str, quiz_data: Dict[str, Any]) -> bool:
+    async def add_quiz_score(self, session_id: str, quiz_data: Dict[str, Any]) -> bool:
         """Add quiz score to session"""
-        session = self.get_session(session_id)
+        session = await self.get_session(session_id)
         if not session:
             return False
 
-        quiz_entry = {
-            "quiz_number": len(session.get("quiz_scores", [])) + 1,
-            "score": quiz_data.get("score", 0),
-            "total_questions": quiz_data.get("total_questions", 0),
-            "timestamp": time.time(),
-            "video_time": quiz_data.get("video_time", 0)
-        }
+        timestamp = time.time()
 
-        session["quiz_scores"].append(quiz_entry)
+        def append_quiz(stored: Dict[str, Any]) -> None:
+            quiz_scores = stored.setdefault("quiz_scores", [])
+            quiz_scores.append({
+                "quiz_number": len(quiz_scores) + 1,
+                "score": quiz_data.get("score", 0),
+                "total_questions": quiz_data.get("total_questions", 0),
+                "timestamp": timestamp,
+                "video_time": quiz_data.get("video_time", 0)
+            })
 
-        # Save to Firestore
-        fs.save_quiz_score({
-            "session_id": session_id,
-            **quiz_entry
-        })
+        session = self._change(session, append_quiz)
+        quiz_entry = session["quiz_scores"][-1]
+
+        # Save to storage
+        stored = [_stored_quiz_score(quiz_entry)]
+        self.writes.array_union(SESSIONS_COLLECTION, session_id, "quiz_scores", stored)
+        if session.get("feedback"):
+            # Feedback documents carry a copy of the session's quiz scores
+            self.writes.array_union(FEEDBACK_COLLECTION, session_id, "quiz_scores", stored)
 
         return True
 
-    def add_feedback(self, session_id: str, feedback_data: Dict[str, Any]) -> bool:
+    async def add_feedback(self, session_id: str, feedback_data: Dict[str, Any]) -> bool:
         """Add feedback to session"""
-        session = self.get_session(session_id)
+        session = await self.get_session(session_id)
         if not session:
             return False
 
@@ -140,14 +268,57 @@ class VideoSessionManager:
             "submitted_at": datetime.utcnow().isoformat()
         }
 
-        session["feedback"] = feedback
+        def set_feedback(stored: Dict[str, Any]) -> None:
+            stored["feedback"] = feedback
+
+        changed = self._change(session, set_feedback)
+        video_id = session["video_id"]
 
-        # Save to Firestore
-        fs.save_feedback({
+        def rollup_writes(previous: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            # `previous` is the stored feedback document, read in the same transaction
+            return [
+                _increment_write(ROLLUPS_COLLECTION, video_id, feedback_delta(feedback, previous)),
+                *(
+                    _increment_write(
+                        ROLLUP_BUCKETS_COLLECTION,
+                        bucket_doc_id(video_id, granularity, key),
+                        amounts,
+                        {"video_id": video_id, "granularity": granularity, "bucket": key}
+                    )
+                    for granularity, key, amounts in feedback_bucket_increments(feedback, previous)
+                )
+            ]
+
+        # Written straight to storage, not through the buffer: the rating deltas
+        # depend on the feedback being replaced, which only storage knows
+        # when workers submit at once
+        await self.storage.replace_feedback_async({
             "session_id": session_id,
             "student_id": session.get("student_id", "Unknown"),
-            "video_id": session.get("video_id"),
-            **feedback
-        })
+            "video_id": video_id,
+            **feedback,
+            # Denormalised so review queries never need the session document
+            "has_review": bool(feedback["review"].strip()),
+            "watch_time_seconds": session.get("elapsed_seconds", 0),
+            "amount_charged": session.get("amount_charged", 0),
+            "quiz_scores": [_stored_quiz_score(entry) for entry in changed.get("quiz_scores", [])]
+        }, rollup_writes)
+        self.writes.update(SESSIONS_COLLECTION, session_id, {"feedback": feedback})
 
         return True
+
+    def _increment_buckets(self, video_id: str, increments: List[BucketIncrement]) -> None:
+        """Queue hourly/daily bucket increments (committed with the write that caused them)"""
+        for granularity, key, amounts in increments:
+            self.writes.increment(
+                ROLLUP_BUCKETS_COLLECTION,
+                bucket_doc_id(video_id, granularity, key),
+                amounts,
+                fields={"video_id": video_id, "granularity": granularity, "bucket": key}
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active_sessions": len(self.active_sessions),
+            "cache": self.cache.stats()
+        }
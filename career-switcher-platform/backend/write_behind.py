@@ -0,0 +1,342 @@
+"""
+Write-behind buffer for Firestore - requests record their writes locally and
+a background task flushes them as batched commits
+"""
+import asyncio
+import copy
+import logging
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SET = "set"
+UPDATE = "update"
+MERGE = "merge"  # set(merge=True) - creates the document if missing
+
+DocKey = Tuple[str, str]  # (collection, document id)
+CommitFn = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+WriteItems = List[Tuple[DocKey, Dict[str, Any]]]
+
+# Firestore commits at most 500 writes in one atomic batch
+MAX_BATCH_WRITES = 500
+# Reads retried when a commit overlapped them, before settling for pending writes only
+MAX_READ_ATTEMPTS = 3
+
+
+def _merge(older: Dict[str, Any], newer: Dict[str, Any]) -> Dict[str, Any]:
+    """Combine two pending writes to one document into a single equivalent write"""
+    if newer["op"] == SET:
+        return newer
+    if older["op"] == SET:
+        op = SET
+    elif MERGE in (older["op"], newer["op"]):
+        op = MERGE
+    else:
+        op = UPDATE
+    merged = {
+        "op": op,
+        "data": {**older["data"], **newer["data"]},
+        "array_union": {field: list(items) for field, items in older["array_union"].items()},
+        "increment": dict(older["increment"]),
+        "attempts": max(older["attempts"], newer["attempts"]),
+        # The older write has been failing longer - keep its deadline
+        "retry_deadline": older["retry_deadline"] if older["retry_deadline"] is not None else newer["retry_deadline"]
+    }
+    for field, items in newer["array_union"].items():
+        merged["array_union"].setdefault(field, []).extend(items)
+    for field in newer["data"]:
+        merged["increment"].pop(field, None)  # overwritten
+    for field, amount in newer["increment"].items():
+        if field in merged["data"]:
+            merged["data"][field] = (merged["data"][field] or 0) + amount
+        else:
+            merged["increment"][field] = merged["increment"].get(field, 0) + amount
+    if merged["op"] == SET:
+        # A pending set already carries the full document - fold the unions and increments into it
+        for field, items in merged.pop("array_union").items():
+            merged["data"][field] = list(merged["data"].get(field) or []) + items
+        for field, amount in merged.pop("increment").items():
+            merged["data"][field] = (merged["data"].get(field) or 0) + amount
+        merged["array_union"] = {}
+        merged["increment"] = {}
+    return merged
+
+
+def apply_write(doc: Optional[Dict[str, Any]], write: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    The document after `write`, with Firestore semantics: ArrayUnion skips
+    items already present, and an update to a missing document gives None
+    (Firestore would reject it)
+    """
+    if write["op"] == SET:
+        return copy.deepcopy(write["data"])
+    if doc is None:
+        if write["op"] != MERGE:
+            return None
+        doc = {}
+    doc = {**doc, **copy.deepcopy(write["data"])}
+    for field, items in write.get("array_union", {}).items():
+        existing = list(doc.get(field) or [])
+        doc[field] = existing + [item for item in items if item not in existing]
+    for field, amount in write.get("increment", {}).items():
+        doc[field] = (doc.get(field) or 0) + amount
+    return doc
+
+
+class WriteBehindBuffer:
+    """
+    Coalesces writes per document: a set followed by updates becomes one set,
+    repeated updates become one update, and array appends and numeric
+    increments are accumulated.
+    Everything pending is committed every `flush_interval_ms`, or as soon as
+    `max_ops` writes have been buffered, in atomic batches of at most
+    `max_batch` writes.
+
+    A batch that fails is put back (merged under anything newer) and
+    flushing backs off exponentially (equal jitter, capped at `max_delay`)
+    until a commit succeeds; a write is only dropped once it has kept
+    failing for `retry_window` seconds. Batches that already committed are
+    never resent, so increments are applied once. When `is_rejected(error)` says storage refused the writes
+    themselves (e.g. an update to a missing document), the batch is split
+    until the offending write is found, and only that write is dropped.
+
+    `stop()` keeps flushing whatever is still pending for up to
+    `drain_timeout` seconds. Every drop is logged at error level. Reads go through `read()`
+    so buffered writes are visible before they reach storage.
+    """
+
+    def __init__(
+        self,
+        commit: CommitFn,
+        flush_interval_ms: int = 200,
+        max_ops: int = 200,
+        retry_window: float = 3600.0,
+        base_delay: float = 0.5,
+        max_delay: float = 60.0,
+        drain_timeout: float = 30.0,
+        max_batch: int = MAX_BATCH_WRITES,
+        is_rejected: Optional[Callable[[Exception], bool]] = None
+    ):
+        self.commit = commit
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_ops = max_ops
+        self.retry_window = retry_window
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.drain_timeout = drain_timeout
+        self.max_batch = max_batch
+        self.is_rejected = is_rejected
+
+        self._pending: "OrderedDict[DocKey, Dict[str, Any]]" = OrderedDict()
+        self._ops_since_flush = 0
+        self._flush_now = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        # Backoff after failed commits (time.monotonic)
+        self._failures = 0
+        self._retry_at = 0.0
+        # Seqlock for read(): odd while a flush is committing
+        self._epoch = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+        self.ops = 0
+        self.coalesced = 0
+        self.commits = 0
+        self.docs_written = 0
+        self.failed_commits = 0
+        self.rejected = 0
+        self.dropped = 0
+
+    # ---------- producer side ----------
+
+    def _add(self, collection: str, doc_id: str, write: Dict[str, Any]) -> None:
+        key = (collection, doc_id)
+        write.setdefault("data", {})
+        write.setdefault("array_union", {})
+        write.setdefault("increment", {})
+        write.setdefault("attempts", 0)
+        write.setdefault("retry_deadline", None)
+        older = self._pending.pop(key, None)
+        if older:
+            self.coalesced += 1
+        self._pending[key] = _merge(older, write) if older else write
+        self.ops += 1
+        self._ops_since_flush += 1
+        if self._ops_since_flush >= self.max_ops:
+            self._flush_now.set()
+
+    def set(self, collection: str, doc_id: str, data: Dict[str, Any]) -> None:
+        self._add(collection, doc_id, {"op": SET, "data": copy.deepcopy(data)})
+
+    def update(self, collection: str, doc_id: str, data: Dict[str, Any]) -> None:
+        self._add(collection, doc_id, {"op": UPDATE, "data": copy.deepcopy(data)})
+
+    def array_union(self, collection: str, doc_id: str, field: str, items: List[Any]) -> None:
+        self._add(collection, doc_id, {"op": UPDATE, "array_union": {field: copy.deepcopy(items)}})
+
+    def increment(
+        self,
+        collection: str,
+        doc_id: str,
+        amounts: Dict[str, float],
+        fields: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Add to numeric fields (and set `fields`), creating the document if it does not exist"""
+        self._add(collection, doc_id, {"op": MERGE, "data": copy.deepcopy(fields or {}), "increment": dict(amounts)})
+
+    def overlay(self, collection: str, doc_id: str, doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """`doc` as read from storage, with this document's pending (not yet committing) writes applied"""
+        write = self._pending.get((collection, doc_id))
+        return apply_write(doc, write) if write is not None else doc
+
+    async def read(
+        self,
+        collection: str,
+        doc_id: str,
+        load: Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        `load()` the document from storage and overlay its pending writes.
+        A commit that overlaps `load()` may or may not show up in what it
+        returns, so the load waits for any running flush and is retried if
+        another one starts meanwhile - applying those writes on top as well
+        would count increments twice. After MAX_READ_ATTEMPTS it settles for
+        the last load, which can briefly miss writes but never doubles them.
+        """
+        doc = None
+        for _ in range(MAX_READ_ATTEMPTS):
+            await self._idle.wait()
+            epoch = self._epoch
+            doc = await load()
+            if self._epoch == epoch:
+                break
+        return self.overlay(collection, doc_id, doc)
+
+    # ---------- flushing ----------
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="firestore-write-behind")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Drain everything, retrying failed batches (with backoff) until the drain timeout
+        deadline = time.monotonic() + self.drain_timeout
+        while self._pending:
+            await self.flush()
+            if not self._pending:
+                break
+            now = time.monotonic()
+            if now >= deadline:
+                self.dropped += len(self._pending)
+                logger.error(f"Dropping {len(self._pending)} buffered writes still failing at shutdown")
+                self._pending = OrderedDict()
+                break
+            await asyncio.sleep(min(max(self._retry_at - now, self.flush_interval), deadline - now))
+
+    async def _run(self) -> None:
+        while True:
+            backoff = self._retry_at - time.monotonic()
+            if backoff > 0:
+                # Storage is failing: a full buffer doesn't cut the backoff short
+                await asyncio.sleep(backoff)
+            else:
+                try:
+                    await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            self._flush_now.clear()
+            self._ops_since_flush = 0
+            if not self._pending:
+                return
+            # Writes leave `remaining` as soon as they are committed or dropped
+            remaining, self._pending = self._pending, OrderedDict()
+            items = list(remaining.items())
+            self._epoch += 1
+            self._idle.clear()
+            try:
+                for start in range(0, len(items), self.max_batch):
+                    await self._commit_isolating(items[start:start + self.max_batch], remaining)
+            except Exception as e:
+                self.failed_commits += 1
+                self._failures += 1
+                cap = min(self.max_delay, self.base_delay * 2 ** (self._failures - 1))
+                delay = random.uniform(cap / 2, cap)
+                self._retry_at = time.monotonic() + delay
+                logger.warning(f"Storage commit failed ({e}) - retrying {len(remaining)} uncommitted writes in {delay:.1f}s")
+                self._requeue(remaining)
+            else:
+                self._failures = 0
+                self._retry_at = 0.0
+            finally:
+                self._epoch += 1
+                self._idle.set()
+
+    async def _commit_isolating(self, items: WriteItems, remaining: "OrderedDict[DocKey, Dict[str, Any]]") -> None:
+        """Commit `items` as one batch; if storage rejects it, bisect down to the offending writes and drop them"""
+        try:
+            await self.commit([
+                {"collection": collection, "doc_id": doc_id, **write}
+                for (collection, doc_id), write in items
+            ])
+        except Exception as e:
+            if self.is_rejected is None or not self.is_rejected(e):
+                raise
+            if len(items) == 1:
+                key = items[0][0]
+                del remaining[key]
+                self.rejected += 1
+                self.dropped += 1
+                logger.error(f"Dropping buffered write to {key[0]}/{key[1]} - rejected by storage ({e})")
+                return
+            middle = len(items) // 2
+            await self._commit_isolating(items[:middle], remaining)
+            await self._commit_isolating(items[middle:], remaining)
+            return
+        for key, _ in items:
+            del remaining[key]
+        self.commits += 1
+        self.docs_written += len(items)
+
+    def _requeue(self, batch: "OrderedDict[DocKey, Dict[str, Any]]") -> None:
+        requeued: "OrderedDict[DocKey, Dict[str, Any]]" = OrderedDict()
+        now = time.monotonic()
+        for key, write in batch.items():
+            write["attempts"] += 1
+            if write["retry_deadline"] is None:
+                write["retry_deadline"] = now + self.retry_window
+            elif now >= write["retry_deadline"]:
+                self.dropped += 1
+                logger.error(
+                    f"Dropping buffered write to {key[0]}/{key[1]} after {write['attempts']} attempts "
+                    f"over {self.retry_window:.0f}s: {write}"
+                )
+                continue
+            requeued[key] = write
+        # Anything written while the commit was in flight is newer - merge it on top
+        for key, write in self._pending.items():
+            requeued[key] = _merge(requeued[key], write) if key in requeued else write
+        self._pending = requeued
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_docs": len(self._pending),
+            "ops": self.ops,
+            "commits": self.commits,
+            "docs_written": self.docs_written,
+            "coalesced": self.coalesced,
+            "failed_commits": self.failed_commits,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "retry_in_seconds": round(max(0.0, self._retry_at - time.monotonic()), 1)
+        }
@@ -247,8 +247,8 @@ export default function VideoPage() {
                 <div className="pt-4 border-t">
                   <div className="flex justify-between text-sm text-gray-600">
                     <span>Teacher Payment:</span>
-                    <span className={summary.summary.teacher_paid ? 'text-green-600' : 'text-red-600'}>
-                      {summary.summary.teacher_paid ? '✓ Sent' : '✗ Failed'}
+                    <span className={summary.summary.teacher_paid ? 'text-green-600' : summary.summary.settlement_status === 'failed' ? 'text-red-600' : 'text-amber-600'}>
+                      {summary.summary.teacher_paid ? '✓ Sent' : summary.summary.settlement_status === 'failed' ? '✗ Failed' : '⏳ Processing'}
                     </span>
                   </div>
                 </div>
@@ -85,7 +85,23 @@ export default function VideoPlayer({ videoSrc, sessionData, videoDescription, o
       })
     }, 1000)
 
-    return () => clearInterval(interval)
+    // Keep-alive so the backend doesn't reap the session; it also tells us if the escrow ran out
+    const heartbeat = setInterval(async () => {
+      try {
+        const response = await fetch(`http://localhost:8000/api/video-session/heartbeat/${sessionData.session.session_id}`, {
+          method: 'POST'
+        })
+        const data = await response.json()
+        if (data.status && data.status !== 'active') handleEndSession()
+      } catch (err) {
+        console.error('Heartbeat failed:', err)
+      }
+    }, 15000)
+
+    return () => {
+      clearInterval(interval)
+      clearInterval(heartbeat)
+    }
   }, [isPaid, sessionData])
 
   const generateQuiz = (quizNumber: number) => {
@@ -73,17 +73,34 @@ export default function Home() {
   
   const MAX_LOCK = 30.00
 
-  // Timer effect for active session
+  // Timer effect for active session - server-pushed over SSE, local tick if the stream drops
   useEffect(() => {
     let interval: NodeJS.Timeout | null = null
+    let source: EventSource | null = null
 
     if (step === 'active' && session) {
-      interval = setInterval(() => {
-        setElapsedSeconds(prev => prev + 1)
-      }, 1000)
+      source = new EventSource(`${API_URL}/api/session/stream/${session.session_id}`)
+      source.addEventListener('status', (e) => {
+        setElapsedSeconds(JSON.parse((e as MessageEvent).data).elapsed_seconds)
+      })
+      source.addEventListener('end', () => source?.close())
+      source.onerror = () => {
+        source?.close()
+        if (!interval) {
+          let ticks = 0
+          interval = setInterval(() => {
+            setElapsedSeconds(prev => prev + 1)
+            // The open stream was our heartbeat - send one explicitly every 15s instead
+            if (++ticks % 15 === 0) {
+              axios.post(`${API_URL}/api/session/heartbeat/${session.session_id}`).catch(() => {})
+            }
+          }, 1000)
+        }
+      }
     }
 
     return () => {
+      source?.close()
       if (interval) clearInterval(interval)
     }
   }, [step, session])